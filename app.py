@@ -1,22 +1,49 @@
 import os
+
+# Under eventlet the stdlib must be patched before anything creates sockets, locks or
+# threads. gunicorn.conf.py sets SOCKETIO_ASYNC_MODE to match its worker class.
+if os.environ.get('SOCKETIO_ASYNC_MODE') == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
 import sqlite3
 import logging
-from datetime import datetime, timedelta
-from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, timedelta, timezone
+from functools import wraps, lru_cache
+from contextlib import contextmanager
+from werkzeug.security import check_password_hash, safe_join
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, send_file
+from urllib.parse import quote
+from markupsafe import Markup, escape
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, send_file, g, has_app_context, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_caching import Cache
-from flask_mail import Mail, Message
 from threading import Lock
+import queue
+import time
+import itertools
 import json
+import re
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 from dotenv import load_dotenv
-import gemini_ai
-from pytubefix import YouTube
+from flask.json.provider import DefaultJSONProvider
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib json module
+    orjson = None
+try:
+    from flask_compress import Compress
+except ImportError:  # optional, responses are sent uncompressed
+    Compress = None
 import shutil
+import subprocess
+import mimetypes
+from utils import ai_cache
 
 # Load environment variables
 load_dotenv()
@@ -27,7 +54,66 @@ app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET') or 'dev-secret-key-c
 # Use paths relative to the app file location
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'sir_rafique', 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = None  # No file size limit for videos
+# No file size limit for videos by default; set MAX_CONTENT_LENGTH (bytes) or enforce
+# client_max_body_size in the front-end server
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ['MAX_CONTENT_LENGTH']) if os.environ.get('MAX_CONTENT_LENGTH') else None
+
+# Let the front-end web server send file bytes with sendfile(2) instead of Python:
+#   SENDFILE_MODE=x-sendfile  Apache/lighttpd X-Sendfile for every file response
+#   SENDFILE_MODE=x-accel     nginx X-Accel-Redirect for files under UPLOAD_FOLDER,
+#                             mapped to an internal location at X_ACCEL_PREFIX
+SENDFILE_MODE = os.environ.get('SENDFILE_MODE', '').lower()
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected/')
+app.use_x_sendfile = SENDFILE_MODE == 'x-sendfile'
+
+def json_default(o):
+    """JSON fallback: sqlite3.Row serializes as a dict, anything else as in Flask"""
+    if isinstance(o, sqlite3.Row):
+        return dict(o)
+    return DefaultJSONProvider.default(o)
+
+class RowJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that accepts sqlite3.Row, so rows can go to jsonify/tojson as fetched"""
+    default = staticmethod(json_default)
+
+# Serialize jsonify() responses and Socket.IO packets with orjson when it is installed
+if orjson is not None:
+    # Datetimes go through Flask's default() so they keep the HTTP date format
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    class OrjsonProvider(RowJSONProvider):
+        """Flask JSON provider backed by orjson"""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            """jsonify() body built from orjson's bytes directly, without a str round trip"""
+            obj = self._prepare_response_obj(args, kwargs)
+            option = ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE
+            if (self.compact is None and self._app.debug) or self.compact is False:
+                option |= orjson.OPT_INDENT_2
+            return self._app.response_class(
+                orjson.dumps(obj, default=self.default, option=option), mimetype=self.mimetype
+            )
+
+    class OrjsonSocketIOJSON:
+        """json-module shim for python-socketio, which expects str from dumps()"""
+        @staticmethod
+        def dumps(obj, *args, **kwargs):
+            return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS).decode()
+
+        @staticmethod
+        def loads(s, *args, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+    socketio_json = OrjsonSocketIOJSON
+else:
+    app.json = RowJSONProvider(app)
+    socketio_json = json
 
 # Database configuration
 DATABASE = os.path.join(BASE_DIR, 'sir_rafique', 'learnnest.db')
@@ -38,21 +124,82 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'  # type: ignore
 login_manager.login_message = 'Please log in to access this page.'
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
-
-# Initialize caching
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
-
-# Initialize mail
-mail = Mail(app)
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# gunicorn.conf.py sets SOCKETIO_ASYNC_MODE to match its worker class. With REDIS_URL
+# set, emits go through Redis pub/sub so every worker delivers them to its clients.
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=os.environ.get('SOCKETIO_ASYNC_MODE', 'threading'),
+                    json=socketio_json, message_queue=REDIS_URL)
+
+# Initialize caching: shared Redis cache across workers when REDIS_URL is set,
+# otherwise an in-process cache
+if REDIS_URL:
+    cache = Cache(app, config={'CACHE_TYPE': 'RedisCache', 'CACHE_REDIS_URL': REDIS_URL, 'CACHE_DEFAULT_TIMEOUT': 60})
+else:
+    cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 60})
+
+# The user row looked up on every request is memoized. Only Redis can be invalidated
+# across workers (e.g. when an admin blocks a user), so an in-process cache keeps it
+# just long enough to cover the burst of requests behind one page load
+USER_CACHE_TIMEOUT = 60 if REDIS_URL else int(os.environ.get('USER_CACHE_LOCAL_TIMEOUT', 3))
+
+# Compress HTML and JSON responses when flask-compress is installed. File downloads
+# (send_file) are passed through untouched; streamed responses are left alone too.
+if Compress is not None:
+    app.config.setdefault('COMPRESS_MIMETYPES', ['text/html', 'text/css', 'text/javascript',
+                                                 'application/javascript', 'application/json'])
+    app.config.setdefault('COMPRESS_STREAMS', False)
+    Compress(app)
+
+# Flask-Mail is only imported and set up the first time mail is sent
+@lru_cache(maxsize=1)
+def get_mail():
+    """Return the app's Flask-Mail instance, creating it on first use"""
+    from flask_mail import Mail
+    return Mail(app)
+
+def _accel_redirect(response, file_path):
+    """Hand the body of a 200 file response to nginx when SENDFILE_MODE is x-accel"""
+    if SENDFILE_MODE == 'x-accel' and response.status_code == 200:
+        rel_path = os.path.relpath(os.path.realpath(file_path), os.path.realpath(app.config['UPLOAD_FOLDER']))
+        if not rel_path.startswith(os.pardir):
+            # nginx serves the bytes from its internal location; drop our open file
+            response.close()
+            response.response = []
+            response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX.rstrip('/') + '/' + quote(rel_path.replace(os.sep, '/'))
+    return response
+
+def send_upload(directory, filename, **kwargs):
+    """send_from_directory that hands uploads to nginx when SENDFILE_MODE is x-accel"""
+    response = send_from_directory(directory, filename, **kwargs)
+    return _accel_redirect(response, safe_join(directory, filename))
+
+def send_upload_file(file_path, **kwargs):
+    """send_file for a path the caller already resolved, with ETag/Last-Modified/Range support"""
+    kwargs.setdefault('conditional', True)
+    kwargs.setdefault('etag', True)
+    kwargs.setdefault('last_modified', os.path.getmtime(file_path))
+    response = send_file(file_path, **kwargs)
+    return _accel_redirect(response, file_path)
 
 # Register custom Jinja filters and globals
+_BR = Markup('<br>\n')
+
 @app.template_filter('nl2br')
 def nl2br_filter(s):
-    """Convert newlines to HTML line breaks"""
+    """Convert newlines to HTML line breaks, escaping the text around them"""
     if s is None:
         return ''
-    return str(s).replace('\n', '<br>\n')
+    if not isinstance(s, str):
+        s = str(s)
+    if '\n' not in s:
+        return escape(s)
+    return _BR.join(escape(line) for line in s.split('\n'))
+
+@app.template_filter('fromjson')
+def fromjson_filter(s):
+    """Parse a JSON column (e.g. a json_group_array aggregate) for use in a template"""
+    return app.json.loads(s) if s else []
 
 # Add custom Jinja2 global functions
 @app.template_global()
@@ -68,41 +215,91 @@ def min_func(*args):
 # CSRF protection helpers
 import secrets
 import hashlib
+import hmac
+import bcrypt
 
 def generate_csrf_token():
-    """Generate a CSRF token for forms"""
-    token = secrets.token_urlsafe(32)
-    session['csrf_token'] = token
+    """Return the session's CSRF token, generating it only once per session"""
+    token = session.get('csrf_token')
+    if token is None:
+        token = session['csrf_token'] = secrets.token_urlsafe(32)
     return token
 
 def validate_csrf_token(token):
-    """Validate CSRF token"""
-    if not token or token != session.get('csrf_token'):
+    """Validate CSRF token (constant-time comparison)"""
+    expected = session.get('csrf_token')
+    if not token or not expected:
         return False
-    return True
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+# Password hashing: bcrypt at a tunable cost. Older werkzeug hashes still verify
+# and are upgraded to bcrypt on the user's next successful login.
+BCRYPT_COST = int(os.environ.get('BCRYPT_COST', 10))
+
+def hash_password(password):
+    """Hash a password with bcrypt (bcrypt only uses the first 72 bytes)"""
+    return bcrypt.hashpw(password.encode()[:72], bcrypt.gensalt(rounds=BCRYPT_COST)).decode()
+
+def verify_password(password, password_hash):
+    """Check a password against a bcrypt or legacy werkzeug hash"""
+    if password_hash.startswith('$2'):
+        return bcrypt.checkpw(password.encode()[:72], password_hash.encode())
+    return check_password_hash(password_hash, password)
+
+# Enrollment keys are shared course passwords rather than user credentials, so a
+# keyed HMAC is enough; keys hashed with werkzeug before this still verify.
+ENROLLMENT_KEY_PEPPER = (os.environ.get('ENROLLMENT_KEY_PEPPER') or app.config['SECRET_KEY']).encode()
+
+def hash_enrollment_key(key):
+    """Hash a course enrollment key with HMAC-SHA256"""
+    return 'hmac-sha256$' + hmac.new(ENROLLMENT_KEY_PEPPER, key.encode(), hashlib.sha256).hexdigest()
+
+def verify_enrollment_key(key, key_hash):
+    """Check an enrollment key against an HMAC or legacy werkzeug hash"""
+    if key_hash.startswith('hmac-sha256$'):
+        return hmac.compare_digest(hash_enrollment_key(key).encode(), key_hash.encode())
+    return check_password_hash(key_hash, key)
 
 @app.context_processor
 def inject_csrf_token():
     """Make CSRF token available in all templates"""
-    if 'csrf_token' not in session:
-        session['csrf_token'] = secrets.token_urlsafe(32)
-    return dict(csrf_token=session['csrf_token'])
+    # Resolve the token once per request; later renders read it from g
+    token = g.get('csrf_token')
+    if token is None:
+        token = g.csrf_token = generate_csrf_token()
+    return dict(csrf_token=token)
 
-# Thread lock for database operations
+# Thread lock for multi-statement database writes (reads rely on WAL)
 db_lock = Lock()
 
-# Create uploads directory
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'assignments'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'resources'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'payments'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'instructor_screenshots'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'transcripts'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'chat_files'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'chat_images'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'direct_messages'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'forum_media'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profile_pictures'), exist_ok=True)
+# Create uploads directory and every subdirectory the routes write into once per
+# deploy, so request handlers never need os.makedirs; the sentinel file records the
+# list it was created for and skips the checks on later worker starts
+UPLOAD_SUBDIRS = ('assignments', 'submissions', 'resources', 'payments', 'instructor_screenshots',
+                  'transcripts', 'student_notes', 'ai_notes', 'ai_visuals',
+                  'chat_files', 'chat_images',
+                  'direct_messages', 'forum_media', 'profile_pictures', 'ai_cache')
+
+def init_upload_dirs():
+    """Create the upload subdirectories unless the sentinel says this list already exists"""
+    sentinel = os.path.join(app.config['UPLOAD_FOLDER'], '.initialized')
+    expected = '\n'.join(UPLOAD_SUBDIRS)
+    try:
+        with open(sentinel) as f:
+            if f.read() == expected:
+                return
+    except FileNotFoundError:
+        pass
+    for subdir in UPLOAD_SUBDIRS:
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], subdir), exist_ok=True)
+    with open(sentinel, 'w') as f:
+        f.write(expected)
+
+init_upload_dirs()
+
+# Generated transcripts, notes and assistant answers are cached on disk by their inputs
+AI_CACHE_MAX_BYTES = int(os.environ.get('AI_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+ai_cache.configure(os.path.join(app.config['UPLOAD_FOLDER'], 'ai_cache'), AI_CACHE_MAX_BYTES)
 
 # File size limits (in bytes)
 MAX_CHAT_FILE_SIZE = 100 * 1024 * 1024  # 100 MB per file
@@ -116,26 +313,211 @@ ALLOWED_FILE_TYPES = {
     'csv', 'json', 'xml', 'html', 'css', 'js', 'py', 'java', 'cpp', 'c', 'h'
 }
 
+_IMAGE_EXT_RE = re.compile(r'\.(png|jpe?g|gif|webp)$', re.IGNORECASE)
+
+def is_allowed_image(filename):
+    """Check the extension of the name the file will actually be saved under"""
+    return _IMAGE_EXT_RE.search(secure_filename(filename)) is not None
+
+def random_upload_name(prefix, filename):
+    """Build a unique stored name from a prefix and the upload's extension, dropping the original name"""
+    ext = os.path.splitext(secure_filename(filename))[1].lower()
+    return f"{prefix}_{secrets.token_urlsafe(10)}{ext}"
+
+MAX_IMAGE_UPLOAD_SIZE = 5 * 1024 * 1024  # 5 MB for screenshots and avatars
+UPLOAD_COPY_BUFFER = 64 * 1024
+
+def save_upload_stream(file_storage, path, max_size=None):
+    """
+    Copy an uploaded file to disk in UPLOAD_COPY_BUFFER chunks.
+    Returns False (and removes the partial file) once more than max_size bytes arrive.
+    """
+    written = 0
+    with open(path, 'wb') as out:
+        while True:
+            chunk = file_storage.stream.read(UPLOAD_COPY_BUFFER)
+            if not chunk:
+                break
+            written += len(chunk)
+            if max_size is not None and written > max_size:
+                break
+            out.write(chunk)
+    if max_size is not None and written > max_size:
+        os.remove(path)
+        return False
+    return True
+
+# Database connection pool
+# Connections are opened once, configured once, and handed back to the pool by
+# close(), so requests reuse the page and statement caches instead of paying
+# connect() + PRAGMAs every time. WAL lets pooled readers run concurrently.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 16))
+DB_CACHED_STATEMENTS = int(os.environ.get('DB_CACHED_STATEMENTS', 256))
+WAL_AUTOCHECKPOINT = int(os.environ.get('WAL_AUTOCHECKPOINT', 1000))  # pages
+WAL_CHECKPOINT_INTERVAL = int(os.environ.get('WAL_CHECKPOINT_INTERVAL', 60))  # seconds
+DB_OPTIMIZE_INTERVAL = int(os.environ.get('DB_OPTIMIZE_INTERVAL', 24 * 60 * 60))  # seconds
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_db_checkouts = itertools.count()
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection that returns to the pool on close() instead of closing"""
+
+    def close(self):
+        if getattr(self, '_in_pool', False):
+            return  # Already released (close() called twice)
+        if self.in_transaction:
+            self.rollback()
+        self._in_pool = True
+        try:
+            _db_pool.put_nowait(self)
+        except queue.Full:
+            super().close()
+
+def _open_db_connection(factory=PooledConnection):
+    # Pooled connections live across requests, so a larger statement cache keeps
+    # every route's SQL compiled instead of re-parsing after evictions
+    conn = sqlite3.connect(DATABASE, timeout=30, check_same_thread=False, factory=factory,
+                           cached_statements=DB_CACHED_STATEMENTS)
+    # Per-connection settings, applied once when the connection is opened rather
+    # than per checkout. foreign_keys stays off: the schema has no ON DELETE
+    # actions and several delete routes rely on removing parents before children.
+    conn.executescript(f'''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT};
+        PRAGMA cache_size=-65536;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+    ''')
+    conn.row_factory = sqlite3.Row
+    return conn
+
 # Database connection helper
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE, timeout=30)
-    conn.execute('PRAGMA journal_mode=WAL;')
-    conn.execute('PRAGMA synchronous=NORMAL;')
-    conn.execute('PRAGMA cache_size=10000;')
-    conn.execute('PRAGMA temp_store=MEMORY;')
-    conn.row_factory = sqlite3.Row
+    try:
+        conn = _db_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_db_connection()
+    conn._in_pool = False
+    conn._checkout_id = next(_db_checkouts)
+    if has_app_context():
+        # Remember this checkout so teardown can return it if a route forgets to close it
+        g.setdefault('_db_checkouts', []).append((conn, conn._checkout_id))
     return conn
 
+@contextmanager
+def db_connection():
+    """Check out a pooled connection for the duration of a with-block"""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def warm_db_pool():
+    """Pre-open the pool so early requests skip the connect and PRAGMA setup"""
+    for _ in range(DB_POOL_SIZE - _db_pool.qsize()):
+        conn = _open_db_connection()
+        conn._in_pool = False
+        conn.close()
+
+@app.teardown_appcontext
+def release_db_connections(exc):
+    """Return connections a request left open to the pool, rolling back open transactions"""
+    for conn, checkout_id in g.pop('_db_checkouts', ()):
+        # Skip connections already closed and handed to someone else since
+        if conn._checkout_id == checkout_id:
+            conn.close()
+
+# Single long-lived writer connection for small, hot writes (notifications).
+# SQLite allows one writer at a time, so funnelling these through one connection
+# behind a lock avoids SQLITE_BUSY retries between pooled connections.
+_writer_conn = None
+_writer_lock = Lock()
+
+@contextmanager
+def writer_connection():
+    """Yield the process-wide writer connection; commits on success, rolls back on error"""
+    global _writer_conn
+    with _writer_lock:
+        if _writer_conn is None:
+            _writer_conn = _open_db_connection(factory=sqlite3.Connection)
+        try:
+            yield _writer_conn
+            _writer_conn.commit()
+        except Exception:
+            _writer_conn.rollback()
+            raise
+
+def _wal_checkpoint_loop():
+    """Periodically truncate the WAL so it does not grow between automatic checkpoints"""
+    while True:
+        socketio.sleep(WAL_CHECKPOINT_INTERVAL)
+        try:
+            with writer_connection() as conn:
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        except Exception as e:
+            logging.error("WAL checkpoint failed: %s", e)
+
+def _db_optimize_loop():
+    """Periodically let SQLite re-ANALYZE tables whose statistics have drifted"""
+    while True:
+        socketio.sleep(DB_OPTIMIZE_INTERVAL)
+        try:
+            with writer_connection() as conn:
+                conn.execute('PRAGMA optimize')
+        except Exception as e:
+            logging.error("PRAGMA optimize failed: %s", e)
+
+# last_login stamps are queued by login() and written in one batch, so a login
+# does not pay for its own commit
+LAST_LOGIN_FLUSH_INTERVAL = int(os.environ.get('LAST_LOGIN_FLUSH_INTERVAL', 10))  # seconds
+_last_login_queue = queue.Queue()
+
+def flush_last_logins():
+    """Write all queued last_login stamps in a single transaction"""
+    latest = {}
+    while True:
+        try:
+            user_id, logged_in_at = _last_login_queue.get_nowait()
+        except queue.Empty:
+            break
+        latest[user_id] = max(logged_in_at, latest.get(user_id, logged_in_at))
+    if latest:
+        with writer_connection() as conn:
+            conn.executemany('UPDATE users SET last_login = ? WHERE id = ?',
+                             [(logged_in_at, user_id) for user_id, logged_in_at in latest.items()])
+
+def _last_login_flush_loop():
+    """Flush queued last_login stamps every LAST_LOGIN_FLUSH_INTERVAL seconds"""
+    while True:
+        socketio.sleep(LAST_LOGIN_FLUSH_INTERVAL)
+        try:
+            flush_last_logins()
+        except Exception as e:
+            logging.error("Error flushing last_login updates: %s", e)
+
+_background_tasks_started = False
+
+def start_background_tasks():
+    """Start the WAL checkpoint, optimize, last_login, notification and progress tasks once per process"""
+    global _background_tasks_started
+    if not _background_tasks_started:
+        _background_tasks_started = True
+        socketio.start_background_task(_wal_checkpoint_loop)
+        socketio.start_background_task(_db_optimize_loop)
+        socketio.start_background_task(_last_login_flush_loop)
+        socketio.start_background_task(_notification_flush_loop)
+        socketio.start_background_task(_progress_recompute_loop)
+
 def send_notification(user_id, title, message, notification_type='info', related_id=None):
     """Helper function to send notifications to students"""
     try:
-        conn = get_db_connection()
-        conn.execute('''
-            INSERT INTO notifications (user_id, title, message, type, related_id, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, title, message, notification_type, related_id, datetime.now()))
-        conn.commit()
-        conn.close()
+        with writer_connection() as conn:
+            conn.execute('''
+                INSERT INTO notifications (user_id, title, message, type, related_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, title, message, notification_type, related_id))
         
         # Emit real-time notification via SocketIO
         socketio.emit('notification', {
@@ -146,9 +528,88 @@ def send_notification(user_id, title, message, notification_type='info', related
         
         return True
     except Exception as e:
-        logging.error(f"Error sending notification: {e}")
+        logging.error("Error sending notification: %s", e)
         return False
 
+NOTIFY_MANY_SQL = '''
+    INSERT INTO notifications (user_id, title, message, type, related_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+def notify_many(conn, rows):
+    """
+    Insert notification rows of (user_id, title, message, type, related_id) in the
+    caller's transaction with one prepared statement; no SocketIO emit, the caller commits.
+    """
+    conn.executemany(NOTIFY_MANY_SQL, rows)
+
+def send_notifications_bulk(user_ids, title, message, notification_type='info', related_id=None, conn=None):
+    """
+    Send the same notification to many users with one executemany and one SocketIO emit.
+    If conn is given the rows join the caller's transaction and the caller commits;
+    otherwise the rows go through the shared writer connection.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return True
+    
+    rows = [(user_id, title, message, notification_type, related_id) for user_id in user_ids]
+    try:
+        if conn is not None:
+            notify_many(conn, rows)
+        else:
+            with writer_connection() as db:
+                notify_many(db, rows)
+        
+        # One emit addressed to every recipient's room
+        socketio.emit('notification', {
+            'title': title,
+            'message': message,
+            'type': notification_type
+        }, to=[f'user_{user_id}' for user_id in user_ids])
+        
+        return True
+    except Exception as e:
+        logging.error("Error sending notifications: %s", e)
+        return False
+
+# Notifications queued by request handlers are written and emitted by a background
+# task in batches, so a request only pays for a put() once its own commit is done
+NOTIFICATION_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_QUEUE_SIZE', 10000))
+NOTIFICATION_BATCH_SIZE = 256
+_notification_queue = queue.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+
+def queue_notification(user_id, title, message, notification_type='info', related_id=None):
+    """Hand a notification to the background writer; sends it inline if the queue is full or not running"""
+    if _background_tasks_started:
+        try:
+            _notification_queue.put_nowait((user_id, title, message, notification_type, related_id))
+            return True
+        except queue.Full:
+            logging.warning("Notification queue full, sending inline")
+    return send_notification(user_id, title, message, notification_type, related_id)
+
+def _notification_flush_loop():
+    """Write queued notifications in batches of up to NOTIFICATION_BATCH_SIZE and emit them"""
+    while True:
+        rows = [_notification_queue.get()]
+        while len(rows) < NOTIFICATION_BATCH_SIZE:
+            try:
+                rows.append(_notification_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with writer_connection() as conn:
+                notify_many(conn, rows)
+            for user_id, title, message, notification_type, _ in rows:
+                socketio.emit('notification', {
+                    'title': title,
+                    'message': message,
+                    'type': notification_type
+                }, to=f'user_{user_id}')
+        except Exception as e:
+            logging.error("Error writing %d queued notifications: %s", len(rows), e)
+
 def update_student_progress(conn, student_id, course_id):
     """
     Calculate and update student progress for a course based on quiz completions
@@ -157,62 +618,86 @@ def update_student_progress(conn, student_id, course_id):
           but the manual override value takes precedence for display
     """
     try:
-        # Check if instructor has set manual progress override
+        # Count submitted quizzes against published quizzes and store the result in one statement;
+        # RETURNING hands back the manual override so no separate SELECT is needed
         enrollment = conn.execute('''
-            SELECT manual_progress_override
-            FROM enrollments
-            WHERE student_id = ? AND course_id = ?
-        ''', (student_id, course_id)).fetchone()
-        
-        has_manual_override = enrollment and enrollment['manual_progress_override'] is not None
-        
-        # Get total number of quizzes for this course
-        total_quizzes = conn.execute('''
-            SELECT COUNT(*) as count
-            FROM assignments
-            WHERE course_id = ? AND assignment_type = 'quiz' AND is_active = 1
-        ''', (course_id,)).fetchone()['count']
-        
-        if total_quizzes == 0:
-            # No quizzes, set progress to 0
-            auto_progress = 0
-        else:
-            # Get number of submitted quizzes by student
-            submitted_quizzes = conn.execute('''
-                SELECT COUNT(DISTINCT a.id) as count
-                FROM assignments a
-                INNER JOIN assignment_submissions sub ON a.id = sub.assignment_id
-                WHERE a.course_id = ? 
-                AND a.assignment_type = 'quiz'
-                AND a.is_active = 1
-                AND sub.student_id = ?
-            ''', (course_id, student_id)).fetchone()['count']
-            
-            # Calculate progress percentage
-            auto_progress = (submitted_quizzes / total_quizzes) * 100
-        
-        # Always update progress_percentage with automatic calculation
-        # This keeps it in sync even when manual override is active
-        conn.execute('''
             UPDATE enrollments
-            SET progress_percentage = ?
-            WHERE student_id = ? AND course_id = ?
-        ''', (auto_progress, student_id, course_id))
+            SET progress_percentage = COALESCE((
+                SELECT 100.0 * COUNT(DISTINCT sub.assignment_id) / NULLIF((
+                    SELECT COUNT(*)
+                    FROM assignments
+                    WHERE course_id = ?1 AND assignment_type = 'quiz' AND status = 'published'
+                ), 0)
+                FROM assignment_submissions sub
+                INNER JOIN assignments a ON a.id = sub.assignment_id
+                WHERE a.course_id = ?1
+                AND a.assignment_type = 'quiz'
+                AND a.status = 'published'
+                AND sub.student_id = ?2
+            ), 0)
+            WHERE student_id = ?2 AND course_id = ?1
+            RETURNING progress_percentage, manual_progress_override
+        ''', (course_id, student_id)).fetchone()
         
         conn.commit()
         
+        if not enrollment:
+            return 0
+        
         # Return manual override if set, otherwise return automatic progress
-        if has_manual_override:
+        if enrollment['manual_progress_override'] is not None:
             return enrollment['manual_progress_override']
-        else:
-            return auto_progress
+        return enrollment['progress_percentage']
         
     except Exception as e:
         print(f"Error updating student progress: {e}")
         return 0
 
+# Progress recomputes requested by instructor actions run on a background task so the
+# request only pays for its own UPDATE; the quiz aggregation happens after the response
+_progress_recompute_queue = queue.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+
+def _recompute_progress_and_notify(student_id, course_id, course_title, last_progress):
+    """Recompute automatic progress and tell the student about the reset to automatic tracking"""
+    with writer_connection() as conn:
+        progress = update_student_progress(conn, student_id, course_id)
+    if progress != last_progress:
+        logging.info("Progress for student %s in course %s recomputed: %s -> %s",
+                     student_id, course_id, last_progress, progress)
+    queue_notification(
+        student_id,
+        'Course Progress Updated',
+        f'Your progress in "{course_title}" has been reset to automatic tracking ({progress:.0f}%)',
+        'info',
+        course_id
+    )
+
+def queue_progress_recompute(student_id, course_id, course_title, last_progress):
+    """Hand a progress recompute to the background task; runs it inline if the queue is full or not running"""
+    if _background_tasks_started:
+        try:
+            _progress_recompute_queue.put_nowait((student_id, course_id, course_title, last_progress))
+            return
+        except queue.Full:
+            logging.warning("Progress recompute queue full, running inline")
+    _recompute_progress_and_notify(student_id, course_id, course_title, last_progress)
+
+def _progress_recompute_loop():
+    """Run queued progress recomputes one at a time on the writer connection"""
+    while True:
+        job = _progress_recompute_queue.get()
+        try:
+            _recompute_progress_and_notify(*job)
+        except Exception as e:
+            logging.error("Error recomputing progress for student %s in course %s: %s", job[0], job[1], e)
+
 # User class for Flask-Login
 class User(UserMixin):
+    # Fixed attribute slots; UserMixin has no __slots__ so ad-hoc attributes still work
+    __slots__ = ('id', 'username', 'email', 'role', 'full_name', 'created_at',
+                 '_is_active', 'instructor_approval_status', 'approved_by',
+                 'approved_at', 'profile_picture')
+
     def __init__(self, id, username, email, role, full_name, created_at, active_status=True, 
                  instructor_approval_status='approved', approved_by=None, approved_at=None, profile_picture=None):
         self.id = id
@@ -253,18 +738,32 @@ class User(UserMixin):
         """Check if instructor was rejected"""
         return self.is_instructor() and self.instructor_approval_status == 'rejected'
 
+@cache.memoize(timeout=USER_CACHE_TIMEOUT)
+def _load_user_row(user_id):
+    """Fetch an active user as a plain dict (cacheable; the password hash is left out)"""
+    conn = get_db_connection()
+    user = conn.execute(
+        'SELECT * FROM users WHERE id = ? AND is_active = 1', (user_id,)
+    ).fetchone()
+    conn.close()
+    
+    if not user:
+        return None
+    user = dict(user)
+    user.pop('password_hash', None)
+    return user
+
+def invalidate_user_cache(user_id):
+    """Drop the cached user row after the users table changes for this user"""
+    cache.delete_memoized(_load_user_row, int(user_id))
+
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        with db_lock:
-            conn = get_db_connection()
-            user = conn.execute(
-                'SELECT * FROM users WHERE id = ? AND is_active = 1', (user_id,)
-            ).fetchone()
-            conn.close()
+        user = _load_user_row(int(user_id))
         
         if user:
-            profile_pic = user['profile_picture'] if 'profile_picture' in user.keys() else None
+            profile_pic = user.get('profile_picture')
             return User(user['id'], user['username'], user['email'], user['role'], 
                        user['full_name'], user['created_at'], user['is_active'],
                        user['instructor_approval_status'] if user['instructor_approval_status'] else 'approved',
@@ -280,7 +779,8 @@ def load_user(user_id):
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not current_user.is_admin():
+        user = current_user._get_current_object()
+        if not user.is_authenticated or user.role != 'admin':
             flash('Access denied. Admin privileges required.', 'error')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
@@ -289,21 +789,22 @@ def admin_required(f):
 def instructor_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated:
+        user = current_user._get_current_object()
+        if not user.is_authenticated:
             flash('Access denied. Please log in.', 'error')
             return redirect(url_for('login'))
         
         # Admins always have access to instructor features
-        if current_user.is_admin():
+        if user.role == 'admin':
             return f(*args, **kwargs)
         
         # Check if user is instructor
-        if not current_user.is_instructor():
+        if user.role != 'instructor':
             flash('Access denied. Instructor privileges required.', 'error')
             return redirect(url_for('dashboard'))
         
         # Check if instructor is approved
-        if not current_user.is_instructor_approved():
+        if user.instructor_approval_status != 'approved':
             flash('Your instructor account is pending approval. Please wait for admin approval.', 'warning')
             return redirect(url_for('dashboard'))
         
@@ -311,495 +812,547 @@ def instructor_required(f):
     return decorated_function
 
 # Database initialization
+# Schema migrations: (version, [(table, column, definition), ...])
+# Columns added after the original CREATE TABLE statements. init_db() applies every
+# entry newer than PRAGMA user_version; bump SCHEMA_VERSION whenever the DDL in
+# init_db() changes so existing databases pick it up.
+SCHEMA_MIGRATIONS = [
+    (1, [
+        ('users', 'instructor_approval_status', "TEXT DEFAULT 'approved'"),
+        ('users', 'approved_by', 'INTEGER'),
+        ('users', 'approved_at', 'TIMESTAMP'),
+        ('users', 'instructor_screenshot', 'TEXT'),
+        ('courses', 'enrollment_key_hash', 'TEXT'),
+        ('enrollments', 'manual_progress_override', 'REAL DEFAULT NULL'),
+        ('assignments', 'assignment_type', "TEXT DEFAULT 'quiz'"),
+        ('assignments', 'status', "TEXT DEFAULT 'draft'"),
+        ('assignments', 'published_at', 'TIMESTAMP'),
+        ('assignments', 'ai_context', 'TEXT'),
+        ('course_video_playlists', 'transcript_file_path', 'TEXT'),
+        ('forum_topics', 'media_type', 'TEXT'),
+        ('forum_topics', 'media_path', 'TEXT'),
+        ('forum_topics', 'media_filename', 'TEXT'),
+        ('forum_replies', 'media_type', 'TEXT'),
+        ('forum_replies', 'media_path', 'TEXT'),
+        ('forum_replies', 'media_filename', 'TEXT'),
+    ]),
+    # Index-only revisions: no columns, but SCHEMA_INDEXES_SQL changed
+    (2, []),
+    (3, []),
+    (4, []),
+    (5, []),
+    (6, []),
+    # Data-only revision: see SCHEMA_DATA_MIGRATIONS
+    (7, []),
+    # background_jobs table
+    (8, []),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def _upload_relpath_sql(column, subdir):
+    """SQL rewriting a stored file path (any OS, absolute or relative) to subdir/basename"""
+    normalized = f"replace({column}, '\\', '/')"
+    basename = f"substr({normalized}, length(rtrim({normalized}, replace({normalized}, '/', ''))) + 1)"
+    return f"'{subdir}/' || {basename}"
+
+# Data rewrites run once, in the migration transaction, when upgrading past a version
+SCHEMA_DATA_MIGRATIONS = [
+    # Generated and uploaded PDFs are stored relative to UPLOAD_FOLDER, so a download
+    # is one stat of a known path instead of probing several candidate locations
+    (7, f'''
+        UPDATE student_notes SET file_path = {_upload_relpath_sql('file_path', 'student_notes')}
+        WHERE file_path IS NOT NULL AND file_path != '';
+        UPDATE course_video_playlists SET transcript_file_path = {_upload_relpath_sql('transcript_file_path', 'transcripts')}
+        WHERE transcript_file_path IS NOT NULL AND transcript_file_path != '';
+        UPDATE course_video_playlists SET notes_file_path = {_upload_relpath_sql('notes_file_path', 'resources')}
+        WHERE notes_file_path IS NOT NULL AND notes_file_path != '';
+    '''),
+]
+
+# Tables created by init_db, run as one script
+SCHEMA_TABLES_SQL = '''
+    -- Users table
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'student',
+        full_name TEXT NOT NULL,
+        bio TEXT,
+        profile_image TEXT,
+        instructor_approval_status TEXT DEFAULT 'approved',
+        approved_by INTEGER,
+        approved_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1,
+        FOREIGN KEY (approved_by) REFERENCES users (id)
+    );
+
+    -- Courses table
+    CREATE TABLE IF NOT EXISTS courses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_code TEXT UNIQUE NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        syllabus TEXT,
+        instructor_id INTEGER NOT NULL,
+        category TEXT,
+        max_students INTEGER DEFAULT 50,
+        start_date DATE,
+        end_date DATE,
+        enrollment_key_hash TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1,
+        FOREIGN KEY (instructor_id) REFERENCES users (id)
+    );
+
+    -- Enrollments table
+    CREATE TABLE IF NOT EXISTS enrollments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        course_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        payment_screenshot TEXT,
+        enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        approved_at TIMESTAMP,
+        progress_percentage REAL DEFAULT 0,
+        manual_progress_override REAL DEFAULT NULL,
+        FOREIGN KEY (student_id) REFERENCES users (id),
+        FOREIGN KEY (course_id) REFERENCES courses (id),
+        UNIQUE(student_id, course_id)
+    );
+
+    -- Assignments table
+    CREATE TABLE IF NOT EXISTS assignments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        instructions TEXT,
+        due_date DATETIME,
+        max_points INTEGER DEFAULT 100,
+        allow_late_submission BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (course_id) REFERENCES courses (id)
+    );
+
+    -- Assignment assets table for file uploads
+    CREATE TABLE IF NOT EXISTS assignment_assets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        assignment_id INTEGER NOT NULL,
+        file_name TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        file_type TEXT,
+        file_size INTEGER,
+        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (assignment_id) REFERENCES assignments (id)
+    );
+
+    -- Assignment submissions table
+    CREATE TABLE IF NOT EXISTS assignment_submissions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        assignment_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        submission_text TEXT,
+        file_path TEXT,
+        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        grade REAL,
+        ai_feedback TEXT,
+        instructor_feedback TEXT,
+        graded_at TIMESTAMP,
+        FOREIGN KEY (assignment_id) REFERENCES assignments (id),
+        FOREIGN KEY (student_id) REFERENCES users (id),
+        UNIQUE(assignment_id, student_id)
+    );
+
+    -- Quiz questions table
+    CREATE TABLE IF NOT EXISTS quiz_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        assignment_id INTEGER NOT NULL,
+        question_text TEXT NOT NULL,
+        question_type TEXT NOT NULL DEFAULT 'mcq',
+        points INTEGER DEFAULT 1,
+        correct_answer TEXT,
+        explanation TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (assignment_id) REFERENCES assignments (id)
+    );
+
+    -- Question options table
+    CREATE TABLE IF NOT EXISTS question_options (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question_id INTEGER NOT NULL,
+        option_letter TEXT NOT NULL,
+        option_text TEXT NOT NULL,
+        is_correct BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (question_id) REFERENCES quiz_questions (id)
+    );
+
+    -- Student MCQ answers table
+    CREATE TABLE IF NOT EXISTS student_mcq_answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        submission_id INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        selected_option TEXT,
+        is_correct BOOLEAN,
+        points_earned REAL DEFAULT 0,
+        answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (submission_id) REFERENCES assignment_submissions (id),
+        FOREIGN KEY (question_id) REFERENCES quiz_questions (id),
+        UNIQUE(submission_id, question_id)
+    );
+
+    -- Forums table
+    CREATE TABLE IF NOT EXISTS forums (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1,
+        FOREIGN KEY (course_id) REFERENCES courses (id)
+    );
+
+    -- Forum topics table
+    CREATE TABLE IF NOT EXISTS forum_topics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        forum_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_pinned BOOLEAN DEFAULT 0,
+        view_count INTEGER DEFAULT 0,
+        FOREIGN KEY (forum_id) REFERENCES forums (id),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+
+    -- Forum replies table
+    CREATE TABLE IF NOT EXISTS forum_replies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_ai_generated BOOLEAN DEFAULT 0,
+        FOREIGN KEY (topic_id) REFERENCES forum_topics (id),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+
+    -- Chat messages table
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER,
+        sender_id INTEGER NOT NULL,
+        recipient_id INTEGER,
+        message TEXT NOT NULL,
+        message_type TEXT DEFAULT 'text',
+        file_path TEXT,
+        file_name TEXT,
+        file_size INTEGER DEFAULT 0,
+        is_image BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_read BOOLEAN DEFAULT 0,
+        FOREIGN KEY (course_id) REFERENCES courses (id),
+        FOREIGN KEY (sender_id) REFERENCES users (id),
+        FOREIGN KEY (recipient_id) REFERENCES users (id)
+    );
+
+    -- Direct messages table
+    CREATE TABLE IF NOT EXISTS direct_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_id INTEGER NOT NULL,
+        recipient_id INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        message_type TEXT DEFAULT 'text',
+        file_path TEXT,
+        file_name TEXT,
+        is_image BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_read BOOLEAN DEFAULT 0,
+        FOREIGN KEY (sender_id) REFERENCES users (id),
+        FOREIGN KEY (recipient_id) REFERENCES users (id)
+    );
+
+    -- File uploads table
+    CREATE TABLE IF NOT EXISTS file_uploads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uploader_id INTEGER NOT NULL,
+        file_name TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        file_size INTEGER,
+        file_type TEXT,
+        message_id INTEGER,
+        direct_message_id INTEGER,
+        forum_reply_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (uploader_id) REFERENCES users (id),
+        FOREIGN KEY (message_id) REFERENCES chat_messages (id),
+        FOREIGN KEY (direct_message_id) REFERENCES direct_messages (id),
+        FOREIGN KEY (forum_reply_id) REFERENCES forum_replies (id)
+    );
+
+    -- Notifications table
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        message TEXT NOT NULL,
+        type TEXT DEFAULT 'info',
+        related_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_read BOOLEAN DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+
+    -- Course resources table
+    CREATE TABLE IF NOT EXISTS course_resources (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        file_path TEXT,
+        file_type TEXT,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        uploaded_by INTEGER NOT NULL,
+        FOREIGN KEY (course_id) REFERENCES courses (id),
+        FOREIGN KEY (uploaded_by) REFERENCES users (id)
+    );
+
+    -- Course meeting links table
+    CREATE TABLE IF NOT EXISTS course_meeting_links (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        meeting_link TEXT NOT NULL,
+        description TEXT,
+        scheduled_time TIMESTAMP,
+        created_by INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1,
+        FOREIGN KEY (course_id) REFERENCES courses (id),
+        FOREIGN KEY (created_by) REFERENCES users (id)
+    );
+
+    -- Course video playlists table
+    CREATE TABLE IF NOT EXISTS course_video_playlists (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        video_url TEXT NOT NULL,
+        description TEXT,
+        thumbnail_url TEXT,
+        duration TEXT,
+        notes_file_path TEXT,
+        order_index INTEGER DEFAULT 0,
+        created_by INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1,
+        FOREIGN KEY (course_id) REFERENCES courses (id),
+        FOREIGN KEY (created_by) REFERENCES users (id)
+    );
+
+    -- Student video playlists table
+    CREATE TABLE IF NOT EXISTS student_video_playlists (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        video_url TEXT NOT NULL,
+        description TEXT,
+        thumbnail_url TEXT,
+        duration TEXT,
+        order_index INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1,
+        FOREIGN KEY (student_id) REFERENCES users (id)
+    );
+
+    -- AI Notes table
+    CREATE TABLE IF NOT EXISTS ai_notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        content TEXT NOT NULL,
+        pdf_path TEXT,
+        created_by INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_instructor_note BOOLEAN DEFAULT 0,
+        sent_to_students BOOLEAN DEFAULT 0,
+        FOREIGN KEY (course_id) REFERENCES courses (id),
+        FOREIGN KEY (created_by) REFERENCES users (id)
+    );
+
+    -- Student AI study notes table
+    CREATE TABLE IF NOT EXISTS student_notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        course_id INTEGER NOT NULL,
+        original_input TEXT NOT NULL,
+        enhanced_notes TEXT NOT NULL,
+        file_path TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (student_id) REFERENCES users (id),
+        FOREIGN KEY (course_id) REFERENCES courses (id)
+    );
+
+    -- Status and results of background jobs (AI generation, YouTube downloads), shared
+    -- by every worker process; data holds the job's fields as a JSON object
+    CREATE TABLE IF NOT EXISTS background_jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        data TEXT NOT NULL DEFAULT '{}',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    ) WITHOUT ROWID;
+'''
+
+# Indexes and views created by init_db after the column migrations
+SCHEMA_INDEXES_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+    CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+    CREATE INDEX IF NOT EXISTS idx_users_approval_status ON users(instructor_approval_status);
+    CREATE INDEX IF NOT EXISTS idx_enrollments_student ON enrollments(student_id);
+    DROP INDEX IF EXISTS idx_enrollments_course;
+    CREATE INDEX IF NOT EXISTS idx_enr_course_status ON enrollments(course_id, status);
+    CREATE INDEX IF NOT EXISTS idx_assignments_course ON assignments(course_id);
+    CREATE INDEX IF NOT EXISTS idx_submissions_assignment ON assignment_submissions(assignment_id);
+    CREATE INDEX IF NOT EXISTS idx_quiz_questions_assignment ON quiz_questions(assignment_id);
+    CREATE INDEX IF NOT EXISTS idx_question_options_question ON question_options(question_id);
+    CREATE INDEX IF NOT EXISTS idx_student_answers_submission ON student_mcq_answers(submission_id);
+    CREATE INDEX IF NOT EXISTS idx_student_answers_question ON student_mcq_answers(question_id);
+    CREATE INDEX IF NOT EXISTS idx_chat_course ON chat_messages(course_id);
+    CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id);
+    DROP INDEX IF EXISTS idx_meeting_links_course;
+    DROP INDEX IF EXISTS idx_video_playlists_course;
+
+    -- Composite indexes for hot-path lookups (progress recalculation, notification
+    -- badges, chat history, instructor course pages). enrollments(student_id, course_id) and
+    -- assignment_submissions(assignment_id, student_id) are already covered by
+    -- their UNIQUE constraints.
+    CREATE INDEX IF NOT EXISTS idx_assign_course_type_status ON assignments(course_id, assignment_type, status);
+    CREATE INDEX IF NOT EXISTS idx_notif_user_read ON notifications(user_id, is_read, created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_chat_course_created ON chat_messages(course_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_dm_pair_created ON direct_messages(sender_id, recipient_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_courses_instructor_active ON courses(instructor_id, is_active);
+    CREATE INDEX IF NOT EXISTS idx_ai_notes_course ON ai_notes(course_id, created_by, is_instructor_note, created_at);
+    CREATE INDEX IF NOT EXISTS idx_cvp_course_active_order ON course_video_playlists(course_id, is_active, order_index);
+    CREATE INDEX IF NOT EXISTS idx_svp_student_active_order ON student_video_playlists(student_id, is_active, order_index);
+    CREATE INDEX IF NOT EXISTS idx_cml_course_active ON course_meeting_links(course_id, is_active, created_at DESC);
+
+    -- Partial index over just the pending queue; approved lookups already use
+    -- idx_enr_course_status
+    CREATE INDEX IF NOT EXISTS idx_enr_pending ON enrollments(course_id, enrolled_at) WHERE status = 'pending';
+
+    -- Students newest first, in the admin list's keyset order
+    CREATE INDEX IF NOT EXISTS idx_users_student_created ON users(created_at DESC, id DESC) WHERE role = 'student';
+
+    -- Pruning of old background jobs
+    CREATE INDEX IF NOT EXISTS idx_background_jobs_created ON background_jobs(created_at);
+
+    -- Courses students and instructors can see; every course listing reads from
+    -- this view instead of repeating the is_active filter
+    CREATE VIEW IF NOT EXISTS v_active_courses AS SELECT * FROM courses WHERE is_active = 1;
+'''
+
+def _sql_statements(script):
+    """Split an SQL script into single statements. init_db runs them one by one with
+    execute(), because executescript() would COMMIT its open transaction first."""
+    statement = ''
+    for piece in script.split(';'):
+        statement += piece + ';'
+        # A ';' inside a string literal, comment or trigger body does not end the statement
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+
 def init_db():
-    print("🔄 Initializing database...")
+    logging.info("Initializing database...")
+    conn = None
     with db_lock:
         try:
-            conn = get_db_connection()
-            
-            # Users table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL DEFAULT 'student',
-                    full_name TEXT NOT NULL,
-                    bio TEXT,
-                    profile_image TEXT,
-                    instructor_approval_status TEXT DEFAULT 'approved',
-                    approved_by INTEGER,
-                    approved_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (approved_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Add columns if they don't exist
-            try:
-                conn.execute('ALTER TABLE users ADD COLUMN instructor_approval_status TEXT DEFAULT "approved"')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE users ADD COLUMN approved_by INTEGER')
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                conn.execute('ALTER TABLE users ADD COLUMN approved_at TIMESTAMP')
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                conn.execute('ALTER TABLE courses ADD COLUMN enrollment_key_hash TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE users ADD COLUMN instructor_screenshot TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            # Courses table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS courses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_code TEXT UNIQUE NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    syllabus TEXT,
-                    instructor_id INTEGER NOT NULL,
-                    category TEXT,
-                    max_students INTEGER DEFAULT 50,
-                    start_date DATE,
-                    end_date DATE,
-                    enrollment_key_hash TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (instructor_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Enrollments table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS enrollments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    student_id INTEGER NOT NULL,
-                    course_id INTEGER NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'pending',
-                    payment_screenshot TEXT,
-                    enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    approved_at TIMESTAMP,
-                    progress_percentage REAL DEFAULT 0,
-                    manual_progress_override REAL DEFAULT NULL,
-                    FOREIGN KEY (student_id) REFERENCES users (id),
-                    FOREIGN KEY (course_id) REFERENCES courses (id),
-                    UNIQUE(student_id, course_id)
-                )
-            ''')
-            
-            # Add manual_progress_override column if it doesn't exist
-            try:
-                conn.execute('ALTER TABLE enrollments ADD COLUMN manual_progress_override REAL DEFAULT NULL')
-            except sqlite3.OperationalError:
-                pass
-            
-            # Assignments table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS assignments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    instructions TEXT,
-                    due_date DATETIME,
-                    max_points INTEGER DEFAULT 100,
-                    allow_late_submission BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (course_id) REFERENCES courses (id)
-                )
-            ''')
-            
-            # Add new columns to assignments table for advanced features
-            try:
-                conn.execute('ALTER TABLE assignments ADD COLUMN assignment_type TEXT DEFAULT "quiz"')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE assignments ADD COLUMN status TEXT DEFAULT "draft"')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE assignments ADD COLUMN published_at TIMESTAMP')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE assignments ADD COLUMN ai_context TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            # Assignment assets table for file uploads
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS assignment_assets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    assignment_id INTEGER NOT NULL,
-                    file_name TEXT NOT NULL,
-                    file_path TEXT NOT NULL,
-                    file_type TEXT,
-                    file_size INTEGER,
-                    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (assignment_id) REFERENCES assignments (id)
-                )
-            ''')
-            
-            # Assignment submissions table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS assignment_submissions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    assignment_id INTEGER NOT NULL,
-                    student_id INTEGER NOT NULL,
-                    submission_text TEXT,
-                    file_path TEXT,
-                    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    grade REAL,
-                    ai_feedback TEXT,
-                    instructor_feedback TEXT,
-                    graded_at TIMESTAMP,
-                    FOREIGN KEY (assignment_id) REFERENCES assignments (id),
-                    FOREIGN KEY (student_id) REFERENCES users (id),
-                    UNIQUE(assignment_id, student_id)
-                )
-            ''')
-            
-            # Quiz questions table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS quiz_questions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    assignment_id INTEGER NOT NULL,
-                    question_text TEXT NOT NULL,
-                    question_type TEXT NOT NULL DEFAULT 'mcq',
-                    points INTEGER DEFAULT 1,
-                    correct_answer TEXT,
-                    explanation TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (assignment_id) REFERENCES assignments (id)
-                )
-            ''')
-            
-            # Question options table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS question_options (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question_id INTEGER NOT NULL,
-                    option_letter TEXT NOT NULL,
-                    option_text TEXT NOT NULL,
-                    is_correct BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (question_id) REFERENCES quiz_questions (id)
-                )
-            ''')
-            
-            # Student MCQ answers table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS student_mcq_answers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    submission_id INTEGER NOT NULL,
-                    question_id INTEGER NOT NULL,
-                    selected_option TEXT,
-                    is_correct BOOLEAN,
-                    points_earned REAL DEFAULT 0,
-                    answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (submission_id) REFERENCES assignment_submissions (id),
-                    FOREIGN KEY (question_id) REFERENCES quiz_questions (id),
-                    UNIQUE(submission_id, question_id)
-                )
-            ''')
-            
-            # Forums table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS forums (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (course_id) REFERENCES courses (id)
-                )
-            ''')
-            
-            # Forum topics table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS forum_topics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    forum_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_pinned BOOLEAN DEFAULT 0,
-                    view_count INTEGER DEFAULT 0,
-                    FOREIGN KEY (forum_id) REFERENCES forums (id),
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Forum replies table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS forum_replies (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    topic_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_ai_generated BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (topic_id) REFERENCES forum_topics (id),
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Chat messages table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS chat_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER,
-                    sender_id INTEGER NOT NULL,
-                    recipient_id INTEGER,
-                    message TEXT NOT NULL,
-                    message_type TEXT DEFAULT 'text',
-                    file_path TEXT,
-                    file_name TEXT,
-                    file_size INTEGER DEFAULT 0,
-                    is_image BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_read BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (course_id) REFERENCES courses (id),
-                    FOREIGN KEY (sender_id) REFERENCES users (id),
-                    FOREIGN KEY (recipient_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Direct messages table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS direct_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sender_id INTEGER NOT NULL,
-                    recipient_id INTEGER NOT NULL,
-                    message TEXT NOT NULL,
-                    message_type TEXT DEFAULT 'text',
-                    file_path TEXT,
-                    file_name TEXT,
-                    is_image BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_read BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (sender_id) REFERENCES users (id),
-                    FOREIGN KEY (recipient_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # File uploads table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS file_uploads (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    uploader_id INTEGER NOT NULL,
-                    file_name TEXT NOT NULL,
-                    file_path TEXT NOT NULL,
-                    file_size INTEGER,
-                    file_type TEXT,
-                    message_id INTEGER,
-                    direct_message_id INTEGER,
-                    forum_reply_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (uploader_id) REFERENCES users (id),
-                    FOREIGN KEY (message_id) REFERENCES chat_messages (id),
-                    FOREIGN KEY (direct_message_id) REFERENCES direct_messages (id),
-                    FOREIGN KEY (forum_reply_id) REFERENCES forum_replies (id)
-                )
-            ''')
-            
-            # Notifications table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS notifications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    type TEXT DEFAULT 'info',
-                    related_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_read BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Course resources table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS course_resources (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    file_path TEXT,
-                    file_type TEXT,
-                    upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    uploaded_by INTEGER NOT NULL,
-                    FOREIGN KEY (course_id) REFERENCES courses (id),
-                    FOREIGN KEY (uploaded_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Course meeting links table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS course_meeting_links (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    meeting_link TEXT NOT NULL,
-                    description TEXT,
-                    scheduled_time TIMESTAMP,
-                    created_by INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (course_id) REFERENCES courses (id),
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Course video playlists table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS course_video_playlists (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    video_url TEXT NOT NULL,
-                    description TEXT,
-                    thumbnail_url TEXT,
-                    duration TEXT,
-                    notes_file_path TEXT,
-                    order_index INTEGER DEFAULT 0,
-                    created_by INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (course_id) REFERENCES courses (id),
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Add transcript column if needed
-            try:
-                conn.execute('ALTER TABLE course_video_playlists ADD COLUMN transcript_file_path TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            # Student video playlists table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS student_video_playlists (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    student_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    video_url TEXT NOT NULL,
-                    description TEXT,
-                    thumbnail_url TEXT,
-                    duration TEXT,
-                    order_index INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (student_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # AI Notes table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS ai_notes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    topic TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    pdf_path TEXT,
-                    created_by INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_instructor_note BOOLEAN DEFAULT 0,
-                    sent_to_students BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (course_id) REFERENCES courses (id),
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Add media columns to forum_topics if needed
-            try:
-                conn.execute('ALTER TABLE forum_topics ADD COLUMN media_type TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE forum_topics ADD COLUMN media_path TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE forum_topics ADD COLUMN media_filename TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            # Add media columns to forum_replies if needed
-            try:
-                conn.execute('ALTER TABLE forum_replies ADD COLUMN media_type TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE forum_replies ADD COLUMN media_path TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                conn.execute('ALTER TABLE forum_replies ADD COLUMN media_filename TEXT')
-            except sqlite3.OperationalError:
-                pass
-            
-            # Create indexes
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_users_approval_status ON users(instructor_approval_status)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_student ON enrollments(student_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_course ON enrollments(course_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_assignments_course ON assignments(course_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_submissions_assignment ON assignment_submissions(assignment_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_quiz_questions_assignment ON quiz_questions(assignment_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_question_options_question ON question_options(question_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_student_answers_submission ON student_mcq_answers(submission_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_student_answers_question ON student_mcq_answers(question_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_course ON chat_messages(course_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_meeting_links_course ON course_meeting_links(course_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_video_playlists_course ON course_video_playlists(course_id)')
+            # A dedicated connection in autocommit mode, so the explicit BEGIN/COMMIT
+            # below is the only transaction
+            conn = _open_db_connection(factory=sqlite3.Connection)
+            conn.isolation_level = None
+            
+            # Fast path: schema already at the current version, nothing to create or migrate
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                conn.close()
+                logging.info("Database schema up to date")
+                return True
+            
+            # Run all DDL, data migrations and the admin seed in one exclusive transaction
+            # so a partial migration never sticks, and so no other worker can run them at
+            # the same time. Every statement goes through execute(): executescript() would
+            # commit the transaction and drop the lock. Another worker may have finished
+            # the migration while we waited for the lock.
+            conn.execute('BEGIN EXCLUSIVE')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                conn.rollback()
+                conn.close()
+                logging.info("Database schema up to date")
+                return True
+            
+            for statement in _sql_statements(SCHEMA_TABLES_SQL):
+                conn.execute(statement)
+            
+            # Apply column migrations newer than the stored schema version; each table's
+            # columns are read once and only the missing ADD COLUMNs are run
+            table_columns = {}
+            alters = []
+            for target_version, columns in SCHEMA_MIGRATIONS:
+                if version >= target_version:
+                    continue
+                for table, column, definition in columns:
+                    if table not in table_columns:
+                        table_columns[table] = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+                    if column not in table_columns[table]:
+                        alters.append(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                        table_columns[table].add(column)
+            for alter in alters:
+                conn.execute(alter)
+            
+            for statement in _sql_statements(SCHEMA_INDEXES_SQL):
+                conn.execute(statement)
+            
+            for target_version, script in SCHEMA_DATA_MIGRATIONS:
+                if version < target_version:
+                    for statement in _sql_statements(script):
+                        conn.execute(statement)
             
             # Create default admin user
-            admin_exists = conn.execute('SELECT id FROM users WHERE role = "admin"').fetchone()
+            admin_exists = conn.execute("SELECT EXISTS(SELECT 1 FROM users WHERE role = 'admin')").fetchone()[0]
             if not admin_exists:
-                admin_password = generate_password_hash('admin123')
+                admin_password = hash_password('admin123')
                 conn.execute('''
                     INSERT INTO users (username, email, password_hash, role, full_name, bio)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', ('admin', 'admin@learnnest.com', admin_password, 'admin', 
                      'System Administrator', 'Default system administrator account'))
             
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
             conn.commit()
+            
+            # Refresh planner statistics so the indexes above are actually chosen, then
+            # let SQLite record anything else it would optimize
+            conn.execute('ANALYZE')
+            conn.execute('PRAGMA optimize')
             conn.close()
-            print("✅ Database initialized successfully!")
+            logging.info("Database initialized successfully")
             return True
         except Exception as e:
-            print(f"❌ Database initialization error: {e}")
-            import traceback
-            traceback.print_exc()
+            if conn is not None:
+                conn.rollback()
+                conn.close()
+            logging.exception("Database initialization error: %s", e)
             return False
 
 # Routes
@@ -825,22 +1378,26 @@ def login():
         password = request.form['password']
         remember = bool(request.form.get('remember'))
         
-        with db_lock:
-            conn = get_db_connection()
-            user = conn.execute(
-                'SELECT * FROM users WHERE email = ? AND is_active = 1', (email,)
-            ).fetchone()
-            conn.close()
+        conn = get_db_connection()
+        user = conn.execute('''
+            SELECT id, username, email, password_hash, role, full_name, created_at, is_active,
+                   instructor_approval_status, approved_by, approved_at
+            FROM users WHERE email = ? AND is_active = 1
+        ''', (email,)).fetchone()
+        conn.close()
         
-        if user and check_password_hash(user['password_hash'], password):
-            # Update last login
-            with db_lock:
-                conn = get_db_connection()
-                conn.execute(
-                    'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],)
-                )
-                conn.commit()
-                conn.close()
+        if user and verify_password(password, user['password_hash']):
+            # Upgrade legacy werkzeug hashes; hash outside the lock
+            if not user['password_hash'].startswith('$2'):
+                new_hash = hash_password(password)
+                with db_lock:
+                    conn = get_db_connection()
+                    conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
+                    conn.commit()
+                    conn.close()
+            
+            # Update last login (written in the next batch)
+            _last_login_queue.put((user['id'], datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')))
             
             user_obj = User(user['id'], user['username'], user['email'], user['role'], 
                           user['full_name'], user['created_at'], user['is_active'],
@@ -881,33 +1438,27 @@ def register():
         if role == 'instructor' and 'instructor_screenshot' in request.files:
             screenshot = request.files['instructor_screenshot']
             if screenshot and screenshot.filename:
-                # Create instructor_screenshots directory if it doesn't exist
                 screenshots_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'instructor_screenshots')
-                os.makedirs(screenshots_dir, exist_ok=True)
                 
                 # Validate file type
-                allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-                file_ext = screenshot.filename.rsplit('.', 1)[1].lower() if '.' in screenshot.filename else ''
-                
-                if file_ext not in allowed_extensions:
+                if not is_allowed_image(screenshot.filename):
                     flash('Invalid file type. Please upload PNG, JPG, JPEG, GIF, or WebP images only.', 'error')
                     return render_template('auth/register.html')
                 
-                # Validate file size (max 5MB)
-                screenshot.seek(0, 2)  # Seek to end
-                file_size = screenshot.tell()
-                screenshot.seek(0)  # Reset seek position
-                
-                if file_size > 5 * 1024 * 1024:
+                # Validate file size (max 5MB): reject from the request header when it
+                # already says too much, otherwise enforce the limit while streaming
+                if request.content_length and request.content_length > MAX_IMAGE_UPLOAD_SIZE + 64 * 1024:
                     flash('File size too large. Please upload images smaller than 5MB.', 'error')
                     return render_template('auth/register.html')
                 
                 # Generate secure filename and save
-                filename = secure_filename(f"{username}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{screenshot.filename}")
+                filename = random_upload_name(secure_filename(username) or 'user', screenshot.filename)
                 screenshot_path = os.path.join(screenshots_dir, filename)
                 
                 try:
-                    screenshot.save(screenshot_path)
+                    if not save_upload_stream(screenshot, screenshot_path, MAX_IMAGE_UPLOAD_SIZE):
+                        flash('File size too large. Please upload images smaller than 5MB.', 'error')
+                        return render_template('auth/register.html')
                     screenshot_filename = filename
                 except Exception as e:
                     flash('Error saving screenshot. Please try again.', 'error')
@@ -927,13 +1478,16 @@ def register():
             flash('Screenshot upload is required for instructor accounts', 'error')
             return render_template('auth/register.html')
         
+        # Hash before taking the lock so the KDF never blocks other requests
+        password_hash = hash_password(password)
+        
         with db_lock:
             conn = get_db_connection()
             
             # Check if user already exists
             existing_user = conn.execute(
-                'SELECT id FROM users WHERE email = ? OR username = ?', (email, username)
-            ).fetchone()
+                'SELECT EXISTS(SELECT 1 FROM users WHERE email = ? OR username = ?)', (email, username)
+            ).fetchone()[0]
             
             if existing_user:
                 flash('User with this email or username already exists', 'error')
@@ -941,8 +1495,6 @@ def register():
                 return render_template('auth/register.html')
             
             # Create new user
-            password_hash = generate_password_hash(password)
-            
             # Set instructor approval status based on role
             instructor_approval_status = 'pending' if role == 'instructor' else 'approved'
             
@@ -973,66 +1525,68 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    with db_lock:
-        conn = get_db_connection()
-        
-        if current_user.is_admin():
-            # Admin dashboard data
-            stats = {
-                'total_users': conn.execute('SELECT COUNT(*) FROM users WHERE is_active = 1').fetchone()[0],
-                'total_students': conn.execute('SELECT COUNT(*) FROM users WHERE role = "student" AND is_active = 1').fetchone()[0],
-                'total_courses': conn.execute('SELECT COUNT(*) FROM courses WHERE is_active = 1').fetchone()[0],
-                'total_enrollments': conn.execute('SELECT COUNT(*) FROM enrollments WHERE status = "approved"').fetchone()[0],
-                'pending_enrollments': conn.execute('SELECT COUNT(*) FROM enrollments WHERE status = "pending"').fetchone()[0],
-                'pending_instructors': conn.execute('SELECT COUNT(*) FROM users WHERE role = "instructor" AND instructor_approval_status = "pending" AND is_active = 1').fetchone()[0],
-                'total_instructors': conn.execute('SELECT COUNT(*) FROM users WHERE role = "instructor" AND is_active = 1').fetchone()[0]
-            }
-            
-            # Recent enrollments
-            recent_enrollments = conn.execute('''
-                SELECT e.*, u.full_name as student_name, c.title as course_title
-                FROM enrollments e
-                JOIN users u ON e.student_id = u.id
-                JOIN courses c ON e.course_id = c.id
-                ORDER BY e.enrolled_at DESC
-                LIMIT 10
-            ''').fetchall()
-            
-            conn.close()
-            return render_template('admin/dashboard.html', stats=stats, recent_enrollments=recent_enrollments)
+    # Resolve the proxy once; Flask-Login already keeps the loaded user on g for the request
+    user = current_user._get_current_object()
+    role = user.role
+    conn = get_db_connection()
+    
+    if role == 'admin':
+        # Admin dashboard data, aggregated in a single statement
+        stats = dict(conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM users WHERE is_active = 1) as total_users,
+                (SELECT COUNT(*) FROM users WHERE role = 'student' AND is_active = 1) as total_students,
+                (SELECT COUNT(*) FROM courses WHERE is_active = 1) as total_courses,
+                (SELECT COUNT(*) FROM enrollments WHERE status = 'approved') as total_enrollments,
+                (SELECT COUNT(*) FROM enrollments WHERE status = 'pending') as pending_enrollments,
+                (SELECT COUNT(*) FROM users WHERE role = 'instructor' AND instructor_approval_status = 'pending' AND is_active = 1) as pending_instructors,
+                (SELECT COUNT(*) FROM users WHERE role = 'instructor' AND is_active = 1) as total_instructors
+        ''').fetchone())
+        
+        # Recent enrollments
+        recent_enrollments = conn.execute('''
+            SELECT e.*, u.full_name as student_name, c.title as course_title
+            FROM enrollments e
+            JOIN users u ON e.student_id = u.id
+            JOIN courses c ON e.course_id = c.id
+            ORDER BY e.enrolled_at DESC
+            LIMIT 10
+        ''').fetchall()
         
-        elif current_user.is_instructor() and current_user.is_instructor_approved():
-            # Redirect to dedicated instructor dashboard only if instructor is approved
-            conn.close()
-            return redirect(url_for('instructor_dashboard'))
+        conn.close()
+        return render_template('admin/dashboard.html', stats=stats, recent_enrollments=recent_enrollments)
+    
+    elif role == 'instructor' and user.instructor_approval_status == 'approved':
+        # Redirect to dedicated instructor dashboard only if instructor is approved
+        conn.close()
+        return redirect(url_for('instructor_dashboard'))
+    
+    else:
+        # Student dashboard data - Use COALESCE to prioritize manual progress override
+        my_enrollments = conn.execute('''
+            SELECT e.*, c.title, c.course_code, c.description, u.full_name as instructor_name,
+                   COALESCE(e.manual_progress_override, e.progress_percentage) as display_progress
+            FROM enrollments e
+            JOIN courses c ON e.course_id = c.id
+            JOIN users u ON c.instructor_id = u.id
+            WHERE e.student_id = ?
+            ORDER BY e.enrolled_at DESC
+        ''', (user.id,)).fetchall()
         
-        else:
-            # Student dashboard data - Use COALESCE to prioritize manual progress override
-            my_enrollments_raw = conn.execute('''
-                SELECT e.*, c.title, c.course_code, c.description, u.full_name as instructor_name,
-                       COALESCE(e.manual_progress_override, e.progress_percentage) as display_progress
-                FROM enrollments e
-                JOIN courses c ON e.course_id = c.id
-                JOIN users u ON c.instructor_id = u.id
-                WHERE e.student_id = ?
-                ORDER BY e.enrolled_at DESC
-            ''', (current_user.id,)).fetchall()
-            
-            # Convert Row objects to dictionaries for JSON serialization
-            my_enrollments = [dict(row) for row in my_enrollments_raw]
-            
-            # Available courses (not enrolled)
-            available_courses = conn.execute('''
-                SELECT c.*, u.full_name as instructor_name
-                FROM courses c
-                JOIN users u ON c.instructor_id = u.id
-                LEFT JOIN enrollments e ON c.id = e.course_id AND e.student_id = ?
-                WHERE c.is_active = 1 AND e.id IS NULL
-                ORDER BY c.created_at DESC
-            ''', (current_user.id,)).fetchall()
-            
-            conn.close()
-            return render_template('student/dashboard.html', enrollments=my_enrollments, available_courses=available_courses)
+        # Available courses (not enrolled)
+        available_courses = conn.execute('''
+            SELECT c.*, u.full_name as instructor_name
+            FROM v_active_courses c
+            JOIN users u ON c.instructor_id = u.id
+            WHERE NOT EXISTS (
+                  SELECT 1 FROM enrollments e
+                  WHERE e.course_id = c.id AND e.student_id = ?
+              )
+            ORDER BY c.created_at DESC
+        ''', (user.id,)).fetchall()
+        
+        conn.close()
+        return render_template('student/dashboard.html', enrollments=my_enrollments, available_courses=available_courses)
 
 @app.route('/update_profile', methods=['POST'])
 @login_required
@@ -1045,6 +1599,45 @@ def update_profile():
             flash('Name cannot be empty.', 'error')
             return redirect(url_for('dashboard'))
         
+        # Save the profile picture before taking the lock so the file write
+        # never blocks other requests
+        relative_path = None
+        if 'profile_picture' in request.files:
+            file = request.files['profile_picture']
+            if file and file.filename:
+                try:
+                    # Validate file type
+                    filename = secure_filename(file.filename)
+                    
+                    if not is_allowed_image(filename):
+                        logging.warning("Invalid file type: %s", filename)
+                        flash('Invalid file type. Please upload PNG, JPG, JPEG, GIF, or WebP images only.', 'error')
+                        return redirect(url_for('dashboard'))
+                    
+                    # Validate file size (max 5MB): reject from the request header when it
+                    # already says too much, otherwise enforce the limit while streaming
+                    if request.content_length and request.content_length > MAX_IMAGE_UPLOAD_SIZE + 64 * 1024:
+                        flash('File size too large. Please upload images smaller than 5MB.', 'error')
+                        return redirect(url_for('dashboard'))
+                    
+                    profile_pics_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'profile_pictures')
+                    
+                    # Generate secure filename
+                    filename = random_upload_name(current_user.id, filename)
+                    filepath = os.path.join(profile_pics_dir, filename)
+                    
+                    # Save file
+                    if not save_upload_stream(file, filepath, MAX_IMAGE_UPLOAD_SIZE):
+                        flash('File size too large. Please upload images smaller than 5MB.', 'error')
+                        return redirect(url_for('dashboard'))
+                    logging.info("Profile picture saved: %s", filepath)
+                    
+                    relative_path = os.path.join('profile_pictures', filename).replace('\\', '/')
+                except Exception as file_error:
+                    logging.error("Error processing file upload: %s", file_error)
+                    flash('Error processing file upload. Please try again.', 'error')
+                    return redirect(url_for('dashboard'))
+        
         with db_lock:
             conn = get_db_connection()
             
@@ -1053,61 +1646,25 @@ def update_profile():
                 UPDATE users SET full_name = ? WHERE id = ?
             ''', (full_name, current_user.id))
             
-            # Handle profile picture upload
-            if 'profile_picture' in request.files:
-                file = request.files['profile_picture']
-                if file and file.filename:
-                    try:
-                        # Validate file type
-                        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-                        filename = secure_filename(file.filename)
-                        file_ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-                        
-                        if file_ext not in allowed_extensions:
-                            logging.warning(f"Invalid file type: {file_ext}")
-                            conn.close()
-                            flash('Invalid file type. Please upload PNG, JPG, JPEG, GIF, or WebP images only.', 'error')
-                            return redirect(url_for('dashboard'))
-                        
-                        # Create profile pictures directory
-                        profile_pics_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'profile_pictures')
-                        os.makedirs(profile_pics_dir, exist_ok=True)
-                        
-                        # Generate secure filename
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        filename = f"{current_user.id}_{timestamp}_{filename}"
-                        filepath = os.path.join(profile_pics_dir, filename)
-                        
-                        # Save file
-                        file.save(filepath)
-                        logging.info(f"Profile picture saved: {filepath}")
-                        
-                        # Update database with relative path
-                        relative_path = os.path.join('profile_pictures', filename).replace('\\', '/')
-                        conn.execute('''
-                            UPDATE users SET profile_picture = ? WHERE id = ?
-                        ''', (relative_path, current_user.id))
-                    except Exception as file_error:
-                        logging.error(f"Error processing file upload: {file_error}")
-                        conn.close()
-                        flash('Error processing file upload. Please try again.', 'error')
-                        return redirect(url_for('dashboard'))
+            # Update database with relative path
+            if relative_path:
+                conn.execute('''
+                    UPDATE users SET profile_picture = ? WHERE id = ?
+                ''', (relative_path, current_user.id))
             
             conn.commit()
-            
-            # Reload the updated user data from database
-            user_data = conn.execute('SELECT * FROM users WHERE id = ?', (current_user.id,)).fetchone()
             conn.close()
+        invalidate_user_cache(current_user.id)
         
-        # Update current_user object with new data
+        # Both values were just written, so update current_user without re-reading the row
         current_user.full_name = full_name
-        if user_data and 'profile_picture' in user_data.keys():
-            current_user.profile_picture = user_data['profile_picture']
+        if relative_path:
+            current_user.profile_picture = relative_path
         
         flash('Profile updated successfully!', 'success')
         
     except Exception as e:
-        logging.error(f"Error updating profile: {e}")
+        logging.error("Error updating profile: %s", e)
         flash('Error updating profile. Please try again.', 'error')
     
     return redirect(url_for('dashboard'))
@@ -1117,37 +1674,40 @@ def update_profile():
 @admin_required
 def admin_instructors():
     """Main instructor management page"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Get all instructors with their approval status
-        instructors_raw = conn.execute('''
-            SELECT u.*, 
-                   (SELECT full_name FROM users WHERE id = u.approved_by) as approved_by_name,
-                   (SELECT COUNT(*) FROM courses WHERE instructor_id = u.id AND is_active = 1) as course_count
-            FROM users u
-            WHERE u.role = 'instructor' AND u.is_active = 1
-            ORDER BY 
-                CASE u.instructor_approval_status 
-                    WHEN 'pending' THEN 1
-                    WHEN 'rejected' THEN 2
-                    WHEN 'approved' THEN 3
-                END,
-                u.created_at DESC
-        ''').fetchall()
-        
-        # Convert Row objects to dictionaries for JSON serialization
-        instructors = [dict(row) for row in instructors_raw]
-        
-        # Get counts for stats
-        stats = {
-            'total_instructors': len(instructors),
-            'pending_instructors': len([i for i in instructors if i['instructor_approval_status'] == 'pending']),
-            'approved_instructors': len([i for i in instructors if i['instructor_approval_status'] == 'approved']),
-            'rejected_instructors': len([i for i in instructors if i['instructor_approval_status'] == 'rejected'])
-        }
-        
-        conn.close()
+    conn = get_db_connection()
+    
+    # Get all instructors with their approval status
+    instructors = conn.execute('''
+        SELECT u.id, u.username, u.email, u.full_name, u.instructor_approval_status,
+               u.created_at, u.is_active,
+               (SELECT full_name FROM users WHERE id = u.approved_by) as approved_by_name,
+               (SELECT COUNT(*) FROM courses WHERE instructor_id = u.id AND is_active = 1) as course_count
+        FROM users u
+        WHERE u.role = 'instructor' AND u.is_active = 1
+        ORDER BY 
+            CASE u.instructor_approval_status 
+                WHEN 'pending' THEN 1
+                WHEN 'rejected' THEN 2
+                WHEN 'approved' THEN 3
+            END,
+            u.created_at DESC
+    ''').fetchall()
+    
+    # Get counts for stats, grouped by SQLite rather than walking the list
+    status_counts = dict(conn.execute('''
+        SELECT instructor_approval_status, COUNT(*)
+        FROM users
+        WHERE role = 'instructor' AND is_active = 1
+        GROUP BY instructor_approval_status
+    ''').fetchall())
+    stats = {
+        'total_instructors': sum(status_counts.values()),
+        'pending_instructors': status_counts.get('pending', 0),
+        'approved_instructors': status_counts.get('approved', 0),
+        'rejected_instructors': status_counts.get('rejected', 0)
+    }
+    
+    conn.close()
     
     return render_template('admin/instructors.html', instructors=instructors, stats=stats)
 
@@ -1155,22 +1715,19 @@ def admin_instructors():
 @admin_required
 def admin_instructors_pending():
     """View pending instructor applications"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        pending_instructors_raw = conn.execute('''
-            SELECT u.*
-            FROM users u
-            WHERE u.role = 'instructor' 
-              AND u.instructor_approval_status = 'pending' 
-              AND u.is_active = 1
-            ORDER BY u.created_at ASC
-        ''').fetchall()
-        
-        # Convert Row objects to dictionaries for JSON serialization
-        pending_instructors = [dict(row) for row in pending_instructors_raw]
-        
-        conn.close()
+    conn = get_db_connection()
+    
+    pending_instructors = conn.execute('''
+        SELECT u.id, u.username, u.email, u.full_name, u.instructor_approval_status,
+               u.created_at, u.is_active
+        FROM users u
+        WHERE u.role = 'instructor' 
+          AND u.instructor_approval_status = 'pending' 
+          AND u.is_active = 1
+        ORDER BY u.created_at ASC
+    ''').fetchall()
+    
+    conn.close()
     
     return render_template('admin/instructors.html', 
                          instructors=pending_instructors, 
@@ -1186,7 +1743,7 @@ def admin_approve_instructor(instructor_id):
         
         # Verify instructor exists and is pending
         instructor = conn.execute('''
-            SELECT * FROM users 
+            SELECT id, full_name FROM users 
             WHERE id = ? AND role = 'instructor' AND instructor_approval_status = 'pending'
         ''', (instructor_id,)).fetchone()
         
@@ -1214,6 +1771,7 @@ def admin_approve_instructor(instructor_id):
               'success'))
         
         conn.commit()
+        invalidate_user_cache(instructor_id)
         conn.close()
     
     flash(f'Instructor {instructor["full_name"]} has been approved successfully.', 'success')
@@ -1228,7 +1786,7 @@ def admin_reject_instructor(instructor_id):
         
         # Verify instructor exists and is pending
         instructor = conn.execute('''
-            SELECT * FROM users 
+            SELECT id, full_name FROM users 
             WHERE id = ? AND role = 'instructor' AND instructor_approval_status = 'pending'
         ''', (instructor_id,)).fetchone()
         
@@ -1256,6 +1814,7 @@ def admin_reject_instructor(instructor_id):
               'error'))
         
         conn.commit()
+        invalidate_user_cache(instructor_id)
         conn.close()
     
     flash(f'Instructor {instructor["full_name"]} has been rejected.', 'warning')
@@ -1274,14 +1833,16 @@ def admin_create_instructor():
         flash('All fields are required.', 'error')
         return redirect(url_for('admin_instructors'))
     
+    password_hash = hash_password(password)
+    
     with db_lock:
         conn = get_db_connection()
         
         # Check if user already exists
         existing = conn.execute(
-            'SELECT id FROM users WHERE username = ? OR email = ?',
+            'SELECT EXISTS(SELECT 1 FROM users WHERE username = ? OR email = ?)',
             (username, email)
-        ).fetchone()
+        ).fetchone()[0]
         
         if existing:
             flash('Username or email already exists.', 'error')
@@ -1290,9 +1851,9 @@ def admin_create_instructor():
         
         try:
             conn.execute('''
-                INSERT INTO users (username, email, password, full_name, role, instructor_approval_status, is_active)
+                INSERT INTO users (username, email, password_hash, full_name, role, instructor_approval_status, is_active)
                 VALUES (?, ?, ?, ?, 'instructor', 'approved', 1)
-            ''', (username, email, generate_password_hash(password), full_name))
+            ''', (username, email, password_hash, full_name))
             
             conn.commit()
             flash(f'Instructor {full_name} created successfully!', 'success')
@@ -1312,7 +1873,7 @@ def admin_edit_instructor(instructor_id):
         conn = get_db_connection()
         
         instructor = conn.execute(
-            'SELECT * FROM users WHERE id = ? AND role = "instructor"',
+            'SELECT id, email FROM users WHERE id = ? AND role = "instructor"',
             (instructor_id,)
         ).fetchone()
         
@@ -1327,9 +1888,9 @@ def admin_edit_instructor(instructor_id):
         # Check if new email is already taken
         if email != instructor['email']:
             existing = conn.execute(
-                'SELECT id FROM users WHERE email = ? AND id != ?',
+                'SELECT EXISTS(SELECT 1 FROM users WHERE email = ? AND id != ?)',
                 (email, instructor_id)
-            ).fetchone()
+            ).fetchone()[0]
             if existing:
                 flash('Email already in use.', 'error')
                 conn.close()
@@ -1343,6 +1904,7 @@ def admin_edit_instructor(instructor_id):
             ''', (email, full_name, instructor_id))
             
             conn.commit()
+            invalidate_user_cache(instructor_id)
             flash(f'Instructor {full_name} updated successfully!', 'success')
         except Exception as e:
             conn.rollback()
@@ -1360,7 +1922,7 @@ def admin_delete_instructor(instructor_id):
         conn = get_db_connection()
         
         instructor = conn.execute(
-            'SELECT * FROM users WHERE id = ? AND role = "instructor"',
+            'SELECT id, full_name FROM users WHERE id = ? AND role = "instructor"',
             (instructor_id,)
         ).fetchone()
         
@@ -1375,6 +1937,7 @@ def admin_delete_instructor(instructor_id):
                 (instructor_id,)
             )
             conn.commit()
+            invalidate_user_cache(instructor_id)
             flash(f'Instructor {instructor["full_name"]} has been removed.', 'success')
         except Exception as e:
             conn.rollback()
@@ -1392,7 +1955,7 @@ def admin_toggle_instructor_block(instructor_id):
         conn = get_db_connection()
         
         instructor = conn.execute(
-            'SELECT * FROM users WHERE id = ? AND role = "instructor"',
+            'SELECT id, full_name, is_active FROM users WHERE id = ? AND role = "instructor"',
             (instructor_id,)
         ).fetchone()
         
@@ -1410,6 +1973,7 @@ def admin_toggle_instructor_block(instructor_id):
                 (new_status, instructor_id)
             )
             conn.commit()
+            invalidate_user_cache(instructor_id)
             flash(f'Instructor {instructor["full_name"]} has been {action}.', 'success')
         except Exception as e:
             conn.rollback()
@@ -1419,30 +1983,167 @@ def admin_toggle_instructor_block(instructor_id):
     
     return redirect(url_for('admin_instructors'))
 
+# Keyset pagination for long list pages: ?limit= sets the page size and ?cursor=
+# carries the sort key of the last row shown, so each page is one index range
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_limit():
+    """Requested page size, clamped to 1..MAX_PAGE_SIZE"""
+    return max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+def page_cursor(*types):
+    """Sort-key fields of the ?cursor= argument converted with `types`, or None on
+    the first page (a malformed cursor also starts over from the first page)"""
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return None
+    fields = cursor.split('|')
+    if len(fields) != len(types):
+        return None
+    try:
+        return [convert(field) for convert, field in zip(types, fields)]
+    except ValueError:
+        return None
+
+def next_page_cursor(rows, limit, *keys):
+    """Cursor for the page after `rows` (fetched with limit + 1), or None if this is the last"""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return '|'.join(str(last[key]) for key in keys)
+
+# SQL shared by the admin student and instructor enrollment pages. Keeping each
+# query in one constant lets every pooled connection's statement cache reuse it.
+
+# Students with their approved enrollment count (admin student list), one keyset
+# page at a time: newest first, continuing after the (created_at, id) cursor
+_ADMIN_STUDENTS_PAGE_SQL = '''
+    SELECT u.*,
+           (SELECT COUNT(*) FROM enrollments e
+            WHERE e.student_id = u.id AND e.status = 'approved') as enrollment_count
+    FROM users u
+    WHERE u.role = 'student' {after}
+    ORDER BY u.created_at DESC, u.id DESC
+    LIMIT ?
+'''
+ADMIN_STUDENTS_SQL = _ADMIN_STUDENTS_PAGE_SQL.format(after='')
+ADMIN_STUDENTS_AFTER_SQL = _ADMIN_STUDENTS_PAGE_SQL.format(after='AND (u.created_at, u.id) < (?, ?)')
+
+# The instructor dashboard's two queries start from the same CTE over the
+# instructor's active courses, so both plans begin with the
+# idx_courses_instructor_active seek and the second runs against pages the first
+# just loaded
+_MY_COURSES_CTE = '''
+    WITH my_c AS (SELECT * FROM v_active_courses WHERE instructor_id = ?)
+'''
+
+# Instructor's active courses with per-status enrollment counts
+INSTRUCTOR_COURSES_SQL = _MY_COURSES_CTE + '''
+    SELECT c.*, 
+           COUNT(CASE WHEN e.status = 'approved' THEN 1 END) as approved_count,
+           COUNT(CASE WHEN e.status = 'pending' THEN 1 END) as pending_count,
+           COUNT(e.id) as total_enrollments
+    FROM my_c c
+    LEFT JOIN enrollments e ON c.id = e.course_id
+    GROUP BY c.id
+    ORDER BY c.created_at DESC
+'''
+
+# Pending enrollment requests across an instructor's courses
+INSTRUCTOR_PENDING_ENROLLMENTS_SQL = _MY_COURSES_CTE + '''
+    SELECT e.*, u.full_name as student_name, u.email as student_email, 
+           c.title as course_title, c.course_code
+    FROM my_c c
+    JOIN enrollments e ON e.course_id = c.id AND e.status = 'pending'
+    JOIN users u ON e.student_id = u.id
+    ORDER BY e.enrolled_at ASC
+'''
+
+# All enrollments in an instructor's courses, pending first, one keyset page at a
+# time continuing after the (status rank, enrolled_at, id) cursor
+_ENROLLMENT_STATUS_RANK = '''
+    CASE e.status
+        WHEN 'pending' THEN 1
+        WHEN 'approved' THEN 2
+        WHEN 'rejected' THEN 3
+        ELSE 0
+    END'''
+_INSTRUCTOR_ENROLLMENTS_PAGE_SQL = '''
+    SELECT e.*, u.full_name as student_name, u.email as student_email,
+           c.title as course_title, c.course_code,
+           COALESCE(e.progress_percentage, 0) as progress_percentage,
+           {rank} as status_rank
+    FROM enrollments e
+    JOIN users u ON e.student_id = u.id
+    JOIN courses c ON e.course_id = c.id
+    WHERE c.instructor_id = ? {after}
+    ORDER BY status_rank, e.enrolled_at DESC, e.id DESC
+    LIMIT ?
+'''
+INSTRUCTOR_ENROLLMENTS_SQL = _INSTRUCTOR_ENROLLMENTS_PAGE_SQL.format(rank=_ENROLLMENT_STATUS_RANK, after='')
+INSTRUCTOR_ENROLLMENTS_AFTER_SQL = _INSTRUCTOR_ENROLLMENTS_PAGE_SQL.format(
+    rank=_ENROLLMENT_STATUS_RANK,
+    after=f'''AND ({_ENROLLMENT_STATUS_RANK} > ?
+             OR ({_ENROLLMENT_STATUS_RANK} = ? AND (e.enrolled_at, e.id) < (?, ?)))''')
+
+# Enrollment totals by status for an instructor's courses
+INSTRUCTOR_ENROLLMENT_COUNTS_SQL = '''
+    SELECT COUNT(*) as total,
+           COUNT(CASE WHEN e.status = 'pending' THEN 1 END) as pending,
+           COUNT(CASE WHEN e.status = 'approved' THEN 1 END) as approved,
+           COUNT(CASE WHEN e.status = 'rejected' THEN 1 END) as rejected
+    FROM enrollments e
+    JOIN courses c ON e.course_id = c.id
+    WHERE c.instructor_id = ?
+'''
+
+# Enrollment transitions (approve/reject/block/remove/unblock). Each applies only to
+# an enrollment in the instructor's course that is still in the expected status, and
+# returns what the notification and flash message need.
+_OWNED_ENROLLMENT_RETURNING = '''
+    WHERE id = ? AND status = ?
+      AND course_id IN (SELECT id FROM courses WHERE instructor_id = ?)
+    RETURNING student_id, course_id,
+              (SELECT title FROM courses WHERE courses.id = enrollments.course_id) as course_title,
+              (SELECT full_name FROM users WHERE users.id = enrollments.student_id) as student_name
+'''
+APPROVE_ENROLLMENT_SQL = "UPDATE enrollments SET status = 'approved', approved_at = CURRENT_TIMESTAMP" + _OWNED_ENROLLMENT_RETURNING
+SET_ENROLLMENT_STATUS_SQL = 'UPDATE enrollments SET status = ?' + _OWNED_ENROLLMENT_RETURNING
+REMOVE_ENROLLMENT_SQL = 'DELETE FROM enrollments' + _OWNED_ENROLLMENT_RETURNING
+# Bulk approval binds the whole id list as one JSON array parameter, so the
+# statement text is the same however many enrollments are selected
+BULK_APPROVE_ENROLLMENTS_SQL = '''
+    UPDATE enrollments SET status = 'approved', approved_at = CURRENT_TIMESTAMP
+    WHERE id IN (SELECT value FROM json_each(?)) AND status = 'pending'
+      AND course_id IN (SELECT id FROM courses WHERE instructor_id = ?)
+    RETURNING student_id, course_id,
+              (SELECT title FROM courses WHERE courses.id = enrollments.course_id) as course_title
+'''
+ENROLLMENT_APPROVED_MESSAGE = 'Great news! Your enrollment in "{}" has been approved. You now have full access to the course.'
+
 @app.route('/admin/students')
 @login_required
 @admin_required
 def admin_students():
     """View all students"""
     try:
-        with db_lock:
-            conn = get_db_connection()
-            students_raw = conn.execute('''
-                SELECT u.*, COUNT(DISTINCT e.id) as enrollment_count
-                FROM users u
-                LEFT JOIN enrollments e ON u.id = e.student_id AND e.status = 'approved'
-                WHERE u.role = 'student'
-                GROUP BY u.id
-                ORDER BY u.created_at DESC
-            ''').fetchall()
-            
-            # Convert Row objects to dictionaries for JSON serialization
-            students = [dict(row) for row in students_raw]
-            conn.close()
+        limit = page_limit()
+        cursor = page_cursor(str, int)
+        conn = get_db_connection()
+        if cursor:
+            students = conn.execute(ADMIN_STUDENTS_AFTER_SQL, (*cursor, limit + 1)).fetchall()
+        else:
+            students = conn.execute(ADMIN_STUDENTS_SQL, (limit + 1,)).fetchall()
+        total_students = conn.execute("SELECT COUNT(*) FROM users WHERE role = 'student'").fetchone()[0]
+        
+        conn.close()
         
-        return render_template('admin/students.html', students=students)
+        next_cursor = next_page_cursor(students, limit, 'created_at', 'id')
+        return render_template('admin/students.html', students=students[:limit],
+                               total_students=total_students, next_cursor=next_cursor)
     except Exception as e:
-        logging.error(f"Error fetching students: {e}")
+        logging.error("Error fetching students: %s", e)
         flash('Error loading students', 'error')
         return redirect(url_for('dashboard'))
 
@@ -1451,24 +2152,29 @@ def admin_students():
 def admin_student_enrollments(student_id):
     """Get student's course enrollments for viewing"""
     try:
-        with db_lock:
-            conn = get_db_connection()
-            enrollments_raw = conn.execute('''
-                SELECT e.id, e.status, e.enrolled_at, e.progress_percentage,
-                       c.title, c.course_code, u.full_name as instructor_name
-                FROM enrollments e
-                JOIN courses c ON e.course_id = c.id
-                JOIN users u ON c.instructor_id = u.id
-                WHERE e.student_id = ?
-                ORDER BY e.enrolled_at DESC
-            ''', (student_id,)).fetchall()
-            
-            enrollments = [dict(row) for row in enrollments_raw]
-            conn.close()
+        with db_connection() as conn:
+            # SQLite builds the JSON array itself, so the rows never become Python objects
+            enrollments_json = conn.execute('''
+                SELECT json_group_array(json_object(
+                    'id', id, 'status', status, 'enrolled_at', enrolled_at,
+                    'progress_percentage', progress_percentage, 'title', title,
+                    'course_code', course_code, 'instructor_name', instructor_name
+                ))
+                FROM (
+                    SELECT e.id, e.status, e.enrolled_at, e.progress_percentage,
+                           c.title, c.course_code, u.full_name as instructor_name
+                    FROM enrollments e
+                    JOIN courses c ON e.course_id = c.id
+                    JOIN users u ON c.instructor_id = u.id
+                    WHERE e.student_id = ?
+                    ORDER BY e.enrolled_at DESC
+                )
+            ''', (student_id,)).fetchone()[0]
         
-        return jsonify({'success': True, 'enrollments': enrollments})
+        return app.response_class('{"success": true, "enrollments": %s}' % enrollments_json,
+                                  mimetype='application/json')
     except Exception as e:
-        logging.error(f"Error fetching enrollments: {e}")
+        logging.error("Error fetching enrollments: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/admin/students/<int:student_id>/delete', methods=['POST'])
@@ -1477,28 +2183,30 @@ def admin_student_enrollments(student_id):
 def admin_delete_student(student_id):
     """Delete a student account"""
     try:
-        with db_lock:
-            conn = get_db_connection()
-            student = conn.execute('SELECT * FROM users WHERE id = ? AND role = "student"', (student_id,)).fetchone()
-            
-            if not student:
-                conn.close()
-                return jsonify({'success': False, 'error': 'Student not found'}), 404
-            
-            # Delete student's enrollments
-            conn.execute('DELETE FROM enrollments WHERE student_id = ?', (student_id,))
-            
-            # Delete student's notes
-            conn.execute('DELETE FROM student_notes WHERE student_id = ?', (student_id,))
-            
-            # Delete student account
-            conn.execute('DELETE FROM users WHERE id = ?', (student_id,))
-            conn.commit()
+        conn = get_db_connection()
+        # Hold SQLite's write lock from the check through the commit
+        conn.execute('BEGIN IMMEDIATE')
+        student = conn.execute("SELECT * FROM users WHERE id = ? AND role = 'student'", (student_id,)).fetchone()
+        
+        if not student:
             conn.close()
+            return jsonify({'success': False, 'error': 'Student not found'}), 404
+        
+        # Delete student's enrollments
+        conn.execute('DELETE FROM enrollments WHERE student_id = ?', (student_id,))
+        
+        # Delete student's notes
+        conn.execute('DELETE FROM student_notes WHERE student_id = ?', (student_id,))
+        
+        # Delete student account
+        conn.execute('DELETE FROM users WHERE id = ?', (student_id,))
+        conn.commit()
+        invalidate_user_cache(student_id)
+        conn.close()
             
         return jsonify({'success': True, 'message': 'Student deleted successfully'})
     except Exception as e:
-        logging.error(f"Error deleting student: {e}")
+        logging.error("Error deleting student: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/admin/students/<int:student_id>/toggle-block', methods=['POST'])
@@ -1507,83 +2215,113 @@ def admin_delete_student(student_id):
 def admin_toggle_student_block(student_id):
     """Toggle student block status"""
     try:
-        with db_lock:
-            conn = get_db_connection()
-            student = conn.execute('SELECT * FROM users WHERE id = ? AND role = "student"', (student_id,)).fetchone()
-            
-            if not student:
-                conn.close()
-                return jsonify({'success': False, 'error': 'Student not found'}), 404
-            
-            # Toggle is_active status
-            new_status = 0 if student['is_active'] else 1
-            conn.execute('UPDATE users SET is_active = ? WHERE id = ?', (new_status, student_id))
-            conn.commit()
+        conn = get_db_connection()
+        # Toggle is_active in one statement so concurrent toggles cannot lose an update
+        student = conn.execute('''
+            UPDATE users SET is_active = 1 - COALESCE(is_active, 0)
+            WHERE id = ? AND role = 'student'
+            RETURNING is_active
+        ''', (student_id,)).fetchone()
+        
+        if not student:
             conn.close()
+            return jsonify({'success': False, 'error': 'Student not found'}), 404
+        
+        conn.commit()
+        invalidate_user_cache(student_id)
+        conn.close()
             
-        return jsonify({'success': True, 'message': f'Student {"unblocked" if new_status else "blocked"} successfully'})
+        return jsonify({'success': True, 'message': f'Student {"unblocked" if student["is_active"] else "blocked"} successfully'})
     except Exception as e:
-        logging.error(f"Error toggling student block: {e}")
+        logging.error("Error toggling student block: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# The dashboard is reloaded constantly while instructors work through requests,
+# so its queries are memoized briefly; the page itself is not cached because it
+# carries the CSRF token and flashed messages
+INSTRUCTOR_DASHBOARD_TTL = 5
+
+@cache.memoize(timeout=INSTRUCTOR_DASHBOARD_TTL)
+def _instructor_dashboard_data(instructor_id):
+    """Courses, pending enrollments and stats for the instructor dashboard (plain dicts, cacheable)"""
+    with db_connection() as conn:
+        # My courses
+        my_courses = [dict(r) for r in conn.execute(INSTRUCTOR_COURSES_SQL, (instructor_id,))]
+        
+        # Pending enrollments for all my courses
+        pending_enrollments = [dict(r) for r in conn.execute(INSTRUCTOR_PENDING_ENROLLMENTS_SQL, (instructor_id,))]
+    
+    # Statistics
+    stats = {
+        'total_courses': len(my_courses),
+        'total_students': sum(course['approved_count'] for course in my_courses),
+        'pending_enrollments': len(pending_enrollments),
+        'active_courses': sum(1 for course in my_courses if course['approved_count'] > 0)
+    }
+    return my_courses, pending_enrollments, stats
+
+def invalidate_instructor_dashboard(instructor_id):
+    """Drop the cached dashboard data after an instructor's courses or enrollments change"""
+    cache.delete_memoized(_instructor_dashboard_data, int(instructor_id))
+
+# Access checks shared by many routes. Keeping each one as a single SQL text means
+# one prepared statement per pooled connection instead of one per copy of the query.
+COURSE_OWNED_SQL = 'SELECT * FROM courses WHERE id = ? AND instructor_id = ? AND is_active = 1'
+APPROVED_ENROLLMENT_SQL = "SELECT 1 FROM enrollments WHERE student_id = ? AND course_id = ? AND status = 'approved'"
+
+# Instructor routes check course ownership on every request, so the answer is
+# memoized briefly; course edits and deletes drop it straight away
+COURSE_OWNERSHIP_TTL = 30
+
+@cache.memoize(timeout=COURSE_OWNERSHIP_TTL)
+def owned_course(course_id, instructor_id):
+    """The instructor's active course as a plain dict, or None if they do not own it"""
+    with db_connection() as conn:
+        course = conn.execute(COURSE_OWNED_SQL, (course_id, instructor_id)).fetchone()
+    return dict(course) if course else None
+
+def invalidate_owned_course(course_id, instructor_id):
+    """Drop the cached ownership check after a course is edited or deleted"""
+    cache.delete_memoized(owned_course, int(course_id), int(instructor_id))
+
 # INSTRUCTOR ROUTES
 @app.route('/instructor/dashboard')
 @instructor_required
 def instructor_dashboard():
     """Enhanced instructor dashboard with course management"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # My courses
-        my_courses = conn.execute('''
-            SELECT c.*, 
-                   COUNT(CASE WHEN e.status = 'approved' THEN 1 END) as approved_count,
-                   COUNT(CASE WHEN e.status = 'pending' THEN 1 END) as pending_count,
-                   COUNT(e.id) as total_enrollments
-            FROM courses c
-            LEFT JOIN enrollments e ON c.id = e.course_id
-            WHERE c.instructor_id = ? AND c.is_active = 1
-            GROUP BY c.id
-            ORDER BY c.created_at DESC
-        ''', (current_user.id,)).fetchall()
-        
-        # Pending enrollments for all my courses
-        pending_enrollments = conn.execute('''
-            SELECT e.*, u.full_name as student_name, u.email as student_email, 
-                   c.title as course_title, c.course_code
-            FROM enrollments e
-            JOIN users u ON e.student_id = u.id
-            JOIN courses c ON e.course_id = c.id
-            WHERE c.instructor_id = ? AND e.status = 'pending'
-            ORDER BY e.enrolled_at ASC
-        ''', (current_user.id,)).fetchall()
-        
-        # Statistics
-        stats = {
-            'total_courses': len(my_courses),
-            'total_students': sum([course['approved_count'] for course in my_courses]),
-            'pending_enrollments': len(pending_enrollments),
-            'active_courses': len([c for c in my_courses if c['approved_count'] > 0])
-        }
-        
-        conn.close()
+    my_courses, pending_enrollments, stats = _instructor_dashboard_data(current_user.id)
     
     return render_template('instructor/dashboard.html', 
                          courses=my_courses, 
                          pending_enrollments=pending_enrollments,
                          stats=stats)
 
+# Tables cleared along with a deleted course; some are optional and only exist
+# in databases that created them
+COURSE_CHILD_TABLES = ('enrollments', 'course_video_playlists', 'course_resources',
+                       'course_meeting_links', 'quizzes', 'ai_notes', 'discussion_forums')
+
+@lru_cache(maxsize=1)
+def existing_course_child_tables():
+    """COURSE_CHILD_TABLES present in the database, looked up once per process"""
+    conn = get_db_connection()
+    tables = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    return tuple(table for table in COURSE_CHILD_TABLES if table in tables)
+
 @app.route('/instructor/courses/<int:course_id>/delete', methods=['POST'])
 @instructor_required
 def instructor_delete_course(course_id):
     """Delete a course"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify course belongs to instructor
+    conn = get_db_connection()
+    
+    try:
+        # Delete the course only if it belongs to this instructor; the write lock
+        # taken here is held through the child-table deletes below
         course = conn.execute('''
-            SELECT * FROM courses 
+            DELETE FROM courses 
             WHERE id = ? AND instructor_id = ?
+            RETURNING title
         ''', (course_id, current_user.id)).fetchone()
         
         if not course:
@@ -1591,54 +2329,22 @@ def instructor_delete_course(course_id):
             conn.close()
             return redirect(url_for('instructor_courses'))
         
-        try:
-            # Delete related data - only from tables that exist
-            conn.execute('DELETE FROM enrollments WHERE course_id = ?', (course_id,))
-            
-            # Try to delete from optional tables if they exist
-            try:
-                conn.execute('DELETE FROM course_video_playlists WHERE course_id = ?', (course_id,))
-            except:
-                pass
-            
-            try:
-                conn.execute('DELETE FROM course_resources WHERE course_id = ?', (course_id,))
-            except:
-                pass
-            
-            try:
-                conn.execute('DELETE FROM course_meeting_links WHERE course_id = ?', (course_id,))
-            except:
-                pass
-            
-            try:
-                conn.execute('DELETE FROM quizzes WHERE course_id = ?', (course_id,))
-            except:
-                pass
-            
-            try:
-                conn.execute('DELETE FROM ai_notes WHERE course_id = ?', (course_id,))
-            except:
-                pass
-            
-            try:
-                conn.execute('DELETE FROM discussion_forums WHERE course_id = ?', (course_id,))
-            except:
-                pass
-            
-            # Delete the course itself
-            conn.execute('DELETE FROM courses WHERE id = ?', (course_id,))
-            
-            conn.commit()
-            conn.close()
-            
-            flash(f'Course "{course["title"]}" has been deleted successfully.', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            logging.error(f"Error deleting course: {e}")
-            flash('Error deleting course. Please try again.', 'error')
+        # Delete related data - only from tables that exist
+        for table in existing_course_child_tables():
+            conn.execute(f'DELETE FROM {table} WHERE course_id = ?', (course_id,))
+        
+        conn.commit()
+        invalidate_instructor_dashboard(current_user.id)
+        invalidate_owned_course(course_id, current_user.id)
+        conn.close()
+        
+        flash(f'Course "{course["title"]}" has been deleted successfully.', 'success')
+        
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        logging.error("Error deleting course: %s", e)
+        flash('Error deleting course. Please try again.', 'error')
     
     return redirect(url_for('instructor_courses'))
 
@@ -1647,35 +2353,27 @@ def instructor_delete_course(course_id):
 @instructor_required
 def instructor_courses():
     """View and manage all instructor courses"""
-    with db_lock:
-        conn = get_db_connection()
-        
+    with db_connection() as conn:
+        # Each course carries its latest 5 AI Notes PDFs as a JSON array, so the
+        # rows go to the template as-is
         courses = conn.execute('''
             SELECT c.*, 
                    COUNT(CASE WHEN e.status = 'approved' THEN 1 END) as approved_count,
-                   COUNT(CASE WHEN e.status = 'pending' THEN 1 END) as pending_count
-            FROM courses c
+                   COUNT(CASE WHEN e.status = 'pending' THEN 1 END) as pending_count,
+                   (SELECT json_group_array(json_object('id', n.id, 'topic', n.topic,
+                                                        'pdf_path', n.pdf_path, 'created_at', n.created_at))
+                    FROM (SELECT id, topic, pdf_path, created_at FROM ai_notes
+                          WHERE course_id = c.id AND created_by = ? AND is_instructor_note = 1
+                            AND pdf_path IS NOT NULL
+                          ORDER BY created_at DESC LIMIT 5) n) as ai_notes_json
+            FROM v_active_courses c
             LEFT JOIN enrollments e ON c.id = e.course_id
-            WHERE c.instructor_id = ? AND c.is_active = 1
+            WHERE c.instructor_id = ?
             GROUP BY c.id
             ORDER BY c.created_at DESC
-        ''', (current_user.id,)).fetchall()
-        
-        # Fetch AI Notes PDFs for each course
-        courses_list = []
-        for course in courses:
-            course_dict = dict(course)
-            ai_notes = conn.execute('''
-                SELECT * FROM ai_notes 
-                WHERE course_id = ? AND created_by = ? AND is_instructor_note = 1 AND pdf_path IS NOT NULL
-                ORDER BY created_at DESC LIMIT 5
-            ''', (course['id'], current_user.id)).fetchall()
-            course_dict['ai_notes'] = ai_notes
-            courses_list.append(course_dict)
-        
-        conn.close()
+        ''', (current_user.id, current_user.id)).fetchall()
     
-    return render_template('instructor/courses.html', courses=courses_list)
+    return render_template('instructor/courses.html', courses=courses)
 
 @app.route('/instructor/courses/create', methods=['GET', 'POST'])
 @instructor_required
@@ -1712,40 +2410,42 @@ def instructor_create_course():
             return render_template('instructor/create_course.html')
         
         # Hash the enrollment key for security
-        enrollment_key_hash = generate_password_hash(enrollment_key)
+        enrollment_key_hash = hash_enrollment_key(enrollment_key)
         
-        with db_lock:
-            conn = get_db_connection()
+        conn = get_db_connection()
+        # Hold SQLite's write lock from the check through the commit
+        conn.execute('BEGIN IMMEDIATE')
+        
+        # Check if course code already exists
+        existing_course = conn.execute(
+            'SELECT EXISTS(SELECT 1 FROM courses WHERE course_code = ?)', (course_code,)
+        ).fetchone()[0]
+        
+        if existing_course:
+            flash('Course code already exists. Please choose a different one.', 'error')
+            conn.close()
+            return render_template('instructor/create_course.html')
+        
+        try:
+            conn.execute('''
+                INSERT INTO courses (
+                    course_code, title, description, syllabus, instructor_id, 
+                    category, max_students, start_date, end_date, enrollment_key_hash
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (course_code, title, description, syllabus, current_user.id,
+                 category, max_students, start_date, end_date, enrollment_key_hash))
             
-            # Check if course code already exists
-            existing_course = conn.execute(
-                'SELECT id FROM courses WHERE course_code = ?', (course_code,)
-            ).fetchone()
+            conn.commit()
+            invalidate_instructor_dashboard(current_user.id)
+            conn.close()
             
-            if existing_course:
-                flash('Course code already exists. Please choose a different one.', 'error')
-                conn.close()
-                return render_template('instructor/create_course.html')
+            flash(f'Course "{title}" created successfully!', 'success')
+            return redirect(url_for('instructor_courses'))
             
-            try:
-                conn.execute('''
-                    INSERT INTO courses (
-                        course_code, title, description, syllabus, instructor_id, 
-                        category, max_students, start_date, end_date, enrollment_key_hash
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (course_code, title, description, syllabus, current_user.id,
-                     category, max_students, start_date, end_date, enrollment_key_hash))
-                
-                conn.commit()
-                conn.close()
-                
-                flash(f'Course "{title}" created successfully!', 'success')
-                return redirect(url_for('instructor_courses'))
-                
-            except Exception as e:
-                conn.rollback()
-                conn.close()
-                flash('Error creating course. Please try again.', 'error')
+        except Exception as e:
+            conn.rollback()
+            conn.close()
+            flash('Error creating course. Please try again.', 'error')
     
     return render_template('instructor/create_course.html')
 
@@ -1753,61 +2453,54 @@ def instructor_create_course():
 @instructor_required
 def instructor_edit_course(course_id):
     """Edit an existing course"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify course belongs to current instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
-        
-        if not course:
-            flash('Course not found or access denied.', 'error')
-            conn.close()
-            return redirect(url_for('instructor_courses'))
+    conn = get_db_connection()
+    
+    if request.method == 'POST':
+        title = request.form['title'].strip()
+        description = request.form.get('description', '').strip()
+        syllabus = request.form.get('syllabus', '').strip()
+        category = request.form.get('category', '').strip()
+        max_students = int(request.form.get('max_students', 50))
+        start_date = request.form.get('start_date') or None
+        end_date = request.form.get('end_date') or None
         
-        if request.method == 'POST':
-            title = request.form['title'].strip()
-            description = request.form.get('description', '').strip()
-            syllabus = request.form.get('syllabus', '').strip()
-            category = request.form.get('category', '').strip()
-            max_students = int(request.form.get('max_students', 50))
-            start_date = request.form.get('start_date') or None
-            end_date = request.form.get('end_date') or None
-            
-            # Handle enrollment key update
-            enrollment_key = request.form.get('enrollment_key', '').strip()
-            if enrollment_key:
-                if len(enrollment_key) < 6:
-                    flash('Enrollment key must be at least 6 characters long.', 'error')
-                    conn.close()
-                    return render_template('instructor/edit_course.html', course=course)
-                enrollment_key_hash = generate_password_hash(enrollment_key)
-            else:
-                enrollment_key_hash = course['enrollment_key_hash']  # Keep existing
-            
+        # Handle enrollment key update; a blank key keeps the existing one
+        enrollment_key = request.form.get('enrollment_key', '').strip()
+        if enrollment_key and len(enrollment_key) < 6:
+            flash('Enrollment key must be at least 6 characters long.', 'error')
+        else:
+            enrollment_key_hash = hash_enrollment_key(enrollment_key) if enrollment_key else None
             try:
-                conn.execute('''
+                # Ownership is checked by the UPDATE itself
+                updated = conn.execute('''
                     UPDATE courses 
                     SET title = ?, description = ?, syllabus = ?, category = ?, 
-                        max_students = ?, start_date = ?, end_date = ?, enrollment_key_hash = ?
-                    WHERE id = ?
+                        max_students = ?, start_date = ?, end_date = ?,
+                        enrollment_key_hash = COALESCE(?, enrollment_key_hash)
+                    WHERE id = ? AND instructor_id = ? AND is_active = 1
                 ''', (title, description, syllabus, category, max_students, 
-                     start_date, end_date, enrollment_key_hash, course_id))
-                
-                conn.commit()
-                conn.close()
+                     start_date, end_date, enrollment_key_hash, course_id, current_user.id)).rowcount
                 
-                flash(f'Course "{title}" updated successfully!', 'success')
-                return redirect(url_for('instructor_courses'))
+                if updated:
+                    conn.commit()
+                    invalidate_instructor_dashboard(current_user.id)
+                    invalidate_owned_course(course_id, current_user.id)
+                    conn.close()
+                    
+                    flash(f'Course "{title}" updated successfully!', 'success')
+                    return redirect(url_for('instructor_courses'))
                 
             except Exception as e:
                 conn.rollback()
-                conn.close()
                 flash('Error updating course. Please try again.', 'error')
-        
-        conn.close()
+    
+    # Verify course belongs to current instructor
+    course = conn.execute(COURSE_OWNED_SQL, (course_id, current_user.id)).fetchone()
+    conn.close()
+    
+    if not course:
+        flash('Course not found or access denied.', 'error')
+        return redirect(url_for('instructor_courses'))
     
     return render_template('instructor/edit_course.html', course=course)
 
@@ -1815,45 +2508,45 @@ def instructor_edit_course(course_id):
 @instructor_required
 def edit_instructor_profile():
     """Edit instructor profile"""
-    with db_lock:
-        conn = get_db_connection()
+    conn = get_db_connection()
+    
+    if request.method == 'POST':
+        full_name = request.form.get('full_name', '').strip()
+        email = request.form.get('email', '').strip()
+        bio = request.form.get('bio', '').strip()
         
-        if request.method == 'POST':
-            full_name = request.form.get('full_name', '').strip()
-            email = request.form.get('email', '').strip()
-            bio = request.form.get('bio', '').strip()
+        if not full_name or not email:
+            flash('Name and email are required.', 'error')
+            user = current_user
+            conn.close()
+            return render_template('instructor/edit_profile.html', user=user)
+        
+        try:
+            conn.execute('''
+                UPDATE users 
+                SET full_name = ?, email = ?, bio = ?
+                WHERE id = ?
+            ''', (full_name, email, bio, current_user.id))
             
-            if not full_name or not email:
-                flash('Name and email are required.', 'error')
-                user = current_user
-                conn.close()
-                return render_template('instructor/edit_profile.html', user=user)
+            conn.commit()
+            invalidate_user_cache(current_user.id)
             
-            try:
-                conn.execute('''
-                    UPDATE users 
-                    SET full_name = ?, email = ?, bio = ?
-                    WHERE id = ?
-                ''', (full_name, email, bio, current_user.id))
-                
-                conn.commit()
-                
-                # Update current_user session
-                current_user.full_name = full_name
-                current_user.email = email
-                current_user.bio = bio
-                
-                flash('Profile updated successfully!', 'success')
-                conn.close()
-                return redirect(url_for('instructor_courses'))
-                
-            except Exception as e:
-                conn.rollback()
-                flash('Error updating profile. Please try again.', 'error')
-                conn.close()
-                return render_template('instructor/edit_profile.html', user=current_user)
-        
-        conn.close()
+            # Update current_user session
+            current_user.full_name = full_name
+            current_user.email = email
+            current_user.bio = bio
+            
+            flash('Profile updated successfully!', 'success')
+            conn.close()
+            return redirect(url_for('instructor_courses'))
+            
+        except Exception as e:
+            conn.rollback()
+            flash('Error updating profile. Please try again.', 'error')
+            conn.close()
+            return render_template('instructor/edit_profile.html', user=current_user)
+    
+    conn.close()
     
     return render_template('instructor/edit_profile.html', user=current_user)
 
@@ -1861,137 +2554,139 @@ def edit_instructor_profile():
 @instructor_required 
 def instructor_enrollments():
     """View all student enrollments for instructor's courses"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        enrollments = conn.execute('''
-            SELECT e.*, u.full_name as student_name, u.email as student_email,
-                   c.title as course_title, c.course_code,
-                   COALESCE(e.progress_percentage, 0) as progress_percentage
-            FROM enrollments e
-            JOIN users u ON e.student_id = u.id
-            JOIN courses c ON e.course_id = c.id
-            WHERE c.instructor_id = ?
-            ORDER BY 
-                CASE e.status 
-                    WHEN 'pending' THEN 1
-                    WHEN 'approved' THEN 2
-                    WHEN 'rejected' THEN 3
-                END,
-                e.enrolled_at DESC
-        ''', (current_user.id,)).fetchall()
+    with db_connection() as conn:
+        limit = page_limit()
+        cursor = page_cursor(int, str, int)
+        if cursor:
+            status_rank, enrolled_at, enrollment_id = cursor
+            enrollments = conn.execute(INSTRUCTOR_ENROLLMENTS_AFTER_SQL, (
+                current_user.id, status_rank, status_rank, enrolled_at, enrollment_id, limit + 1
+            )).fetchall()
+        else:
+            enrollments = conn.execute(INSTRUCTOR_ENROLLMENTS_SQL, (current_user.id, limit + 1)).fetchall()
+        next_cursor = next_page_cursor(enrollments, limit, 'status_rank', 'enrolled_at', 'id')
+        enrollments = enrollments[:limit]
         
-        # Statistics
+        # Statistics, counted by SQLite rather than by scanning the rows in Python
+        counts = conn.execute(INSTRUCTOR_ENROLLMENT_COUNTS_SQL, (current_user.id,)).fetchone()
         stats = {
-            'total_enrollments': len(enrollments),
-            'pending_enrollments': len([e for e in enrollments if e['status'] == 'pending']),
-            'approved_enrollments': len([e for e in enrollments if e['status'] == 'approved']),
-            'rejected_enrollments': len([e for e in enrollments if e['status'] == 'rejected'])
+            'total_enrollments': counts['total'],
+            'pending_enrollments': counts['pending'],
+            'approved_enrollments': counts['approved'],
+            'rejected_enrollments': counts['rejected']
         }
-        
-        conn.close()
     
-    return render_template('instructor/enrollments.html', enrollments=enrollments, stats=stats)
+    return render_template('instructor/enrollments.html', enrollments=enrollments, stats=stats,
+                           next_cursor=next_cursor)
 
 @app.route('/instructor/enrollments/approve/<int:enrollment_id>', methods=['POST'])
 @instructor_required
 def instructor_approve_enrollment(enrollment_id):
     """Approve a student enrollment"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify enrollment belongs to instructor's course and is pending
-        enrollment = conn.execute('''
-            SELECT e.*, c.title as course_title, u.full_name as student_name
-            FROM enrollments e
-            JOIN courses c ON e.course_id = c.id
-            JOIN users u ON e.student_id = u.id
-            WHERE e.id = ? AND c.instructor_id = ? AND e.status = 'pending'
-        ''', (enrollment_id, current_user.id)).fetchone()
+    conn = get_db_connection()
+    
+    try:
+        # Approve the enrollment if it is still pending; the statement checks ownership and status itself
+        enrollment = conn.execute(APPROVE_ENROLLMENT_SQL, (enrollment_id, 'pending', current_user.id)).fetchone()
         
         if not enrollment:
             flash('Enrollment not found or already processed.', 'error')
             conn.close()
             return redirect(url_for('instructor_enrollments'))
         
-        try:
-            # Approve the enrollment
-            conn.execute('''
-                UPDATE enrollments 
-                SET status = 'approved', approved_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (enrollment_id,))
-            
-            # Create notification for the student
-            conn.execute('''
-                INSERT INTO notifications (user_id, title, message, type, related_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (enrollment['student_id'],
-                  'Enrollment Approved',
-                  f'Great news! Your enrollment in "{enrollment["course_title"]}" has been approved. You now have full access to the course.',
-                  'success',
-                  enrollment['course_id']))
-            
-            conn.commit()
-            conn.close()
-            
-            flash(f'Approved enrollment for {enrollment["student_name"]} in {enrollment["course_title"]}.', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            flash('Error approving enrollment. Please try again.', 'error')
+        # Create notification for the student
+        notify_many(conn, [(enrollment['student_id'],
+                            'Enrollment Approved',
+                            ENROLLMENT_APPROVED_MESSAGE.format(enrollment['course_title']),
+                            'success',
+                            enrollment['course_id'])])
+        
+        conn.commit()
+        invalidate_instructor_dashboard(current_user.id)
+        conn.close()
+        
+        flash(f'Approved enrollment for {enrollment["student_name"]} in {enrollment["course_title"]}.', 'success')
+        
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        flash('Error approving enrollment. Please try again.', 'error')
     
     return redirect(url_for('instructor_enrollments'))
 
+@app.route('/instructor/enrollments/bulk-approve', methods=['POST'])
+@instructor_required
+def instructor_bulk_approve_enrollments():
+    """Approve several pending enrollments at once (JSON body: {"ids": [...]})"""
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = [int(i) for i in data.get('ids', [])][:MAX_PAGE_SIZE]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'ids must be a list of enrollment ids'}), 400
+    
+    if not ids:
+        return jsonify({'success': False, 'error': 'No enrollments selected'}), 400
+    
+    conn = get_db_connection()
+    try:
+        approved = conn.execute(BULK_APPROVE_ENROLLMENTS_SQL, (app.json.dumps(ids), current_user.id)).fetchall()
+        
+        # Notify every approved student in the same transaction; the message only
+        # depends on the course, so it is formatted once per course, not per student
+        messages = {}
+        for row in approved:
+            if row['course_id'] not in messages:
+                messages[row['course_id']] = ENROLLMENT_APPROVED_MESSAGE.format(row['course_title'])
+        notify_many(conn, [(row['student_id'],
+                            'Enrollment Approved',
+                            messages[row['course_id']],
+                            'success',
+                            row['course_id']) for row in approved])
+        
+        conn.commit()
+        invalidate_instructor_dashboard(current_user.id)
+        conn.close()
+        
+        return jsonify({'success': True, 'approved': len(approved)})
+    
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        logging.error("Error bulk approving enrollments: %s", e)
+        return jsonify({'success': False, 'error': 'Error approving enrollments'}), 500
+
 @app.route('/instructor/enrollments/reject/<int:enrollment_id>', methods=['POST'])
 @instructor_required
 def instructor_reject_enrollment(enrollment_id):
     """Reject a student enrollment"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify enrollment belongs to instructor's course and is pending
-        enrollment = conn.execute('''
-            SELECT e.*, c.title as course_title, u.full_name as student_name
-            FROM enrollments e
-            JOIN courses c ON e.course_id = c.id
-            JOIN users u ON e.student_id = u.id
-            WHERE e.id = ? AND c.instructor_id = ? AND e.status = 'pending'
-        ''', (enrollment_id, current_user.id)).fetchone()
+    conn = get_db_connection()
+    
+    try:
+        # Reject the enrollment if it is still pending; the statement checks ownership and status itself
+        enrollment = conn.execute(SET_ENROLLMENT_STATUS_SQL, ('rejected', enrollment_id, 'pending', current_user.id)).fetchone()
         
         if not enrollment:
             flash('Enrollment not found or already processed.', 'error')
             conn.close()
             return redirect(url_for('instructor_enrollments'))
         
-        try:
-            # Reject the enrollment
-            conn.execute('''
-                UPDATE enrollments 
-                SET status = 'rejected'
-                WHERE id = ?
-            ''', (enrollment_id,))
-            
-            # Create notification for the student
-            conn.execute('''
-                INSERT INTO notifications (user_id, title, message, type, related_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (enrollment['student_id'],
-                  'Enrollment Not Approved',
-                  f'Your enrollment request for "{enrollment["course_title"]}" was not approved. Please contact the instructor for more information.',
-                  'warning',
-                  enrollment['course_id']))
-            
-            conn.commit()
-            conn.close()
-            
-            flash(f'Rejected enrollment for {enrollment["student_name"]} in {enrollment["course_title"]}.', 'warning')
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            flash('Error rejecting enrollment. Please try again.', 'error')
+        # Create notification for the student
+        notify_many(conn, [(enrollment['student_id'],
+                            'Enrollment Not Approved',
+                            f'Your enrollment request for "{enrollment["course_title"]}" was not approved. Please contact the instructor for more information.',
+                            'warning',
+                            enrollment['course_id'])])
+        
+        conn.commit()
+        invalidate_instructor_dashboard(current_user.id)
+        conn.close()
+        
+        flash(f'Rejected enrollment for {enrollment["student_name"]} in {enrollment["course_title"]}.', 'warning')
+        
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        flash('Error rejecting enrollment. Please try again.', 'error')
     
     return redirect(url_for('instructor_enrollments'))
 
@@ -2000,50 +2695,34 @@ def instructor_reject_enrollment(enrollment_id):
 @instructor_required
 def instructor_block_student(enrollment_id):
     """Block a student from a course"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify enrollment belongs to instructor's course and is approved
-        enrollment = conn.execute('''
-            SELECT e.*, c.title as course_title, u.full_name as student_name
-            FROM enrollments e
-            JOIN courses c ON e.course_id = c.id
-            JOIN users u ON e.student_id = u.id
-            WHERE e.id = ? AND c.instructor_id = ? AND e.status = 'approved'
-        ''', (enrollment_id, current_user.id)).fetchone()
+    conn = get_db_connection()
+    
+    try:
+        # Block the enrollment if it is approved; the statement checks ownership and status itself
+        enrollment = conn.execute(SET_ENROLLMENT_STATUS_SQL, ('blocked', enrollment_id, 'approved', current_user.id)).fetchone()
         
         if not enrollment:
             flash('Enrollment not found or cannot be blocked.', 'error')
             conn.close()
             return redirect(url_for('instructor_enrollments'))
         
-        try:
-            # Block the enrollment
-            conn.execute('''
-                UPDATE enrollments 
-                SET status = 'blocked'
-                WHERE id = ?
-            ''', (enrollment_id,))
-            
-            # Create notification for the student
-            conn.execute('''
-                INSERT INTO notifications (user_id, title, message, type, related_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (enrollment['student_id'],
-                  'Course Access Blocked',
-                  f'Your access to "{enrollment["course_title"]}" has been blocked by the instructor.',
-                  'warning',
-                  enrollment['course_id']))
-            
-            conn.commit()
-            conn.close()
-            
-            flash(f'Blocked {enrollment["student_name"]} from {enrollment["course_title"]}.', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            flash('Error blocking student. Please try again.', 'error')
+        # Create notification for the student
+        notify_many(conn, [(enrollment['student_id'],
+                            'Course Access Blocked',
+                            f'Your access to "{enrollment["course_title"]}" has been blocked by the instructor.',
+                            'warning',
+                            enrollment['course_id'])])
+        
+        conn.commit()
+        invalidate_instructor_dashboard(current_user.id)
+        conn.close()
+        
+        flash(f'Blocked {enrollment["student_name"]} from {enrollment["course_title"]}.', 'success')
+        
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        flash('Error blocking student. Please try again.', 'error')
     
     return redirect(url_for('instructor_enrollments'))
 
@@ -2052,46 +2731,34 @@ def instructor_block_student(enrollment_id):
 @instructor_required
 def instructor_remove_student(enrollment_id):
     """Remove a student from a course"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify enrollment belongs to instructor's course and is approved
-        enrollment = conn.execute('''
-            SELECT e.*, c.title as course_title, u.full_name as student_name
-            FROM enrollments e
-            JOIN courses c ON e.course_id = c.id
-            JOIN users u ON e.student_id = u.id
-            WHERE e.id = ? AND c.instructor_id = ? AND e.status = 'approved'
-        ''', (enrollment_id, current_user.id)).fetchone()
+    conn = get_db_connection()
+    
+    try:
+        # Delete the enrollment if it is approved; the statement checks ownership and status itself
+        enrollment = conn.execute(REMOVE_ENROLLMENT_SQL, (enrollment_id, 'approved', current_user.id)).fetchone()
         
         if not enrollment:
             flash('Enrollment not found or cannot be removed.', 'error')
             conn.close()
             return redirect(url_for('instructor_enrollments'))
         
-        try:
-            # Delete the enrollment
-            conn.execute('DELETE FROM enrollments WHERE id = ?', (enrollment_id,))
-            
-            # Create notification for the student
-            conn.execute('''
-                INSERT INTO notifications (user_id, title, message, type, related_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (enrollment['student_id'],
-                  'Removed from Course',
-                  f'You have been removed from "{enrollment["course_title"]}" by the instructor.',
-                  'warning',
-                  enrollment['course_id']))
-            
-            conn.commit()
-            conn.close()
-            
-            flash(f'Removed {enrollment["student_name"]} from {enrollment["course_title"]}.', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            flash('Error removing student. Please try again.', 'error')
+        # Create notification for the student
+        notify_many(conn, [(enrollment['student_id'],
+                            'Removed from Course',
+                            f'You have been removed from "{enrollment["course_title"]}" by the instructor.',
+                            'warning',
+                            enrollment['course_id'])])
+        
+        conn.commit()
+        invalidate_instructor_dashboard(current_user.id)
+        conn.close()
+        
+        flash(f'Removed {enrollment["student_name"]} from {enrollment["course_title"]}.', 'success')
+        
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        flash('Error removing student. Please try again.', 'error')
     
     return redirect(url_for('instructor_enrollments'))
 
@@ -2100,50 +2767,34 @@ def instructor_remove_student(enrollment_id):
 @instructor_required
 def instructor_unblock_student(enrollment_id):
     """Unblock a student from a course"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify enrollment belongs to instructor's course and is blocked
-        enrollment = conn.execute('''
-            SELECT e.*, c.title as course_title, u.full_name as student_name
-            FROM enrollments e
-            JOIN courses c ON e.course_id = c.id
-            JOIN users u ON e.student_id = u.id
-            WHERE e.id = ? AND c.instructor_id = ? AND e.status = 'blocked'
-        ''', (enrollment_id, current_user.id)).fetchone()
+    conn = get_db_connection()
+    
+    try:
+        # Unblock the enrollment if it is blocked; the statement checks ownership and status itself
+        enrollment = conn.execute(SET_ENROLLMENT_STATUS_SQL, ('approved', enrollment_id, 'blocked', current_user.id)).fetchone()
         
         if not enrollment:
             flash('Enrollment not found or cannot be unblocked.', 'error')
             conn.close()
             return redirect(url_for('instructor_enrollments'))
         
-        try:
-            # Unblock the enrollment
-            conn.execute('''
-                UPDATE enrollments 
-                SET status = 'approved'
-                WHERE id = ?
-            ''', (enrollment_id,))
-            
-            # Create notification for the student
-            conn.execute('''
-                INSERT INTO notifications (user_id, title, message, type, related_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (enrollment['student_id'],
-                  'Course Access Restored',
-                  f'Your access to "{enrollment["course_title"]}" has been restored by the instructor.',
-                  'success',
-                  enrollment['course_id']))
-            
-            conn.commit()
-            conn.close()
-            
-            flash(f'Unblocked {enrollment["student_name"]} for {enrollment["course_title"]}.', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            flash('Error unblocking student. Please try again.', 'error')
+        # Create notification for the student
+        notify_many(conn, [(enrollment['student_id'],
+                            'Course Access Restored',
+                            f'Your access to "{enrollment["course_title"]}" has been restored by the instructor.',
+                            'success',
+                            enrollment['course_id'])])
+        
+        conn.commit()
+        invalidate_instructor_dashboard(current_user.id)
+        conn.close()
+        
+        flash(f'Unblocked {enrollment["student_name"]} for {enrollment["course_title"]}.', 'success')
+        
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        flash('Error unblocking student. Please try again.', 'error')
     
     return redirect(url_for('instructor_enrollments'))
 
@@ -2152,18 +2803,12 @@ def instructor_unblock_student(enrollment_id):
 @instructor_required
 def instructor_course_students(course_id):
     """View and manage student progress for a course"""
-    with db_lock:
-        conn = get_db_connection()
-        
+    with db_connection() as conn:
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
-            conn.close()
             return redirect(url_for('instructor_courses'))
         
         # Get all students enrolled in the course with their progress
@@ -2183,8 +2828,6 @@ def instructor_course_students(course_id):
             WHERE e.course_id = ? AND e.status = 'approved'
             ORDER BY u.full_name
         ''', (course_id,)).fetchall()
-        
-        conn.close()
     
     return render_template('instructor/course_students.html', course=course, students=students)
 
@@ -2192,217 +2835,188 @@ def instructor_course_students(course_id):
 @instructor_required
 def instructor_set_progress_bulk(course_id):
     """Set manual progress override for all students in a course"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ?
-        ''', (course_id, current_user.id)).fetchone()
-        
-        if not course:
+    conn = get_db_connection()
+    
+    # Verify course belongs to instructor
+    course = owned_course(course_id, current_user.id)
+    
+    if not course:
+        conn.close()
+        return jsonify({'success': False, 'error': 'Course not found or access denied'}), 403
+    
+    # Get progress value from request
+    progress = request.form.get('progress')
+    
+    if progress is None or progress == '':
+        conn.close()
+        return jsonify({'success': False, 'error': 'Please enter a progress value'}), 400
+    
+    # Validate progress value
+    try:
+        progress = float(progress)
+        if progress < 0 or progress > 100:
             conn.close()
-            return jsonify({'success': False, 'error': 'Course not found or access denied'}), 403
-        
-        # Get progress value from request
-        progress = request.form.get('progress')
-        
-        if progress is None or progress == '':
-            conn.close()
-            return jsonify({'success': False, 'error': 'Please enter a progress value'}), 400
+            return jsonify({'success': False, 'error': 'Progress must be between 0 and 100'}), 400
+    except ValueError:
+        conn.close()
+        return jsonify({'success': False, 'error': 'Invalid progress value'}), 400
+    
+    try:
+        # Update progress for all approved students in one statement
+        students = conn.execute('''
+            UPDATE enrollments
+            SET manual_progress_override = ?, progress_percentage = ?
+            WHERE course_id = ? AND status = 'approved'
+            RETURNING student_id
+        ''', (progress, progress, course_id)).fetchall()
+        
+        # Notify every student with one batched insert in the same transaction
+        send_notifications_bulk(
+            [student['student_id'] for student in students],
+            'Course Progress Updated',
+            f'Your instructor has updated your progress in "{course["title"]}" to {progress:.0f}%',
+            'info',
+            course_id,
+            conn=conn
+        )
         
-        # Validate progress value
-        try:
-            progress = float(progress)
-            if progress < 0 or progress > 100:
-                conn.close()
-                return jsonify({'success': False, 'error': 'Progress must be between 0 and 100'}), 400
-        except ValueError:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Invalid progress value'}), 400
+        conn.commit()
+        conn.close()
         
-        # Get all students in the course
-        try:
-            students = conn.execute('''
-                SELECT e.student_id, u.full_name
-                FROM enrollments e
-                JOIN users u ON e.student_id = u.id
-                WHERE e.course_id = ? AND e.status = 'approved'
-            ''', (course_id,)).fetchall()
-            
-            # Update progress for all students
-            for student in students:
-                conn.execute('''
-                    UPDATE enrollments
-                    SET manual_progress_override = ?, progress_percentage = ?
-                    WHERE course_id = ? AND student_id = ?
-                ''', (progress, progress, course_id, student['student_id']))
-                
-                # Send notification to each student
-                send_notification(
-                    student['student_id'],
-                    'Course Progress Updated',
-                    f'Your instructor has updated your progress in "{course["title"]}" to {progress:.0f}%',
-                    'info',
-                    course_id
-                )
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({
-                'success': True, 
-                'message': f'Progress set to {progress:.0f}% for all {len(students)} students',
-                'count': len(students)
-            })
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({
+            'success': True, 
+            'message': f'Progress set to {progress:.0f}% for all {len(students)} students',
+            'count': len(students)
+        })
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/instructor/courses/<int:course_id>/students/<int:student_id>/set-progress', methods=['POST'])
 @instructor_required
 def instructor_set_student_progress(course_id, student_id):
     """Set manual progress override for a student"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ?
-        ''', (course_id, current_user.id)).fetchone()
-        
-        if not course:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Course not found or access denied'}), 403
-        
-        # Get progress value from request
-        progress = request.form.get('progress')
-        
-        if progress is None or progress == '':
-            # Clear manual override (reset to automatic calculation)
-            try:
-                conn.execute('''
-                    UPDATE enrollments
-                    SET manual_progress_override = NULL
-                    WHERE course_id = ? AND student_id = ?
-                ''', (course_id, student_id))
-                conn.commit()
-                
-                # Immediately recalculate automatic progress to get current quiz-based progress
-                auto_progress = update_student_progress(conn, student_id, course_id)
-                
-                # Get student info for notification
-                student = conn.execute('SELECT full_name FROM users WHERE id = ?', (student_id,)).fetchone()
-                
-                # Send notification to student
-                send_notification(
-                    student_id,
-                    'Course Progress Updated',
-                    f'Your progress in "{course["title"]}" has been reset to automatic tracking ({auto_progress:.0f}%)',
-                    'info',
-                    course_id
-                )
-                
-                conn.close()
-                return jsonify({
-                    'success': True, 
-                    'message': f'Manual progress cleared. Automatic progress is {auto_progress:.0f}%',
-                    'progress': auto_progress,
-                    'is_manual': False
-                })
-            except Exception as e:
-                conn.rollback()
-                conn.close()
-                return jsonify({'success': False, 'error': str(e)}), 500
-        
-        # Validate progress value
-        try:
-            progress = float(progress)
-            if progress < 0 or progress > 100:
-                conn.close()
-                return jsonify({'success': False, 'error': 'Progress must be between 0 and 100'}), 400
-        except ValueError:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Invalid progress value'}), 400
-        
-        # Set manual progress override
+    conn = get_db_connection()
+    
+    # Verify course belongs to instructor
+    course = owned_course(course_id, current_user.id)
+    
+    if not course:
+        conn.close()
+        return jsonify({'success': False, 'error': 'Course not found or access denied'}), 403
+    
+    # Get progress value from request
+    progress = request.form.get('progress')
+    
+    if progress is None or progress == '':
+        # Clear manual override (reset to automatic calculation)
         try:
-            conn.execute('''
+            # The stored automatic value is the last one computed; answer with it and let
+            # the background task recompute it from quiz submissions and notify the student
+            enrollment = conn.execute('''
                 UPDATE enrollments
-                SET manual_progress_override = ?, progress_percentage = ?
+                SET manual_progress_override = NULL
                 WHERE course_id = ? AND student_id = ?
-            ''', (progress, progress, course_id, student_id))
-            
-            # Get student info for notification
-            student = conn.execute('SELECT full_name FROM users WHERE id = ?', (student_id,)).fetchone()
-            
-            # Send notification to student
-            send_notification(
-                student_id,
-                'Course Progress Updated',
-                f'Your instructor has updated your progress in "{course["title"]}" to {progress:.0f}%',
-                'info',
-                course_id
-            )
-            
+                RETURNING progress_percentage
+            ''', (course_id, student_id)).fetchone()
             conn.commit()
             conn.close()
             
+            auto_progress = (enrollment['progress_percentage'] or 0) if enrollment else 0
+            if enrollment:
+                queue_progress_recompute(student_id, course_id, course['title'], auto_progress)
+            
             return jsonify({
                 'success': True, 
-                'message': f'Progress set to {progress:.0f}% for {student["full_name"]}',
-                'progress': progress,
-                'is_manual': True
+                'message': 'Manual progress cleared. Automatic progress is being recalculated.',
+                'progress': auto_progress,
+                'is_manual': False
             })
         except Exception as e:
             conn.rollback()
             conn.close()
             return jsonify({'success': False, 'error': str(e)}), 500
+    
+    # Validate progress value
+    try:
+        progress = float(progress)
+        if progress < 0 or progress > 100:
+            conn.close()
+            return jsonify({'success': False, 'error': 'Progress must be between 0 and 100'}), 400
+    except ValueError:
+        conn.close()
+        return jsonify({'success': False, 'error': 'Invalid progress value'}), 400
+    
+    # Set manual progress override
+    try:
+        # RETURNING hands back the student's name for the response in the same statement
+        student = conn.execute('''
+            UPDATE enrollments
+            SET manual_progress_override = ?, progress_percentage = ?
+            WHERE course_id = ? AND student_id = ?
+            RETURNING (SELECT full_name FROM users WHERE id = enrollments.student_id) AS full_name
+        ''', (progress, progress, course_id, student_id)).fetchone()
+        
+        conn.commit()
+        conn.close()
+        
+        if not student:
+            return jsonify({'success': False, 'error': 'Student is not enrolled in this course'}), 404
+        
+        # Notify the student in the background
+        queue_notification(
+            student_id,
+            'Course Progress Updated',
+            f'Your instructor has updated your progress in "{course["title"]}" to {progress:.0f}%',
+            'info',
+            course_id
+        )
+        
+        return jsonify({
+            'success': True, 
+            'message': f'Progress set to {progress:.0f}% for {student["full_name"]}',
+            'progress': progress,
+            'is_manual': True
+        })
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 # COURSE CONTENT MANAGEMENT ROUTES
 @app.route('/instructor/courses/<int:course_id>/content')
 @instructor_required
 def instructor_course_content(course_id):
     """Manage course content - videos, notes, resources"""
-    with db_lock:
-        conn = get_db_connection()
-        
+    with db_connection() as conn:
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
-            conn.close()
             return redirect(url_for('instructor_courses'))
         
         # Get course resources
         resources = conn.execute('''
-            SELECT * FROM course_resources 
+            SELECT title, description, file_path, file_type, upload_date FROM course_resources 
             WHERE course_id = ?
             ORDER BY upload_date DESC
         ''', (course_id,)).fetchall()
         
         # Get meeting links
         meeting_links = conn.execute('''
-            SELECT * FROM course_meeting_links 
+            SELECT id, title, meeting_link, description, scheduled_time FROM course_meeting_links 
             WHERE course_id = ? AND is_active = 1
             ORDER BY created_at DESC
         ''', (course_id,)).fetchall()
         
         # Get video playlist
         video_playlist = conn.execute('''
-            SELECT * FROM course_video_playlists 
+            SELECT id, title, video_url, description, duration, notes_file_path FROM course_video_playlists 
             WHERE course_id = ? AND is_active = 1
             ORDER BY order_index ASC
         ''', (course_id,)).fetchall()
-        
-        conn.close()
     
     return render_template('instructor/course_content.html', course=course, resources=resources, 
                          meeting_links=meeting_links, video_playlist=video_playlist)
@@ -2411,47 +3025,43 @@ def instructor_course_content(course_id):
 @instructor_required
 def instructor_upload_content(course_id):
     """Upload course content - videos, notes, resources"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
-        
-        if not course:
-            flash('Course not found or access denied.', 'error')
-            conn.close()
-            return redirect(url_for('instructor_courses'))
-        
-        title = request.form.get('title', '').strip()
-        description = request.form.get('description', '').strip()
-        content_type = request.form.get('content_type', 'document')
-        
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and file.filename:
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'resources', f"{course_id}_{uuid.uuid4().hex}_{filename}")
-                file.save(file_path)
-                
-                try:
-                    conn.execute('''
-                        INSERT INTO course_resources (course_id, title, description, file_path, file_type, uploaded_by)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (course_id, title, description, file_path, content_type, current_user.id))
-                    
-                    conn.commit()
-                    flash(f'Content "{title}" uploaded successfully!', 'success')
-                    
-                except Exception as e:
-                    conn.rollback()
-                    flash('Error uploading content. Please try again.', 'error')
-        else:
-            flash('No file selected for upload.', 'error')
-        
+    conn = get_db_connection()
+    
+    # Verify course belongs to instructor
+    course = owned_course(course_id, current_user.id)
+    
+    if not course:
+        flash('Course not found or access denied.', 'error')
         conn.close()
+        return redirect(url_for('instructor_courses'))
+    
+    title = request.form.get('title', '').strip()
+    description = request.form.get('description', '').strip()
+    content_type = request.form.get('content_type', 'document')
+    
+    if 'file' in request.files:
+        file = request.files['file']
+        if file and file.filename:
+            filename = secure_filename(file.filename)
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'resources', f"{course_id}_{uuid.uuid4().hex}_{filename}")
+            file.save(file_path)
+            
+            try:
+                conn.execute('''
+                    INSERT INTO course_resources (course_id, title, description, file_path, file_type, uploaded_by)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (course_id, title, description, file_path, content_type, current_user.id))
+                
+                conn.commit()
+                flash(f'Content "{title}" uploaded successfully!', 'success')
+                
+            except Exception as e:
+                conn.rollback()
+                flash('Error uploading content. Please try again.', 'error')
+    else:
+        flash('No file selected for upload.', 'error')
+    
+    conn.close()
     
     return redirect(url_for('instructor_course_content', course_id=course_id))
 
@@ -2460,44 +3070,39 @@ def instructor_upload_content(course_id):
 @instructor_required
 def instructor_add_meeting_link(course_id):
     """Add a meeting link to the course"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
-        
-        if not course:
-            flash('Course not found or access denied.', 'error')
+    title = request.form.get('title', '').strip()
+    meeting_link = request.form.get('meeting_link', '').strip()
+    description = request.form.get('description', '').strip()
+    scheduled_time = request.form.get('scheduled_time') or None
+    
+    if not title or not meeting_link:
+        flash('Meeting title and link are required.', 'error')
+        return redirect(url_for('instructor_course_content', course_id=course_id))
+    
+    conn = get_db_connection()
+    try:
+        # Ownership is checked by the INSERT itself, so no row inserted means not ours
+        cur = conn.execute('''
+            INSERT INTO course_meeting_links (course_id, title, meeting_link, description, scheduled_time, created_by)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE EXISTS (SELECT 1 FROM courses WHERE id = ? AND instructor_id = ? AND is_active = 1)
+        ''', (course_id, title, meeting_link, description, scheduled_time, current_user.id,
+              course_id, current_user.id))
+        
+        if cur.rowcount == 0:
+            conn.rollback()
             conn.close()
+            flash('Course not found or access denied.', 'error')
             return redirect(url_for('instructor_courses'))
         
-        title = request.form.get('title', '').strip()
-        meeting_link = request.form.get('meeting_link', '').strip()
-        description = request.form.get('description', '').strip()
-        scheduled_time = request.form.get('scheduled_time') or None
-        
-        if not title or not meeting_link:
-            flash('Meeting title and link are required.', 'error')
-            conn.close()
-            return redirect(url_for('instructor_course_content', course_id=course_id))
-        
-        try:
-            conn.execute('''
-                INSERT INTO course_meeting_links (course_id, title, meeting_link, description, scheduled_time, created_by)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (course_id, title, meeting_link, description, scheduled_time, current_user.id))
-            
-            conn.commit()
-            flash(f'Meeting link "{title}" added successfully!', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            flash('Error adding meeting link. Please try again.', 'error')
+        conn.commit()
+        flash(f'Meeting link "{title}" added successfully!', 'success')
         
-        conn.close()
+    except Exception as e:
+        conn.rollback()
+        flash('Error adding meeting link. Please try again.', 'error')
+    
+    conn.close()
     
     return redirect(url_for('instructor_course_content', course_id=course_id))
 
@@ -2505,23 +3110,25 @@ def instructor_add_meeting_link(course_id):
 @instructor_required
 def instructor_delete_meeting_link(course_id, link_id):
     """Delete a meeting link"""
-    with db_lock:
-        conn = get_db_connection()
+    conn = get_db_connection()
+    
+    try:
+        cur = conn.execute('''
+            DELETE FROM course_meeting_links 
+            WHERE id = ? AND course_id = ? AND created_by = ?
+        ''', (link_id, course_id, current_user.id))
         
-        try:
-            conn.execute('''
-                DELETE FROM course_meeting_links 
-                WHERE id = ? AND course_id = ? AND created_by = ?
-            ''', (link_id, course_id, current_user.id))
-            
-            conn.commit()
+        conn.commit()
+        if cur.rowcount:
             flash('Meeting link deleted successfully!', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            flash('Error deleting meeting link. Please try again.', 'error')
+        else:
+            flash('Meeting link not found or access denied.', 'error')
         
-        conn.close()
+    except Exception as e:
+        conn.rollback()
+        flash('Error deleting meeting link. Please try again.', 'error')
+    
+    conn.close()
     
     return redirect(url_for('instructor_course_content', course_id=course_id))
 
@@ -2530,242 +3137,200 @@ def instructor_delete_meeting_link(course_id, link_id):
 @instructor_required
 def instructor_add_video_playlist(course_id):
     """Add a video to the course playlist"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
-        
-        if not course:
-            flash('Course not found or access denied.', 'error')
-            conn.close()
-            return redirect(url_for('instructor_courses'))
-        
-        title = request.form.get('title', '').strip()
-        video_url = request.form.get('video_url', '').strip()
-        description = request.form.get('description', '').strip()
-        duration = request.form.get('duration', '').strip()
-        thumbnail_url = request.form.get('thumbnail_url', '').strip()
-        
-        if not title or not video_url:
-            flash('Video title and URL are required.', 'error')
-            conn.close()
-            return redirect(url_for('instructor_course_content', course_id=course_id))
-        
-        # Handle notes file upload with validation
-        notes_file_path = None
-        ALLOWED_NOTES_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'ppt', 'pptx', 'odt', 'rtf'}
-        MAX_NOTES_SIZE = 50 * 1024 * 1024  # 50MB
-        
-        if 'notes_file' in request.files:
-            notes_file = request.files['notes_file']
-            if notes_file and notes_file.filename:
-                filename = secure_filename(notes_file.filename)
-                file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-                
-                # Validate file extension
-                if file_ext not in ALLOWED_NOTES_EXTENSIONS:
-                    flash(f'Invalid file type. Allowed: {", ".join(ALLOWED_NOTES_EXTENSIONS)}', 'error')
-                    conn.close()
-                    return redirect(url_for('instructor_course_content', course_id=course_id))
-                
-                # Check file size
-                notes_file.seek(0, 2)  # Seek to end
-                file_size = notes_file.tell()
-                notes_file.seek(0)  # Reset to beginning
-                
-                if file_size > MAX_NOTES_SIZE:
-                    flash('Notes file too large. Maximum size is 50MB.', 'error')
-                    conn.close()
-                    return redirect(url_for('instructor_course_content', course_id=course_id))
-                
-                # Save the file
-                notes_file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'resources', f"notes_{course_id}_{uuid.uuid4().hex}_{filename}")
-                os.makedirs(os.path.dirname(notes_file_path), exist_ok=True)
-                notes_file.save(notes_file_path)
-        
-        try:
-            # Get the next order index
-            max_order = conn.execute('''
-                SELECT MAX(order_index) FROM course_video_playlists 
-                WHERE course_id = ?
-            ''', (course_id,)).fetchone()[0]
-            
-            next_order = (max_order or 0) + 1
-            
-            conn.execute('''
-                INSERT INTO course_video_playlists (course_id, title, video_url, description, duration, thumbnail_url, notes_file_path, order_index, created_by)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (course_id, title, video_url, description, duration, thumbnail_url, notes_file_path, next_order, current_user.id))
-            
-            conn.commit()
-            flash(f'Video "{title}" added to playlist successfully!', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            flash('Error adding video to playlist. Please try again.', 'error')
-        
+    conn = get_db_connection()
+    
+    # Verify course belongs to instructor
+    course = owned_course(course_id, current_user.id)
+    
+    if not course:
+        flash('Course not found or access denied.', 'error')
         conn.close()
+        return redirect(url_for('instructor_courses'))
     
-    return redirect(url_for('instructor_course_content', course_id=course_id))
-
-@app.route('/download-notes/<int:video_id>')
-@login_required
-def download_video_notes(video_id):
-    """Download notes for a video"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Get video details
-        video = conn.execute('''
-            SELECT v.*, c.instructor_id 
-            FROM course_video_playlists v
-            JOIN courses c ON v.course_id = c.id
-            WHERE v.id = ? AND v.is_active = 1
-        ''', (video_id,)).fetchone()
-        
-        if not video or not video['notes_file_path']:
-            conn.close()
-            flash('Notes not found.', 'error')
-            return redirect(url_for('dashboard'))
-        
-        # Check if user has access (instructor or enrolled student)
-        if current_user.is_student():
-            enrollment = conn.execute('''
-                SELECT * FROM enrollments 
-                WHERE student_id = ? AND course_id = ? AND status = 'approved'
-            ''', (current_user.id, video['course_id'])).fetchone()
+    title = request.form.get('title', '').strip()
+    video_url = request.form.get('video_url', '').strip()
+    description = request.form.get('description', '').strip()
+    duration = request.form.get('duration', '').strip()
+    thumbnail_url = request.form.get('thumbnail_url', '').strip()
+    
+    if not title or not video_url:
+        flash('Video title and URL are required.', 'error')
+        conn.close()
+        return redirect(url_for('instructor_course_content', course_id=course_id))
+    
+    # Handle notes file upload with validation
+    notes_file_path = None
+    ALLOWED_NOTES_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'ppt', 'pptx', 'odt', 'rtf'}
+    MAX_NOTES_SIZE = 50 * 1024 * 1024  # 50MB
+    
+    if 'notes_file' in request.files:
+        notes_file = request.files['notes_file']
+        if notes_file and notes_file.filename:
+            filename = secure_filename(notes_file.filename)
+            file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            
+            # Validate file extension
+            if file_ext not in ALLOWED_NOTES_EXTENSIONS:
+                flash(f'Invalid file type. Allowed: {", ".join(ALLOWED_NOTES_EXTENSIONS)}', 'error')
+                conn.close()
+                return redirect(url_for('instructor_course_content', course_id=course_id))
             
-            if not enrollment:
+            # Check file size: reject from the request header when it already says
+            # too much, otherwise enforce the limit while streaming to disk
+            if request.content_length and request.content_length > MAX_NOTES_SIZE + 64 * 1024:
+                flash('Notes file too large. Maximum size is 50MB.', 'error')
                 conn.close()
-                flash('Access denied.', 'error')
-                return redirect(url_for('dashboard'))
-        elif current_user.is_instructor() and video['instructor_id'] != current_user.id:
-            conn.close()
-            flash('Access denied.', 'error')
-            return redirect(url_for('dashboard'))
-        
-        stored_path = video['notes_file_path']
-        conn.close()
-        
-        # Try to find the actual file - handle incorrect paths from different systems
-        file_path = None
-        filename = os.path.basename(stored_path)
-        
-        # Try multiple possible locations
-        possible_paths = [
-            stored_path,  # Original path
-            os.path.join(app.config['UPLOAD_FOLDER'], 'resources', filename),  # Current system path
-            os.path.join('sir_rafique', 'uploads', 'resources', filename),  # Relative path
-        ]
+                return redirect(url_for('instructor_course_content', course_id=course_id))
+            
+            # Save the file
+            notes_file_path = f"resources/notes_{course_id}_{uuid.uuid4().hex}_{filename}"
+            if not save_upload_stream(notes_file, upload_file_path(notes_file_path), MAX_NOTES_SIZE):
+                flash('Notes file too large. Maximum size is 50MB.', 'error')
+                conn.close()
+                return redirect(url_for('instructor_course_content', course_id=course_id))
+    
+    try:
+        # Append at the next order index; reading MAX(order_index) inside the
+        # INSERT keeps two concurrent adds from picking the same position
+        conn.execute('''
+            INSERT INTO course_video_playlists (course_id, title, video_url, description, duration, thumbnail_url, notes_file_path, order_index, created_by)
+            SELECT ?, ?, ?, ?, ?, ?, ?, COALESCE(MAX(order_index), 0) + 1, ?
+            FROM course_video_playlists
+            WHERE course_id = ?
+        ''', (course_id, title, video_url, description, duration, thumbnail_url, notes_file_path, current_user.id, course_id))
         
-        for path in possible_paths:
-            if os.path.exists(path):
-                file_path = path
-                break
+        conn.commit()
+        flash(f'Video "{title}" added to playlist successfully!', 'success')
         
-        if not file_path:
-            logging.error(f"Notes file not found. Tried paths: {possible_paths}")
-            flash('Notes file not found on server. Please contact your instructor.', 'error')
-            return redirect(url_for('dashboard'))
+    except Exception as e:
+        conn.rollback()
+        flash('Error adding video to playlist. Please try again.', 'error')
+    
+    conn.close()
+    
+    return redirect(url_for('instructor_course_content', course_id=course_id))
+
+def upload_file_path(stored_path):
+    """Absolute path of a file stored relative to UPLOAD_FOLDER ("subdir/name")"""
+    return os.path.join(app.config['UPLOAD_FOLDER'], *stored_path.split('/'))
+
+@app.route('/download-notes/<int:video_id>')
+@login_required
+def download_video_notes(video_id):
+    """Download notes for a video"""
+    # Get the notes path only if the user may see it: the course instructor, a
+    # student approved in the course, or an admin
+    with db_connection() as conn:
+        video = conn.execute('''
+            SELECT v.notes_file_path
+            FROM course_video_playlists v
+            JOIN courses c ON v.course_id = c.id
+            LEFT JOIN enrollments e ON e.course_id = c.id AND e.student_id = ? AND e.status = 'approved'
+            WHERE v.id = ? AND v.is_active = 1
+              AND (c.instructor_id = ? OR e.id IS NOT NULL OR ?)
+        ''', (current_user.id, video_id, current_user.id, current_user.is_admin())).fetchone()
+    
+    if not video or not video['notes_file_path']:
+        flash('Notes not found or access denied.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    file_path = upload_file_path(video['notes_file_path'])
+    if not os.path.isfile(file_path):
+        logging.error("Notes file not found: %s", file_path)
+        flash('Notes file not found on server. Please contact your instructor.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    # Send the file
+    try:
+        filename = os.path.basename(file_path)
+        
+        # Get original extension for proper MIME type
+        file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'pdf'
+        mime_types = {
+            'pdf': 'application/pdf',
+            'doc': 'application/msword',
+            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+            'txt': 'text/plain',
+            'ppt': 'application/vnd.ms-powerpoint',
+            'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+        }
         
-        # Send the file
-        try:
-            directory = os.path.dirname(file_path)
-            filename = os.path.basename(file_path)
-            
-            # Get original extension for proper MIME type
-            file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'pdf'
-            mime_types = {
-                'pdf': 'application/pdf',
-                'doc': 'application/msword',
-                'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                'txt': 'text/plain',
-                'ppt': 'application/vnd.ms-powerpoint',
-                'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
-            }
-            
-            return send_from_directory(
-                directory, 
-                filename, 
-                as_attachment=True,
-                mimetype=mime_types.get(file_ext, 'application/octet-stream')
-            )
-        except Exception as e:
-            logging.error(f"Error downloading notes: {e}")
-            flash('Unable to download notes. Please try again.', 'error')
-            return redirect(url_for('dashboard'))
+        # Conditional send: repeat downloads revalidate with a 304 and
+        # interrupted ones resume with a Range request
+        return send_upload_file(
+            file_path,
+            as_attachment=True,
+            download_name=filename,
+            mimetype=mime_types.get(file_ext, 'application/octet-stream')
+        )
+    except Exception as e:
+        logging.error("Error downloading notes: %s", e)
+        flash('Unable to download notes. Please try again.', 'error')
+        return redirect(url_for('dashboard'))
 
 @app.route('/instructor/courses/<int:course_id>/content/video/<int:video_id>/edit', methods=['POST'])
 @instructor_required
 def instructor_edit_video_playlist(course_id, video_id):
     """Edit a video in playlist"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Verify video belongs to instructor's course
-        video = conn.execute('''
-            SELECT v.* FROM course_video_playlists v
-            JOIN courses c ON v.course_id = c.id
-            WHERE v.id = ? AND v.course_id = ? AND c.instructor_id = ? AND v.is_active = 1
-        ''', (video_id, course_id, current_user.id)).fetchone()
+    title = request.form.get('title', '').strip()
+    video_url = request.form.get('video_url', '').strip()
+    duration = request.form.get('duration', '').strip()
+    description = request.form.get('description', '').strip()
+    
+    if not title or not video_url:
+        return jsonify({'success': False, 'message': 'Title and URL are required.'}), 400
+    
+    conn = get_db_connection()
+    
+    try:
+        # Ownership is part of the WHERE clause, so no row updated means not found or not ours
+        cur = conn.execute('''
+            UPDATE course_video_playlists
+            SET title = ?, video_url = ?, duration = ?, description = ?
+            WHERE id = ? AND course_id = ? AND is_active = 1
+            AND EXISTS (SELECT 1 FROM courses WHERE id = ? AND instructor_id = ?)
+        ''', (title, video_url, duration or None, description or None, video_id, course_id,
+              course_id, current_user.id))
         
-        if not video:
+        if cur.rowcount == 0:
+            conn.rollback()
             conn.close()
             return jsonify({'success': False, 'message': 'Video not found or access denied.'}), 404
         
-        try:
-            title = request.form.get('title', '').strip()
-            video_url = request.form.get('video_url', '').strip()
-            duration = request.form.get('duration', '').strip()
-            description = request.form.get('description', '').strip()
-            
-            if not title or not video_url:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Title and URL are required.'}), 400
-            
-            # Update the video
-            conn.execute('''
-                UPDATE course_video_playlists
-                SET title = ?, video_url = ?, duration = ?, description = ?
-                WHERE id = ? AND course_id = ? AND is_active = 1
-            ''', (title, video_url, duration or None, description or None, video_id, course_id))
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({'success': True, 'message': 'Video updated successfully!'}), 200
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            logging.error(f"Error updating video: {e}")
-            return jsonify({'success': False, 'message': 'Error updating video. Please try again.'}), 500
+        conn.commit()
+        conn.close()
+        
+        return jsonify({'success': True, 'message': 'Video updated successfully!'}), 200
+        
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        logging.error("Error updating video: %s", e)
+        return jsonify({'success': False, 'message': 'Error updating video. Please try again.'}), 500
 
 @app.route('/instructor/courses/<int:course_id>/video-playlist/<int:video_id>/delete', methods=['POST'])
 @instructor_required
 def instructor_delete_video_playlist(course_id, video_id):
     """Delete a video from playlist"""
-    with db_lock:
-        conn = get_db_connection()
+    conn = get_db_connection()
+    
+    try:
+        cur = conn.execute('''
+            DELETE FROM course_video_playlists 
+            WHERE id = ? AND course_id = ? AND created_by = ?
+        ''', (video_id, course_id, current_user.id))
         
-        try:
-            conn.execute('''
-                DELETE FROM course_video_playlists 
-                WHERE id = ? AND course_id = ? AND created_by = ?
-            ''', (video_id, course_id, current_user.id))
-            
-            conn.commit()
+        conn.commit()
+        if cur.rowcount:
             flash('Video deleted from playlist successfully!', 'success')
-            
-        except Exception as e:
-            conn.rollback()
-            flash('Error deleting video. Please try again.', 'error')
+        else:
+            flash('Video not found or access denied.', 'error')
         
-        conn.close()
+    except Exception as e:
+        conn.rollback()
+        flash('Error deleting video. Please try again.', 'error')
+    
+    conn.close()
     
     return redirect(url_for('instructor_course_content', course_id=course_id))
 
@@ -2778,16 +3343,14 @@ def student_my_playlist():
         flash('Access denied.', 'error')
         return redirect(url_for('dashboard'))
     
-    with db_lock:
-        conn = get_db_connection()
-        rows = conn.execute('''
-            SELECT * FROM student_video_playlists 
+    with db_connection() as conn:
+        # Only the columns the player and its tojson payload use; the Rows go to the
+        # template as-is (RowJSONProvider serializes them) without a per-row dict copy
+        videos = conn.execute('''
+            SELECT id, title, video_url, description FROM student_video_playlists 
             WHERE student_id = ? AND is_active = 1
             ORDER BY order_index ASC
         ''', (current_user.id,)).fetchall()
-        # Convert Row objects to dictionaries for JSON serialization
-        videos = [dict(row) for row in rows]
-        conn.close()
     
     return render_template('student/my_playlist.html', videos=videos)
 
@@ -2798,34 +3361,39 @@ def student_add_playlist_video():
     if not current_user.is_student():
         return jsonify({'success': False, 'message': 'Access denied.'}), 403
     
-    with db_lock:
-        conn = get_db_connection()
-        
-        title = request.form.get('title', '').strip()
-        video_url = request.form.get('video_url', '').strip()
-        description = request.form.get('description', '').strip()
-        duration = request.form.get('duration', '').strip()
+    conn = get_db_connection()
+    
+    title = request.form.get('title', '').strip()
+    video_url = request.form.get('video_url', '').strip()
+    description = request.form.get('description', '').strip()
+    duration = request.form.get('duration', '').strip()
+    
+    if not title or not video_url:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Title and URL are required.'}), 400
+    
+    try:
+        # MAX over the active rows reads the tip of idx_svp_student_active_order instead
+        # of counting the whole playlist; the single INSERT keeps the read and write atomic
+        conn.execute('''
+            INSERT INTO student_video_playlists 
+            (student_id, title, video_url, description, duration, order_index)
+            VALUES (?, ?, ?, ?, ?, (
+                SELECT COALESCE(MAX(order_index), -1) + 1
+                FROM student_video_playlists
+                WHERE student_id = ? AND is_active = 1
+            ))
+        ''', (current_user.id, title, video_url, description or None, duration or None, current_user.id))
         
-        if not title or not video_url:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Title and URL are required.'}), 400
+        conn.commit()
+        conn.close()
         
-        try:
-            conn.execute('''
-                INSERT INTO student_video_playlists 
-                (student_id, title, video_url, description, duration, order_index)
-                VALUES (?, ?, ?, ?, ?, (SELECT COUNT(*) FROM student_video_playlists WHERE student_id = ?))
-            ''', (current_user.id, title, video_url, description or None, duration or None, current_user.id))
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({'success': True, 'message': 'Video added to playlist!'}), 200
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            logging.error(f"Error adding playlist video: {e}")
-            return jsonify({'success': False, 'message': 'Error adding video. Please try again.'}), 500
+        return jsonify({'success': True, 'message': 'Video added to playlist!'}), 200
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        logging.error("Error adding playlist video: %s", e)
+        return jsonify({'success': False, 'message': 'Error adding video. Please try again.'}), 500
 
 @app.route('/student/playlist/<int:video_id>/edit', methods=['POST'])
 @login_required
@@ -2834,43 +3402,37 @@ def student_edit_playlist_video(video_id):
     if not current_user.is_student():
         return jsonify({'success': False, 'message': 'Access denied.'}), 403
     
-    with db_lock:
-        conn = get_db_connection()
-        
-        video = conn.execute('''
-            SELECT * FROM student_video_playlists 
+    title = request.form.get('title', '').strip()
+    video_url = request.form.get('video_url', '').strip()
+    description = request.form.get('description', '').strip()
+    duration = request.form.get('duration', '').strip()
+    
+    if not title or not video_url:
+        return jsonify({'success': False, 'message': 'Title and URL are required.'}), 400
+    
+    conn = get_db_connection()
+    
+    try:
+        cur = conn.execute('''
+            UPDATE student_video_playlists
+            SET title = ?, video_url = ?, description = ?, duration = ?
             WHERE id = ? AND student_id = ? AND is_active = 1
-        ''', (video_id, current_user.id)).fetchone()
+        ''', (title, video_url, description or None, duration or None, video_id, current_user.id))
         
-        if not video:
+        if cur.rowcount == 0:
+            conn.rollback()
             conn.close()
             return jsonify({'success': False, 'message': 'Video not found.'}), 404
         
-        title = request.form.get('title', '').strip()
-        video_url = request.form.get('video_url', '').strip()
-        description = request.form.get('description', '').strip()
-        duration = request.form.get('duration', '').strip()
-        
-        if not title or not video_url:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Title and URL are required.'}), 400
+        conn.commit()
+        conn.close()
         
-        try:
-            conn.execute('''
-                UPDATE student_video_playlists
-                SET title = ?, video_url = ?, description = ?, duration = ?
-                WHERE id = ? AND student_id = ? AND is_active = 1
-            ''', (title, video_url, description or None, duration or None, video_id, current_user.id))
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({'success': True, 'message': 'Video updated successfully!'}), 200
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            logging.error(f"Error updating playlist video: {e}")
-            return jsonify({'success': False, 'message': 'Error updating video.'}), 500
+        return jsonify({'success': True, 'message': 'Video updated successfully!'}), 200
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        logging.error("Error updating playlist video: %s", e)
+        return jsonify({'success': False, 'message': 'Error updating video.'}), 500
 
 @app.route('/student/playlist/<int:video_id>/delete', methods=['POST'])
 @login_required
@@ -2879,130 +3441,353 @@ def student_delete_playlist_video(video_id):
     if not current_user.is_student():
         return jsonify({'success': False, 'message': 'Access denied.'}), 403
     
-    with db_lock:
-        conn = get_db_connection()
+    conn = get_db_connection()
+    
+    try:
+        cur = conn.execute('''
+            DELETE FROM student_video_playlists 
+            WHERE id = ? AND student_id = ?
+        ''', (video_id, current_user.id))
         
-        try:
-            conn.execute('''
-                DELETE FROM student_video_playlists 
-                WHERE id = ? AND student_id = ?
-            ''', (video_id, current_user.id))
-            
-            conn.commit()
-            conn.close()
-            
-            return jsonify({'success': True, 'message': 'Video deleted!'}), 200
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            logging.error(f"Error deleting playlist video: {e}")
-            return jsonify({'success': False, 'message': 'Error deleting video.'}), 500
-
-@app.route('/generate-transcript/<int:video_id>', methods=['POST'])
-@login_required
-def generate_video_transcript(video_id):
-    """Generate AI transcript for a video and save as PDF with watermark"""
+        conn.commit()
+        conn.close()
+        
+        if cur.rowcount == 0:
+            return jsonify({'success': False, 'message': 'Video not found.'}), 404
+        
+        return jsonify({'success': True, 'message': 'Video deleted!'}), 200
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        logging.error("Error deleting playlist video: %s", e)
+        return jsonify({'success': False, 'message': 'Error deleting video.'}), 500
+
+# Background job state
+# A job runs on a thread pool inside one worker process, but its status poll can land on
+# any worker, so status and results are kept in SQLite instead of process memory. Jobs
+# older than JOB_RETENTION_HOURS are pruned whenever a new one is created.
+JOB_RETENTION_HOURS = int(os.environ.get('JOB_RETENTION_HOURS', 24))
+
+def create_job(kind, user_id, **fields):
+    """Record a new queued job with optional data fields and return its id"""
+    job_id = uuid.uuid4().hex
+    with writer_connection() as conn:
+        conn.execute("DELETE FROM background_jobs WHERE created_at < datetime('now', ?)",
+                     (f'-{JOB_RETENTION_HOURS} hours',))
+        conn.execute('INSERT INTO background_jobs (id, kind, user_id, data) VALUES (?, ?, ?, ?)',
+                     (job_id, kind, user_id, app.json.dumps(fields)))
+    return job_id
+
+def update_job(job_id, status, **fields):
+    """Set a job's status and merge fields into its data; False if the job no longer exists"""
+    with writer_connection() as conn:
+        cur = conn.execute(
+            'UPDATE background_jobs SET status = ?, data = json_patch(data, ?) WHERE id = ?',
+            (status, app.json.dumps(fields), job_id)
+        )
+        return cur.rowcount > 0
+
+def get_job(job_id, kind, user_id):
+    """A job's status and data fields as one dict, or None unless user_id owns it"""
+    with db_connection() as conn:
+        row = conn.execute(
+            'SELECT status, data FROM background_jobs WHERE id = ? AND kind = ? AND user_id = ?',
+            (job_id, kind, user_id)
+        ).fetchone()
+    if row is None:
+        return None
+    return {**app.json.loads(row['data']), 'status': row['status']}
+
+# Background AI generation
+# Gemini plus the PDF render takes seconds to tens of seconds, so the generate routes
+# only check access, queue a job on a small thread pool and answer 202 at once. The page
+# polls the job status and the requester's Socket.IO room gets a 'notification' when done.
+_ai_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('AI_WORKERS', 4)),
+                                  thread_name_prefix='ai-generate')
+
+# PDF rendering is CPU-bound reportlab work, so the jobs hand it to a process pool and
+# several PDFs render at once instead of taking turns on the GIL. The pool is created on
+# first use with spawn, so children import only utils.pdf_generator and never a forked
+# copy of the (possibly eventlet-patched) app. PDF_WORKERS=0 renders in the job thread.
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 1))
+_pdf_pool = None
+_pdf_pool_lock = Lock()
+
+def render_pdf(func, **kwargs):
+    """Call a utils.pdf_generator function in the PDF process pool and return its result"""
+    global _pdf_pool
+    if PDF_WORKERS <= 0:
+        return func(**kwargs)
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        pool = _pdf_pool
     try:
-        from utils.pdf_generator import generate_transcript_pdf
-    except ImportError:
-        logging.error("PDF generator not available")
-        return jsonify({'success': False, 'message': 'PDF generation service not available. Please check system configuration.'}), 500
+        return pool.submit(func, **kwargs).result()
+    except BrokenProcessPool:
+        # A child died (e.g. OOM-killed); start a fresh pool next time and render here
+        logging.error("PDF process pool broke, rendering in the job thread")
+        with _pdf_pool_lock:
+            if _pdf_pool is pool:
+                _pdf_pool = None
+        return func(**kwargs)
+
+class AIJobError(Exception):
+    """A generation step failed; the message is shown to the user as-is"""
+
+def _run_ai_job(job_id, user_id, title, target, args):
+    """Run target(*args) for a queued job and record its result or error on the job"""
+    try:
+        if not update_job(job_id, 'running'):
+            return
+        result = target(*args)
+    except AIJobError as e:
+        update_job(job_id, 'failed', error=str(e))
+    except ValueError as ve:
+        logging.error("Gemini API Key Error: %s", ve)
+        update_job(job_id, 'failed', error='Gemini API is not configured. Please set GEMINI_API_KEY environment variable.')
+    except Exception as e:
+        logging.error("Error in AI generation job: %s", e)
+        update_job(job_id, 'failed', error=f'Error: {str(e)}')
+    else:
+        update_job(job_id, 'ready', **result)
+        socketio.emit('notification', {
+            'title': title,
+            'message': result['message'],
+            'type': 'success',
+            'icon': 'fa-book'
+        }, to=f"user_{user_id}")
+
+def _queue_ai_job(title, target, *args):
+    """Record a generation job for the current user, run it on the pool and answer 202"""
+    job_id = create_job('ai', current_user.id)
+    _ai_executor.submit(_run_ai_job, job_id, current_user.id, title, target, args)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('ai_job_status', job_id=job_id)
+    }), 202
+
+@app.route('/ai-jobs/<job_id>')
+@login_required
+def ai_job_status(job_id):
+    """Report the status of a queued transcript or notes generation"""
+    job = get_job(job_id, 'ai', current_user.id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    response = {
+        'success': job['status'] != 'failed',
+        'status': job['status'],
+        'error': job.get('error'),
+        'message': job.get('message')
+    }
+    if job['status'] == 'ready':
+        endpoint, values = job['download']
+        response['download_url'] = url_for(endpoint, **values)
+        response.update(job.get('extra', {}))
+    return jsonify(response)
+
+def _generate_transcript_job(video, student_name):
+    """Generate the transcript text and PDF for a video and record its path"""
+    from utils.pdf_generator import generate_transcript_pdf
+    import gemini_ai
+    
+    # Generate transcript using Gemini AI from actual YouTube video
+    transcript_text = gemini_ai.generate_video_transcript(
+        video['title'],
+        video['description'] or '',
+        video['duration'] or '',
+        video['video_url'] or ''
+    )
+    
+    if not transcript_text or len(transcript_text) < 10:
+        raise AIJobError('Failed to generate transcript. Please check your Gemini API key.')
+    
+    # Generate PDF filename
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pdf_filename = f"transcript_{video['id']}_{timestamp}.pdf"
+    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], 'transcripts', pdf_filename)
+    
+    # Generate PDF with watermark
+    success = render_pdf(
+        generate_transcript_pdf,
+        transcript_text=transcript_text,
+        video_title=video['title'],
+        course_name=f"{video['course_code']} - {video['course_title']}",
+        student_name=student_name,
+        output_path=pdf_path
+    )
+    
+    if not success:
+        raise AIJobError('Error generating PDF. Please try again.')
+    
+    # Save the path relative to UPLOAD_FOLDER
+    relative_path = f"transcripts/{pdf_filename}"
+    with db_connection() as conn:
+        conn.execute('''
+            UPDATE course_video_playlists 
+            SET transcript_file_path = ?
+            WHERE id = ?
+        ''', (relative_path, video['id']))
+        conn.commit()
     
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Get video details
+    logging.info("Transcript generated successfully for video %s", video['id'])
+    return {
+        'message': 'Transcript generated successfully!',
+        'download': ('download_video_transcript', {'video_id': video['id']})
+    }
+
+def _generate_video_notes_job(video, student_name):
+    """Generate AI study notes and their PDF for a video and record the path"""
+    from utils.pdf_generator import generate_transcript_pdf
+    import gemini_ai
+    
+    notes_text = gemini_ai.generate_video_notes(
+        video['title'],
+        video['description'] or '',
+        video['duration'] or '',
+        video['video_url'] or ''
+    )
+    
+    if not notes_text or len(notes_text) < 10:
+        raise AIJobError('Failed to generate notes. Please check your Gemini API key.')
+    
+    # Generate PDF filename
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pdf_filename = f"ai_notes_{video['id']}_{timestamp}.pdf"
+    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], 'resources', pdf_filename)
+    
+    # Generate PDF with watermark (reuse transcript PDF function with different title)
+    success = render_pdf(
+        generate_transcript_pdf,
+        transcript_text=notes_text,
+        video_title=f"Study Notes: {video['title']}",
+        course_name=f"{video['course_code']} - {video['course_title']}",
+        student_name=student_name,
+        output_path=pdf_path
+    )
+    
+    if not success:
+        raise AIJobError('Error generating PDF. Please try again.')
+    
+    # Save the path relative to UPLOAD_FOLDER
+    relative_path = f"resources/{pdf_filename}"
+    with db_connection() as conn:
+        conn.execute('''
+            UPDATE course_video_playlists 
+            SET notes_file_path = ?
+            WHERE id = ?
+        ''', (relative_path, video['id']))
+        conn.commit()
+    
+    logging.info("AI notes generated successfully for video %s", video['id'])
+    return {
+        'message': 'AI Study Notes generated successfully!',
+        'download': ('download_video_notes', {'video_id': video['id']})
+    }
+
+def _generate_student_notes_job(student_id, student_name, course_id, course, student_notes_input, add_watermark):
+    """Enhance a student's topic into study notes, render the PDF and save the note"""
+    from utils.pdf_generator import generate_transcript_pdf
+    import gemini_ai
+    
+    enhanced_notes = gemini_ai.generate_student_notes(
+        student_notes_input,
+        course['title'],
+        course['course_code']
+    )
+    
+    if not enhanced_notes or len(enhanced_notes) < 10:
+        raise AIJobError('Failed to enhance notes. Please try again.')
+    
+    # Generate PDF filename
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pdf_filename = f"student_notes_{student_id}_{timestamp}.pdf"
+    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], 'student_notes', pdf_filename)
+    
+    # Generate PDF with optional watermark
+    success = render_pdf(
+        generate_transcript_pdf,
+        transcript_text=enhanced_notes,
+        video_title=f"Study Notes - {course['title']}",
+        course_name=f"{course['course_code']} - {course['title']}",
+        student_name=student_name,
+        output_path=pdf_path,
+        add_watermark=add_watermark
+    )
+    
+    if not success:
+        raise AIJobError('Error generating PDF.')
+    
+    with db_connection() as conn:
+        cur = conn.execute('''
+            INSERT INTO student_notes (student_id, course_id, original_input, enhanced_notes, file_path)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            student_id,
+            course_id,
+            student_notes_input,
+            enhanced_notes,
+            f"student_notes/{pdf_filename}"
+        ))
+        conn.commit()
+        note_id = cur.lastrowid
+    
+    logging.info("Student notes generated for student %s", student_id)
+    return {
+        'message': f'Your AI-generated study notes for "{student_notes_input}" are ready!',
+        'download': ('download_student_notes', {'note_id': note_id}),
+        'extra': {'note_id': note_id, 'enhanced_notes': enhanced_notes}
+    }
+
+def _video_for_generation(video_id):
+    """Load a video for AI generation and check access; returns (video, error response)"""
+    with db_connection() as conn:
         video = conn.execute('''
-            SELECT v.*, c.instructor_id, c.title as course_title, c.course_code
+            SELECT v.id, v.title, v.description, v.duration, v.video_url, v.course_id,
+                   c.instructor_id, c.title as course_title, c.course_code
             FROM course_video_playlists v
             JOIN courses c ON v.course_id = c.id
             WHERE v.id = ? AND v.is_active = 1
         ''', (video_id,)).fetchone()
         
         if not video:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Video not found.'}), 404
+            return None, (jsonify({'success': False, 'message': 'Video not found.'}), 404)
         
         # Check if user has access (instructor or enrolled student)
         if current_user.is_student():
-            enrollment = conn.execute('''
-                SELECT * FROM enrollments 
-                WHERE student_id = ? AND course_id = ? AND status = 'approved'
-            ''', (current_user.id, video['course_id'])).fetchone()
-            
+            enrollment = conn.execute(APPROVED_ENROLLMENT_SQL, (current_user.id, video['course_id'])).fetchone()
             if not enrollment:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Access denied.'}), 403
+                return None, (jsonify({'success': False, 'message': 'Access denied.'}), 403)
         elif current_user.is_instructor() and video['instructor_id'] != current_user.id:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Access denied.'}), 403
-        
-        try:
-            # Generate transcript using Gemini AI from actual YouTube video
-            transcript_text = gemini_ai.generate_video_transcript(
-                video['title'],
-                video['description'] or '',
-                video['duration'] or '',
-                video['video_url'] or ''
-            )
-            
-            if not transcript_text or len(transcript_text) < 10:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Failed to generate transcript. Please check your Gemini API key.'}), 500
-            
-            # Generate PDF filename
-            safe_filename = secure_filename(video['title'])
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            pdf_filename = f"transcript_{video_id}_{timestamp}.pdf"
-            transcript_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'transcripts')
-            os.makedirs(transcript_folder, exist_ok=True)
-            pdf_path = os.path.join(transcript_folder, pdf_filename)
-            
-            # Generate PDF with watermark
-            success = generate_transcript_pdf(
-                transcript_text=transcript_text,
-                video_title=video['title'],
-                course_name=f"{video['course_code']} - {video['course_title']}",
-                student_name=current_user.full_name,
-                output_path=pdf_path
-            )
-            
-            if success:
-                # Save relative path to database (not absolute)
-                relative_path = os.path.join('sir_rafique', 'uploads', 'transcripts', pdf_filename)
-                
-                # Update database with transcript path
-                conn.execute('''
-                    UPDATE course_video_playlists 
-                    SET transcript_file_path = ?
-                    WHERE id = ?
-                ''', (relative_path, video_id))
-                conn.commit()
-                conn.close()
-                
-                logging.info(f"Transcript generated successfully for video {video_id}")
-                return jsonify({
-                    'success': True,
-                    'message': 'Transcript generated successfully!',
-                    'download_url': url_for('download_video_transcript', video_id=video_id)
-                })
-            else:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Error generating PDF. Please try again.'}), 500
-                
-        except ValueError as ve:
-            conn.close()
-            logging.error(f"Gemini API Key Error: {ve}")
-            return jsonify({'success': False, 'message': 'Gemini API is not configured. Please set GEMINI_API_KEY environment variable.'}), 500
-        except Exception as e:
-            conn.close()
-            logging.error(f"Error generating transcript: {e}")
-            return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+            return None, (jsonify({'success': False, 'message': 'Access denied.'}), 403)
+    
+    return video, None
+
+@app.route('/generate-transcript/<int:video_id>', methods=['POST'])
+@login_required
+def generate_video_transcript(video_id):
+    """Queue an AI transcript for a video, saved as PDF with watermark"""
+    try:
+        from utils.pdf_generator import generate_transcript_pdf
+    except ImportError:
+        logging.error("PDF generator not available")
+        return jsonify({'success': False, 'message': 'PDF generation service not available. Please check system configuration.'}), 500
+    
+    video, error = _video_for_generation(video_id)
+    if error:
+        return error
+    
+    return _queue_ai_job('📄 Transcript Ready!', _generate_transcript_job, video, current_user.full_name)
 
 @app.route('/generate-student-notes', methods=['POST'])
 @login_required
 def generate_student_notes_route():
-    """Generate AI-enhanced notes from student input and save as PDF with LearnNest watermark"""
+    """Queue AI-enhanced notes from student input, saved as PDF with LearnNest watermark"""
     try:
         from utils.pdf_generator import generate_transcript_pdf
     except ImportError:
@@ -3018,100 +3803,27 @@ def generate_student_notes_route():
         if not student_notes_input or len(student_notes_input) < 3:
             return jsonify({'success': False, 'message': 'Please enter a topic.'}), 400
         
-        with db_lock:
-            conn = get_db_connection()
-            
+        with db_connection() as conn:
             # Get course details
             course = conn.execute('''
-                SELECT * FROM courses WHERE id = ?
+                SELECT title, course_code FROM courses WHERE id = ?
             ''', (course_id,)).fetchone()
             
-            if not course:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Course not found.'}), 404
-            
-            # Check student has access
-            if current_user.is_student():
-                enrollment = conn.execute('''
-                    SELECT * FROM enrollments 
-                    WHERE student_id = ? AND course_id = ? AND status = 'approved'
-                ''', (current_user.id, course_id)).fetchone()
-                if not enrollment:
-                    conn.close()
-                    return jsonify({'success': False, 'message': 'Access denied.'}), 403
-            
-            # Generate enhanced notes using Gemini AI
-            enhanced_notes = gemini_ai.generate_student_notes(
-                student_notes_input,
-                course['title'],
-                course['course_code']
-            )
-            
-            if not enhanced_notes or len(enhanced_notes) < 10:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Failed to enhance notes. Please try again.'}), 500
-            
-            # Generate PDF filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            pdf_filename = f"student_notes_{current_user.id}_{timestamp}.pdf"
-            notes_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'student_notes')
-            os.makedirs(notes_folder, exist_ok=True)
-            pdf_path = os.path.join(notes_folder, pdf_filename)
-            
-            # Generate PDF with optional watermark
-            success = generate_transcript_pdf(
-                transcript_text=enhanced_notes,
-                video_title=f"Study Notes - {course['title']}",
-                course_name=f"{course['course_code']} - {course['title']}",
-                student_name=current_user.full_name,
-                output_path=pdf_path,
-                add_watermark=add_watermark
-            )
-            
-            if success:
-                # Save to database
-                conn.execute('''
-                    INSERT INTO student_notes (student_id, course_id, original_input, enhanced_notes, file_path, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    current_user.id,
-                    course_id,
-                    student_notes_input,
-                    enhanced_notes,
-                    os.path.join('sir_rafique', 'uploads', 'student_notes', pdf_filename),
-                    datetime.now()
-                ))
-                conn.commit()
-                
-                # Get the inserted note ID
-                note_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
-                conn.close()
-                
-                # Send notification to student
-                socketio.emit('notification', {
-                    'title': '📚 Study Notes Generated!',
-                    'message': f'Your AI-generated study notes for "{student_notes_input}" are ready!',
-                    'type': 'success',
-                    'icon': 'fa-book'
-                }, to=f'user_{current_user.id}')
-                
-                logging.info(f"Student notes generated for student {current_user.id}")
-                return jsonify({
-                    'success': True,
-                    'message': 'Enhanced study notes generated successfully!',
-                    'note_id': note_id,
-                    'enhanced_notes': enhanced_notes,
-                    'download_url': url_for('download_student_notes', note_id=note_id)
-                })
-            else:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Error generating PDF.'}), 500
-                
-    except ValueError as ve:
-        logging.error(f"Gemini API Key Error: {ve}")
-        return jsonify({'success': False, 'message': 'Gemini API not configured.'}), 500
+            if not course:
+                return jsonify({'success': False, 'message': 'Course not found.'}), 404
+            
+            # Check student has access
+            if current_user.is_student():
+                enrollment = conn.execute(APPROVED_ENROLLMENT_SQL, (current_user.id, course_id)).fetchone()
+                if not enrollment:
+                    return jsonify({'success': False, 'message': 'Access denied.'}), 403
+        
+        return _queue_ai_job('📚 Study Notes Generated!', _generate_student_notes_job,
+                             current_user.id, current_user.full_name, course_id, course,
+                             student_notes_input, add_watermark)
+    
     except Exception as e:
-        logging.error(f"Error generating student notes: {e}")
+        logging.error("Error generating student notes: %s", e)
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
 @app.route('/download-student-notes/<int:note_id>')
@@ -3119,53 +3831,127 @@ def generate_student_notes_route():
 def download_student_notes(note_id):
     """Download student's enhanced notes PDF"""
     try:
-        with db_lock:
-            conn = get_db_connection()
-            note = conn.execute('''
-                SELECT * FROM student_notes WHERE id = ? AND student_id = ?
-            ''', (note_id, current_user.id)).fetchone()
-            conn.close()
+        conn = get_db_connection()
+        note = conn.execute('''
+            SELECT file_path FROM student_notes WHERE id = ? AND student_id = ?
+        ''', (note_id, current_user.id)).fetchone()
+        conn.close()
         
-        if not note:
-            logging.warning(f"Note {note_id} not found for student {current_user.id}")
+        if not note or not note['file_path']:
+            logging.warning("Note %s not found for student %s", note_id, current_user.id)
             return jsonify({'error': 'Note not found'}), 404
         
-        stored_path = note['file_path']
-        filename = os.path.basename(stored_path)
-        
-        # Try multiple possible locations
-        possible_paths = [
-            stored_path,  # Original path as stored
-            os.path.join(app.config['UPLOAD_FOLDER'], filename),  # In uploads folder
-            os.path.join(app.config['UPLOAD_FOLDER'], 'student_notes', filename),  # In student_notes subfolder
-            os.path.join('sir_rafique', 'uploads', filename),  # Relative path from project root
-            os.path.join('sir_rafique', 'uploads', 'student_notes', filename),  # With subfolder
-        ]
-        
-        file_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                file_path = path
-                logging.info(f"Found notes file at: {path}")
-                break
-        
-        if not file_path:
-            logging.error(f"Student notes file not found. Note ID: {note_id}, Stored path: {stored_path}, Tried paths: {possible_paths}")
+        file_path = upload_file_path(note['file_path'])
+        if not os.path.isfile(file_path):
+            logging.error("Student notes file not found. Note ID: %s, Path: %s", note_id, file_path)
             return jsonify({'error': 'File not found on server'}), 404
         
         # Send the file
         try:
-            directory = os.path.dirname(file_path)
-            filename = os.path.basename(file_path)
-            return send_file(file_path, as_attachment=True, download_name=f"study_notes_{note_id}.pdf")
+            # Conditional send: ETag/Last-Modified revalidation and Range resumes,
+            # or an X-Sendfile / X-Accel-Redirect hand-off when SENDFILE_MODE is set
+            return send_upload_file(file_path, as_attachment=True,
+                                    download_name=f"study_notes_{note_id}.pdf",
+                                    mimetype='application/pdf')
         except Exception as send_error:
-            logging.error(f"Error sending file: {send_error}")
+            logging.error("Error sending file: %s", send_error)
             return jsonify({'error': 'Error sending file'}), 500
             
     except Exception as e:
-        logging.error(f"Error downloading student notes: {e}")
+        logging.error("Error downloading student notes: %s", e)
         return jsonify({'error': 'Download error'}), 500
 
+# Hot assistant questions are answered from a small per-process LRU before the disk
+# cache is consulted; answers with a generated visual are left to the disk cache
+AI_ANSWER_CACHE_SIZE = int(os.environ.get('AI_ANSWER_CACHE_SIZE', 2048))
+AI_ANSWER_CACHE_TTL = int(os.environ.get('AI_ANSWER_CACHE_TTL', 3600))
+_ai_answers = OrderedDict()  # cache key -> (expires at, response data)
+_ai_answers_lock = Lock()
+_ai_answer_stats = {'hits': 0, 'misses': 0}
+
+def _cached_ai_answer(key):
+    """Return a live in-memory answer for key and mark it most recently used, or None"""
+    now = time.monotonic()
+    with _ai_answers_lock:
+        entry = _ai_answers.get(key)
+        if entry and entry[0] > now:
+            _ai_answers.move_to_end(key)
+            _ai_answer_stats['hits'] += 1
+            return entry[1]
+        if entry:
+            del _ai_answers[key]
+        _ai_answer_stats['misses'] += 1
+        return None
+
+def _remember_ai_answer(key, response_data):
+    """Keep a successful text-only answer in the in-memory LRU"""
+    if not response_data.get('success') or response_data.get('has_visual'):
+        return
+    with _ai_answers_lock:
+        _ai_answers[key] = (time.monotonic() + AI_ANSWER_CACHE_TTL, response_data)
+        _ai_answers.move_to_end(key)
+        while len(_ai_answers) > AI_ANSWER_CACHE_SIZE:
+            _ai_answers.popitem(last=False)
+
+# Generated visuals are written in 1 MiB slices to a temp file and renamed into place
+VISUAL_WRITE_CHUNK = 1024 * 1024
+
+def _write_visual(image_path, image_data):
+    """Write image bytes so a partial image is never served; returns False if the write failed"""
+    tmp_path = image_path + '.tmp'
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(image_data)
+            while view:
+                written = os.write(fd, view[:VISUAL_WRITE_CHUNK])
+                view = view[written:]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, image_path)
+        return True
+    except OSError as e:
+        logging.error("Could not save generated visual %s: %s", image_path, e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+def _ai_answer_cache_key(question):
+    """Disk/LRU cache key for an assistant question. The "v2" namespace retires entries
+    written before failed generations were kept out of the cache."""
+    return ai_cache.make_key('ai_assistant', 'v2', question.lower())
+
+def _generate_ai_visual(visual_prompt, question, user_id):
+    """Generate and save an assistant visual, returning its URL or None if generation failed"""
+    import gemini_ai
+    try:
+        # Imagen 3 through the shared client, so connections are reused
+        image_data = gemini_ai.generate_visual(visual_prompt)
+    except Exception as img_error:
+        # Continue without visual if generation fails
+        logging.warning("Could not generate visual: %s", img_error)
+        return None
+    if not image_data:
+        return None
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"ai_visual_{user_id}_{timestamp}.png"
+    image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'ai_visuals', filename)
+    # The URL is only handed out (and cached with the answer) once the file exists
+    if not _write_visual(image_path, image_data):
+        return None
+    logging.info("Generated visual for question: %.50s...", question)
+    return f"/uploads/ai_visuals/{filename}"
+
+@app.route('/api/ai-cache-stats')
+@admin_required
+def ai_cache_stats():
+    """Hit/miss counters for this worker's in-memory assistant answer cache"""
+    with _ai_answers_lock:
+        return jsonify({'size': len(_ai_answers), **_ai_answer_stats})
+
 @app.route('/api/ai-assistant', methods=['POST'])
 @login_required
 def ai_assistant():
@@ -3177,21 +3963,27 @@ def ai_assistant():
         if not question or len(question) < 3:
             return jsonify({'success': False, 'message': 'Please enter a valid question.'}), 400
         
+        # The same question gets the same answer (and generated visual) from the
+        # in-memory LRU or, failing that, the disk cache
+        cache_key = _ai_answer_cache_key(question)
+        cached = _cached_ai_answer(cache_key)
+        if cached:
+            return jsonify(cached)
+        cached = ai_cache.get(cache_key)
+        if cached:
+            _remember_ai_answer(cache_key, cached)
+            return jsonify(cached)
+        
         try:
             # Use Gemini AI to answer the question with visual capability
+            import gemini_ai
             result = gemini_ai.answer_student_question(question)
             
-            # Handle both dict and string responses for backward compatibility
-            if isinstance(result, dict):
-                answer_text = result.get('answer', '')
+            # None means Gemini failed; only real answers are returned as success and cached
+            if result:
+                answer_text = result['answer']
                 needs_visual = result.get('needs_visual', False)
-                visual_prompt = result.get('visual_prompt', None)
-            else:
-                answer_text = result
-                needs_visual = False
-                visual_prompt = None
-            
-            if answer_text and "error" not in answer_text.lower():
+                visual_prompt = result.get('visual_prompt')
                 response_data = {
                     'success': True,
                     'answer': answer_text,
@@ -3200,42 +3992,15 @@ def ai_assistant():
                 
                 # If visual is needed, generate it using Gemini's Imagen
                 if needs_visual and visual_prompt:
-                    try:
-                        from google import genai
-                        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-                        
-                        # Generate image using Imagen 3
-                        image_response = client.models.generate_images(
-                            model='imagen-3.0-generate-001',
-                            prompt=visual_prompt,
-                            config=types.GenerateImagesConfig(
-                                number_of_images=1,
-                                aspect_ratio='1:1',
-                                safety_filter_level='block_some',
-                                person_generation='allow_adult'
-                            )
-                        )
-                        
-                        if image_response and image_response.generated_images:
-                            # Save the generated image
-                            import base64
-                            image_data = image_response.generated_images[0].image.image_bytes
-                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                            filename = f"ai_visual_{current_user.id}_{timestamp}.png"
-                            visual_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'ai_visuals')
-                            os.makedirs(visual_folder, exist_ok=True)
-                            image_path = os.path.join(visual_folder, filename)
-                            
-                            with open(image_path, 'wb') as f:
-                                f.write(image_data)
-                            
-                            response_data['visual_url'] = f"/uploads/ai_visuals/{filename}"
-                            logging.info(f"Generated visual for question: {question[:50]}...")
-                    except Exception as img_error:
-                        logging.warning(f"Could not generate visual: {img_error}")
-                        # Continue without visual if generation fails
+                    visual_url = _generate_ai_visual(visual_prompt, question, current_user.id)
+                    if visual_url:
+                        response_data['visual_url'] = visual_url
+                    else:
+                        response_data['has_visual'] = False
                 
-                logging.info(f"AI Assistant answered question for user {current_user.id}")
+                logging.info("AI Assistant answered question for user %s", current_user.id)
+                ai_cache.set(cache_key, response_data)
+                _remember_ai_answer(cache_key, response_data)
                 return jsonify(response_data)
             else:
                 return jsonify({
@@ -3244,197 +4009,189 @@ def ai_assistant():
                 }), 500
                 
         except Exception as e:
-            logging.error(f"Error in AI Assistant: {e}")
+            logging.error("Error in AI Assistant: %s", e)
             return jsonify({
                 'success': False,
                 'message': 'Error processing your question. Please try again.'
             }), 500
             
     except Exception as e:
-        logging.error(f"AI Assistant request error: {e}")
+        logging.error("AI Assistant request error: %s", e)
         return jsonify({'success': False, 'message': 'Invalid request.'}), 400
 
+def _sse_event(payload):
+    """One Server-Sent Events frame carrying a JSON payload"""
+    return f"data: {app.json.dumps(payload)}\n\n"
+
+# The visual check runs beside the streamed answer on its own small pool, so the final
+# frame never waits behind transcript/notes jobs queued on _ai_executor
+_visual_check_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('AI_VISUAL_CHECK_WORKERS', 2)),
+                                            thread_name_prefix='ai-visual-check')
+
+@app.route('/api/ai-assistant/stream', methods=['POST'])
+@login_required
+def ai_assistant_stream_start():
+    """Start a streamed AI Study Assistant answer. The question arrives in the POST body (so
+    it never appears in access logs) and is parked under a one-time stream id for the
+    EventSource to claim; a cached answer is returned directly instead, as from /api/ai-assistant."""
+    data = request.get_json(silent=True) or {}
+    question = str(data.get('question', '')).strip()
+    if not question or len(question) < 3:
+        return jsonify({'success': False, 'message': 'Please enter a valid question.'}), 400
+    
+    cache_key = _ai_answer_cache_key(question)
+    cached = _cached_ai_answer(cache_key)
+    if not cached:
+        cached = ai_cache.get(cache_key)
+        if cached:
+            _remember_ai_answer(cache_key, cached)
+    if cached:
+        return jsonify(cached)
+    
+    # Kept in background_jobs so whichever worker serves the EventSource can claim it
+    stream_id = create_job('ai_stream', current_user.id, question=question)
+    return jsonify({
+        'success': True,
+        'stream_url': url_for('ai_assistant_stream', stream_id=stream_id)
+    }), 202
+
+@app.route('/api/ai-assistant/stream/<stream_id>')
+@login_required
+def ai_assistant_stream(stream_id):
+    """AI Study Assistant over Server-Sent Events: the answer is sent as Gemini writes it.
+    Frames carry {'delta': text} pieces, then a final {'done': true, ...} with the same
+    fields /api/ai-assistant returns (including visual_url when a visual was generated)."""
+    # Each stream id is answered once
+    with writer_connection() as conn:
+        row = conn.execute(
+            "DELETE FROM background_jobs WHERE id = ? AND kind = 'ai_stream' AND user_id = ? RETURNING data",
+            (stream_id, current_user.id)
+        ).fetchone()
+    if row is None:
+        return jsonify({'success': False, 'message': 'Question not found. Please ask again.'}), 404
+    question = app.json.loads(row[0])['question']
+    
+    sse_headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    cache_key = _ai_answer_cache_key(question)
+    
+    import gemini_ai
+    user_id = current_user.id
+    failed = {'done': True, 'success': False, 'message': 'Error processing your question. Please try again.'}
+    
+    def generate():
+        # Whether a visual would help is decided while the answer streams
+        visual_check = _visual_check_executor.submit(gemini_ai.analyze_visual_need, question)
+        parts = []
+        try:
+            for text in gemini_ai.stream_student_answer(question):
+                parts.append(text)
+                yield _sse_event({'delta': text})
+        except Exception as e:
+            logging.error("Error in AI Assistant stream: %s", e)
+            visual_check.cancel()
+            yield _sse_event(failed)
+            return
+        
+        answer_text = ''.join(parts).strip()
+        if not answer_text:
+            visual_check.cancel()
+            yield _sse_event(failed)
+            return
+        
+        try:
+            needs_visual, visual_prompt = visual_check.result()
+        except Exception as e:
+            logging.warning("Could not check whether a visual is needed: %s", e)
+            needs_visual, visual_prompt = False, None
+        
+        response_data = {'success': True, 'answer': answer_text, 'has_visual': needs_visual}
+        if needs_visual and visual_prompt:
+            visual_url = _generate_ai_visual(visual_prompt, question, user_id)
+            if visual_url:
+                response_data['visual_url'] = visual_url
+            else:
+                response_data['has_visual'] = False
+        
+        logging.info("AI Assistant streamed an answer for user %s", user_id)
+        ai_cache.set(cache_key, response_data)
+        _remember_ai_answer(cache_key, response_data)
+        yield _sse_event({'done': True, **response_data})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=sse_headers)
+
 @app.route('/generate-notes/<int:video_id>', methods=['POST'])
 @login_required
 def generate_video_notes_route(video_id):
-    """Generate AI study notes for a video and save as PDF"""
+    """Queue AI study notes for a video, saved as PDF"""
     try:
         from utils.pdf_generator import generate_transcript_pdf
     except ImportError:
         logging.error("PDF generator not available")
         return jsonify({'success': False, 'message': 'PDF generation service not available. Please check system configuration.'}), 500
     
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Get video details
-        video = conn.execute('''
-            SELECT v.*, c.instructor_id, c.title as course_title, c.course_code
-            FROM course_video_playlists v
-            JOIN courses c ON v.course_id = c.id
-            WHERE v.id = ? AND v.is_active = 1
-        ''', (video_id,)).fetchone()
-        
-        if not video:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Video not found.'}), 404
-        
-        # Check if user has access (instructor or enrolled student)
-        if current_user.is_student():
-            enrollment = conn.execute('''
-                SELECT * FROM enrollments 
-                WHERE student_id = ? AND course_id = ? AND status = 'approved'
-            ''', (current_user.id, video['course_id'])).fetchone()
-            
-            if not enrollment:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Access denied.'}), 403
-        elif current_user.is_instructor() and video['instructor_id'] != current_user.id:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Access denied.'}), 403
-        
-        try:
-            # Generate AI notes using Gemini AI
-            notes_text = gemini_ai.generate_video_notes(
-                video['title'],
-                video['description'] or '',
-                video['duration'] or '',
-                video['video_url'] or ''
-            )
-            
-            if not notes_text or len(notes_text) < 10:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Failed to generate notes. Please check your Gemini API key.'}), 500
-            
-            # Generate PDF filename
-            safe_filename = secure_filename(video['title'])
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            pdf_filename = f"ai_notes_{video_id}_{timestamp}.pdf"
-            notes_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'resources')
-            os.makedirs(notes_folder, exist_ok=True)
-            pdf_path = os.path.join(notes_folder, pdf_filename)
-            
-            # Generate PDF with watermark (reuse transcript PDF function with different title)
-            success = generate_transcript_pdf(
-                transcript_text=notes_text,
-                video_title=f"Study Notes: {video['title']}",
-                course_name=f"{video['course_code']} - {video['course_title']}",
-                student_name=current_user.full_name,
-                output_path=pdf_path
-            )
-            
-            if success:
-                # Save relative path to database (not absolute)
-                relative_path = os.path.join('sir_rafique', 'uploads', 'resources', pdf_filename)
-                
-                # Update database with AI notes path
-                conn.execute('''
-                    UPDATE course_video_playlists 
-                    SET notes_file_path = ?
-                    WHERE id = ?
-                ''', (relative_path, video_id))
-                conn.commit()
-                conn.close()
-                
-                logging.info(f"AI notes generated successfully for video {video_id}")
-                return jsonify({
-                    'success': True,
-                    'message': 'AI Study Notes generated successfully!',
-                    'download_url': url_for('download_video_notes', video_id=video_id)
-                })
-            else:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Error generating PDF. Please try again.'}), 500
-                
-        except ValueError as ve:
-            conn.close()
-            logging.error(f"Gemini API Key Error: {ve}")
-            return jsonify({'success': False, 'message': 'Gemini API is not configured. Please set GEMINI_API_KEY environment variable.'}), 500
-        except Exception as e:
-            conn.close()
-            logging.error(f"Error generating notes: {e}")
-            return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+    video, error = _video_for_generation(video_id)
+    if error:
+        return error
+    
+    return _queue_ai_job('📚 Study Notes Ready!', _generate_video_notes_job, video, current_user.full_name)
 
 @app.route('/download-transcript/<int:video_id>')
 @login_required
 def download_video_transcript(video_id):
     """Download AI-generated transcript PDF for a video"""
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Get video details
-        video = conn.execute('''
-            SELECT v.*, c.instructor_id 
-            FROM course_video_playlists v
-            JOIN courses c ON v.course_id = c.id
-            WHERE v.id = ? AND v.is_active = 1
-        ''', (video_id,)).fetchone()
-        
-        if not video or not video['transcript_file_path']:
-            conn.close()
-            flash('Transcript not found. Please generate it first.', 'error')
-            return redirect(url_for('dashboard'))
+    conn = get_db_connection()
+    
+    # Get video details
+    video = conn.execute('''
+        SELECT v.*, c.instructor_id 
+        FROM course_video_playlists v
+        JOIN courses c ON v.course_id = c.id
+        WHERE v.id = ? AND v.is_active = 1
+    ''', (video_id,)).fetchone()
+    
+    if not video or not video['transcript_file_path']:
+        conn.close()
+        flash('Transcript not found. Please generate it first.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    # Check if user has access (instructor or enrolled student)
+    if current_user.is_student():
+        enrollment = conn.execute(APPROVED_ENROLLMENT_SQL, (current_user.id, video['course_id'])).fetchone()
         
-        # Check if user has access (instructor or enrolled student)
-        if current_user.is_student():
-            enrollment = conn.execute('''
-                SELECT * FROM enrollments 
-                WHERE student_id = ? AND course_id = ? AND status = 'approved'
-            ''', (current_user.id, video['course_id'])).fetchone()
-            
-            if not enrollment:
-                conn.close()
-                flash('Access denied.', 'error')
-                return redirect(url_for('dashboard'))
-        elif current_user.is_instructor() and video['instructor_id'] != current_user.id:
+        if not enrollment:
             conn.close()
             flash('Access denied.', 'error')
             return redirect(url_for('dashboard'))
-        
-        stored_path = video['transcript_file_path']
+    elif current_user.is_instructor() and video['instructor_id'] != current_user.id:
         conn.close()
-        
-        # Try to find the actual file - handle incorrect paths from different systems
-        file_path = None
-        filename = os.path.basename(stored_path)
-        
-        # Try multiple possible locations
-        possible_paths = [
-            stored_path,  # Original path
-            os.path.join(app.config['UPLOAD_FOLDER'], 'transcripts', filename),  # Current system path
-            os.path.join('sir_rafique', 'uploads', 'transcripts', filename),  # Relative path
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path):
-                file_path = path
-                break
-        
-        if not file_path:
-            logging.error(f"Transcript file not found. Tried paths: {possible_paths}")
-            flash('Transcript file not found. Please generate it again.', 'error')
-            return redirect(url_for('dashboard'))
-        
-        # Send the transcript PDF file
-        try:
-            directory = os.path.dirname(file_path)
-            filename = os.path.basename(file_path)
-            
-            # Create a clean download filename
-            safe_title = "".join(c for c in video['title'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            download_filename = f"transcript_{safe_title}.pdf"
-            
-            return send_from_directory(
-                directory, 
-                filename, 
-                as_attachment=True, 
-                download_name=download_filename,
-                mimetype='application/pdf'
-            )
-        except Exception as e:
-            logging.error(f"Error downloading transcript: {e}")
-            flash(f'Unable to download transcript. Please try again.', 'error')
-            return redirect(url_for('dashboard'))
+        flash('Access denied.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    stored_path = video['transcript_file_path']
+    conn.close()
+    
+    file_path = upload_file_path(stored_path)
+    if not os.path.isfile(file_path):
+        logging.error("Transcript file not found: %s", file_path)
+        flash('Transcript file not found. Please generate it again.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    # Send the transcript PDF file
+    try:
+        # Create a clean download filename
+        safe_title = "".join(c for c in video['title'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        download_filename = f"transcript_{safe_title}.pdf"
+        
+        return send_upload_file(
+            file_path,
+            as_attachment=True, 
+            download_name=download_filename,
+            mimetype='application/pdf'
+        )
+    except Exception as e:
+        logging.error("Error downloading transcript: %s", e)
+        flash(f'Unable to download transcript. Please try again.', 'error')
+        return redirect(url_for('dashboard'))
 
 @app.route('/download-video/<int:video_id>')
 @login_required
@@ -3443,161 +4200,237 @@ def download_video(video_id):
     import subprocess
     import tempfile
     
-    with db_lock:
-        conn = get_db_connection()
-        
-        # Get video details
-        video = conn.execute('''
-            SELECT v.*, c.instructor_id 
-            FROM course_video_playlists v
-            JOIN courses c ON v.course_id = c.id
-            WHERE v.id = ? AND v.is_active = 1
-        ''', (video_id,)).fetchone()
-        
-        if not video:
-            conn.close()
-            flash('Video not found.', 'error')
-            return redirect(url_for('dashboard'))
+    conn = get_db_connection()
+    
+    # Get video details
+    video = conn.execute('''
+        SELECT v.*, c.instructor_id 
+        FROM course_video_playlists v
+        JOIN courses c ON v.course_id = c.id
+        WHERE v.id = ? AND v.is_active = 1
+    ''', (video_id,)).fetchone()
+    
+    if not video:
+        conn.close()
+        flash('Video not found.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    # Check if user has access (instructor or enrolled student)
+    if current_user.is_student():
+        enrollment = conn.execute(APPROVED_ENROLLMENT_SQL, (current_user.id, video['course_id'])).fetchone()
         
-        # Check if user has access (instructor or enrolled student)
-        if current_user.is_student():
-            enrollment = conn.execute('''
-                SELECT * FROM enrollments 
-                WHERE student_id = ? AND course_id = ? AND status = 'approved'
-            ''', (current_user.id, video['course_id'])).fetchone()
-            
-            if not enrollment:
-                conn.close()
-                flash('Access denied.', 'error')
-                return redirect(url_for('dashboard'))
-        elif current_user.is_instructor() and video['instructor_id'] != current_user.id:
+        if not enrollment:
             conn.close()
             flash('Access denied.', 'error')
             return redirect(url_for('dashboard'))
-        
-        video_url = video['video_url']
+    elif current_user.is_instructor() and video['instructor_id'] != current_user.id:
         conn.close()
-        
-        # Render download page with embedded downloader
-        return render_template('student/video_download.html', video=video)
+        flash('Access denied.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    video_url = video['video_url']
+    conn.close()
+    
+    # Render download page with embedded downloader
+    return render_template('student/video_download.html', video=video)
 
-# VIDEO DOWNLOADER ROUTES (PyTubeFix Integration)
+# VIDEO DOWNLOADER ROUTES (yt-dlp Integration)
 @app.route('/video-downloader')
 @login_required
 def video_downloader_home():
     """Main video downloader page"""
     return render_template('student/video_download.html', video=None)
 
-def clean_youtube_url(link: str) -> str:
-    """Cleans YouTube URL by removing tracking parameters while preserving the video ID."""
-    from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
-    
-    parsed = urlparse(link)
-    query_params = parse_qs(parsed.query)
-    
-    # Keep only the 'v' parameter (video ID) if it exists
-    if 'v' in query_params:
-        cleaned_query = urlencode({'v': query_params['v'][0]})
-        cleaned_url = urlunparse((
-            parsed.scheme,
-            parsed.netloc,
-            parsed.path,
-            parsed.params,
-            cleaned_query,
-            ''  # Remove fragment
-        ))
-        return cleaned_url
+# Video ID from watch, youtu.be, embed and shorts links
+_YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube\.com/watch\?(?:[^#]*&)?v=|youtu\.be/|youtube\.com/embed/|youtube\.com/shorts/)([A-Za-z0-9_-]{11})'
+)
+
+def clean_youtube_url(link: str):
+    """Canonical watch URL for a YouTube link, or None if the link has no YouTube video ID.
+    Only this rebuilt URL ever reaches yt-dlp, so a link can't point the server elsewhere."""
+    match = _YOUTUBE_ID_RE.search(link)
+    return f"https://www.youtube.com/watch?v={match.group(1)}" if match else None
+
+# Background YouTube downloads
+# A small thread pool resolves the media URL with yt-dlp so the request returns a job id
+# at once; the page polls the job status and the owner's Socket.IO room gets a
+# 'download_ready' event. The file itself is never written to disk: the download route
+# relays the media (transcoded to MP3 by ffmpeg for audio) straight into the response.
+_download_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('DOWNLOAD_WORKERS', 2)),
+                                        thread_name_prefix='yt-download')
+# Single-file formats: the smallest MP4 with audio (as before) and the best audio track
+YTDL_FORMATS = {
+    'video': 'worst[ext=mp4]/worst',
+    'audio': 'bestaudio[ext=m4a]/bestaudio',
+}
+# Only the YouTube extractor may run; the generic one would fetch arbitrary URLs
+YTDL_PARAMS = {'quiet': True, 'no_warnings': True, 'noplaylist': True, 'allowed_extractors': ['youtube']}
+STREAM_CHUNK_SIZE = 64 * 1024
+FFMPEG_PATH = shutil.which('ffmpeg')
+
+def _run_youtube_download(job_id, kind, link, user_id, download_url):
+    """Resolve the direct media URL of a YouTube video (MP4) or audio track for a queued job"""
+    import yt_dlp
+    try:
+        # The job may have been pruned before a pool thread got to it
+        if not update_job(job_id, 'downloading'):
+            return
+        with yt_dlp.YoutubeDL({**YTDL_PARAMS, 'format': YTDL_FORMATS[kind]}) as ydl:
+            info = ydl.extract_info(link, download=False)
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        ext = info.get('ext') or ('mp4' if kind == 'video' else 'm4a')
+        # Convert audio to MP3 when ffmpeg is available, otherwise send the original track
+        transcode = kind == 'audio' and FFMPEG_PATH is not None
+        if transcode:
+            filename, mimetype = f"audio_{timestamp}.mp3", 'audio/mpeg'
+        else:
+            filename = f"{kind}_{timestamp}.{ext}"
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        
+        update_job(
+            job_id, 'ready',
+            media_url=info['url'],
+            http_headers=info.get('http_headers') or {},
+            # YouTube throttles long single requests; yt-dlp asks for ranged chunks instead
+            http_chunk_size=(info.get('downloader_options') or {}).get('http_chunk_size'),
+            filesize=info.get('filesize'),
+            filename=filename,
+            mimetype=mimetype,
+            transcode=transcode
+        )
+        socketio.emit('download_ready', {
+            'job_id': job_id,
+            'kind': kind,
+            'download_url': download_url
+        }, to=f'user_{user_id}')
     
-    # If no 'v' parameter, return original (might be a youtu.be short link)
-    return link
+    except Exception as e:
+        logging.error("Error downloading %s: %s", kind, e)
+        update_job(job_id, 'failed', error=str(e))
+
+def _stream_media(job):
+    """Yield the bytes of a resolved download, in ranged requests when yt-dlp asks for them"""
+    import yt_dlp
+    from yt_dlp.networking import Request as YtdlRequest
+    from yt_dlp.networking.exceptions import HTTPError as YtdlHTTPError
+    # Unknown sizes are not stored (JSON nulls are dropped when the job is updated)
+    chunk_size = job.get('http_chunk_size')
+    filesize = job.get('filesize')
+    start = 0
+    with yt_dlp.YoutubeDL(YTDL_PARAMS) as ydl:
+        while True:
+            headers = dict(job['http_headers'])
+            if chunk_size:
+                headers['Range'] = f"bytes={start}-{start + chunk_size - 1}"
+            received = 0
+            try:
+                response = ydl.urlopen(YtdlRequest(job['media_url'], headers=headers))
+            except YtdlHTTPError as e:
+                # The previous chunk ended exactly at the end of a file of unknown size
+                if e.status == 416 and start:
+                    break
+                raise
+            with response:
+                ranged = response.status == 206
+                while chunk := response.read(STREAM_CHUNK_SIZE):
+                    received += len(chunk)
+                    yield chunk
+            start += received
+            if not chunk_size or not ranged or received < chunk_size or (filesize and start >= filesize):
+                break
+
+def _stream_mp3(job):
+    """Yield an MP3 transcode of a resolved audio download, produced by ffmpeg on the fly"""
+    headers = ''.join(f"{k}: {v}\r\n" for k, v in job['http_headers'].items())
+    proc = subprocess.Popen(
+        [FFMPEG_PATH, '-loglevel', 'error', '-headers', headers, '-i', job['media_url'],
+         '-vn', '-c:a', 'libmp3lame', '-f', 'mp3', 'pipe:1'],
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        while chunk := proc.stdout.read(STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        # Stop ffmpeg if the client went away before the end
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+def _queue_youtube_download(kind):
+    """Validate the submitted link and queue a background download job"""
+    # Get link from either query parameter (GET) or form data (POST)
+    link = request.args.get('link') or request.form.get('link', '')
+    link = clean_youtube_url(link.strip())
+    
+    if not link:
+        return jsonify({'success': False, 'error': 'Please provide a valid YouTube URL'}), 400
+    
+    job_id = create_job('download', current_user.id)
+    download_url = url_for('download_job_file', job_id=job_id)
+    _download_executor.submit(_run_youtube_download, job_id, kind, link, current_user.id, download_url)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('download_job_status', job_id=job_id),
+        'download_url': download_url
+    }), 202
 
 @app.route('/submit', methods=['GET', 'POST'])
 @login_required
 def submit_video_download():
-    """Download YouTube video using PyTubeFix"""
-    try:
-        # Get link from either query parameter (GET) or form data (POST)
-        link = request.args.get('link') or request.form.get('link', '')
-        link = link.strip()
-        
-        if not link:
-            flash('Please provide a valid YouTube URL', 'error')
-            return redirect(url_for('video_downloader_home'))
-        
-        # Create downloads directory
-        downloads_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'video_downloads')
-        os.makedirs(downloads_dir, exist_ok=True)
-        
-        # Clean old downloads (keep only last 3 files)
-        existing_files = os.listdir(downloads_dir)
-        if len(existing_files) > 3:
-            for f in existing_files:
-                os.remove(os.path.join(downloads_dir, f))
-        
-        clean = clean_youtube_url(link)
-        yt = YouTube(clean)
-        
-        stream = yt.streams.get_lowest_resolution()
-        filename = f"video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
-        out_file = stream.download(output_path=downloads_dir, filename=filename)
-        
-        return send_from_directory(downloads_dir, filename, as_attachment=True)
-    
-    except Exception as e:
-        logging.error(f"Error downloading video: {e}")
-        flash(f'Error downloading video: {str(e)}', 'error')
-        return redirect(url_for('video_downloader_home'))
+    """Queue a YouTube video download using yt-dlp"""
+    return _queue_youtube_download('video')
 
 @app.route('/submit_audio', methods=['GET', 'POST'])
 @login_required
 def submit_audio_download():
-    """Download YouTube audio using PyTubeFix"""
-    try:
-        # Get link from either query parameter (GET) or form data (POST)
-        link = request.args.get('link') or request.form.get('link', '')
-        link = link.strip()
-        
-        if not link:
-            flash('Please provide a valid YouTube URL', 'error')
-            return redirect(url_for('video_downloader_home'))
-        
-        # Create downloads directory
-        downloads_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'audio_downloads')
-        os.makedirs(downloads_dir, exist_ok=True)
-        
-        # Clean old downloads (keep only last 5 files)
-        existing_files = os.listdir(downloads_dir)
-        if len(existing_files) > 5:
-            for f in existing_files:
-                os.remove(os.path.join(downloads_dir, f))
-        
-        clean = clean_youtube_url(link)
-        yt = YouTube(clean)
-        
-        audio_stream = yt.streams.filter(only_audio=True).first()
-        filename = f"audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
-        out_file = audio_stream.download(output_path=downloads_dir, filename=filename)
-        
-        # If ffmpeg is available, convert to proper MP3
-        # Otherwise, just rename the file
+    """Queue a YouTube audio download using yt-dlp"""
+    return _queue_youtube_download('audio')
+
+@app.route('/downloads/<job_id>')
+@login_required
+def download_job_status(job_id):
+    """Report the status of a queued YouTube download"""
+    job = get_job(job_id, 'download', current_user.id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Download not found'}), 404
+    
+    return jsonify({
+        'success': True,
+        'status': job['status'],
+        'error': job.get('error'),
+        'download_url': url_for('download_job_file', job_id=job_id) if job['status'] == 'ready' else None
+    })
+
+@app.route('/downloads/<job_id>/file')
+@login_required
+def download_job_file(job_id):
+    """Stream the media of a finished YouTube download to the browser"""
+    job = get_job(job_id, 'download', current_user.id)
+    if not job or job['status'] != 'ready':
+        flash('Download not found or not ready yet.', 'error')
+        return redirect(url_for('video_downloader_home'))
+    
+    headers = {'Content-Disposition': f'attachment; filename="{job["filename"]}"'}
+    if job['transcode']:
+        body = _stream_mp3(job)
+    else:
+        body = _stream_media(job)
+        if job.get('filesize'):
+            headers['Content-Length'] = str(job['filesize'])
+    
+    def generate():
         try:
-            import subprocess
-            final_file = out_file.replace('.mp3', '_final.mp3')
-            subprocess.run(['ffmpeg', '-y', '-i', out_file, '-c:a', 'libmp3lame', final_file], 
-                         check=True, capture_output=True)
-            os.remove(out_file)
-            out_file = final_file
-            filename = os.path.basename(final_file)
-        except:
-            # ffmpeg not available, use original file
-            pass
-        
-        return send_from_directory(downloads_dir, filename, as_attachment=True)
+            yield from body
+        except Exception as e:
+            # Headers are already sent; all that is left is to end the response early
+            logging.error("Error streaming download %s: %s", job_id, e)
     
-    except Exception as e:
-        logging.error(f"Error downloading audio: {e}")
-        flash(f'Error downloading audio: {str(e)}', 'error')
-        return redirect(url_for('video_downloader_home'))
+    return Response(stream_with_context(generate()), mimetype=job['mimetype'], headers=headers)
 
 # QUIZ SYSTEM ROUTES - API ENDPOINT FOR AI MCQ GENERATION
 @app.route('/api/generate-mcq-options', methods=['POST'])
@@ -3613,6 +4446,7 @@ def generate_mcq_options():
             return jsonify({'success': False, 'error': 'Question too short'}), 400
         
         # Generate MCQ options using Gemini AI
+        import gemini_ai
         result = gemini_ai.generate_mcq_options(question, context)
         
         if result and 'options' in result:
@@ -3631,7 +4465,7 @@ def generate_mcq_options():
             return jsonify({'success': False, 'error': 'Failed to generate options'}), 500
             
     except Exception as e:
-        logging.error(f"Error generating MCQ options: {e}")
+        logging.error("Error generating MCQ options: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/instructor/courses/<int:course_id>/quizzes/generate-ai', methods=['POST'])
@@ -3657,12 +4491,13 @@ def instructor_generate_ai_quiz(course_id):
         
         # Generate questions using Gemini AI
         try:
+            import gemini_ai
             questions = gemini_ai.generate_mcq_quiz(topic, num_questions, difficulty)
         except ValueError as ve:
-            logging.error(f"Gemini API configuration error: {ve}")
+            logging.error("Gemini API configuration error: %s", ve)
             return jsonify({'success': False, 'message': f'Configuration Error: {str(ve)}'}), 500
         except Exception as e:
-            logging.error(f"Error generating quiz: {e}")
+            logging.error("Error generating quiz: %s", e)
             return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
         
         if not questions or len(questions) == 0:
@@ -3716,7 +4551,7 @@ def instructor_generate_ai_quiz(course_id):
                 
                 conn.commit()
                 
-                logging.info(f"AI Quiz '{topic}' created with {len(questions)} questions (ID: {assignment_id})")
+                logging.info("AI Quiz '%s' created with %s questions (ID: %s)", topic, len(questions), assignment_id)
                 
                 conn.close()
                 
@@ -3730,14 +4565,14 @@ def instructor_generate_ai_quiz(course_id):
             except Exception as e:
                 conn.rollback()
                 conn.close()
-                logging.error(f"Error saving AI quiz: {e}")
+                logging.error("Error saving AI quiz: %s", e)
                 return jsonify({'success': False, 'message': f'Error saving quiz: {str(e)}'}), 500
         
     except ValueError as ve:
-        logging.error(f"Gemini API Key Error: {ve}")
+        logging.error("Gemini API Key Error: %s", ve)
         return jsonify({'success': False, 'message': 'Gemini API not configured. Please set GEMINI_API_KEY.'}), 500
     except Exception as e:
-        logging.error(f"Error generating AI quiz: {e}")
+        logging.error("Error generating AI quiz: %s", e)
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
 @app.route('/instructor/courses/<int:course_id>/quizzes')
@@ -3748,10 +4583,7 @@ def instructor_course_quizzes(course_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -3780,10 +4612,7 @@ def instructor_create_quiz(course_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -3883,7 +4712,7 @@ def instructor_create_quiz(course_id):
                 
                 if questions_saved > 0:
                     flash(f'✅ MCQ Quiz "{title}" created successfully with {questions_saved} questions and submitted to all enrolled students!', 'success')
-                    logging.info(f"Quiz '{title}' created with {questions_saved} questions for course {course_id}")
+                    logging.info("Quiz '%s' created with %s questions for course %s", title, questions_saved, course_id)
                 else:
                     flash('⚠️ Quiz created but no questions were saved. Please add questions and try again.', 'warning')
                 
@@ -4144,10 +4973,7 @@ def instructor_course_assignments(course_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4180,10 +5006,7 @@ def instructor_create_assignment(course_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4242,8 +5065,6 @@ def instructor_create_assignment(course_id):
                                 f"{assignment_id}_{uuid.uuid4().hex}_{filename}"
                             )
                             
-                            # Create directory if it doesn't exist
-                            os.makedirs(os.path.dirname(file_path), exist_ok=True)
                             file.save(file_path)
                             
                             # Get file info
@@ -4397,9 +5218,9 @@ def instructor_grade_submission(course_id, assignment_id, submission_id):
                 UPDATE assignment_submissions 
                 SET grade = ?, 
                     instructor_feedback = ?,
-                    graded_at = ?
+                    graded_at = CURRENT_TIMESTAMP
                 WHERE id = ?
-            ''', (grade_value, feedback, datetime.now(), submission_id))
+            ''', (grade_value, feedback, submission_id))
             
             conn.commit()
             conn.close()
@@ -4423,10 +5244,7 @@ def instructor_course_discussions(course_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4470,10 +5288,7 @@ def instructor_create_forum(course_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4513,10 +5328,7 @@ def instructor_create_topic(course_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4678,10 +5490,7 @@ def instructor_edit_forum(course_id, forum_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4712,10 +5521,7 @@ def instructor_update_forum(course_id, forum_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4757,10 +5563,7 @@ def instructor_delete_forum(course_id, forum_id):
         conn = get_db_connection()
         
         # Verify course belongs to instructor
-        course = conn.execute('''
-            SELECT * FROM courses 
-            WHERE id = ? AND instructor_id = ? AND is_active = 1
-        ''', (course_id, current_user.id)).fetchone()
+        course = owned_course(course_id, current_user.id)
         
         if not course:
             flash('Course not found or access denied.', 'error')
@@ -4938,10 +5741,7 @@ def student_submit_assignment(course_id, assignment_id):
         conn = get_db_connection()
         
         # Verify enrollment
-        enrollment = conn.execute('''
-            SELECT * FROM enrollments 
-            WHERE student_id = ? AND course_id = ? AND status = 'approved'
-        ''', (current_user.id, course_id)).fetchone()
+        enrollment = conn.execute(APPROVED_ENROLLMENT_SQL, (current_user.id, course_id)).fetchone()
         
         if not enrollment:
             flash('Access denied.', 'error')
@@ -4985,7 +5785,6 @@ def student_submit_assignment(course_id, assignment_id):
                         'submissions',
                         f"{assignment_id}_{current_user.id}_{uuid.uuid4().hex}_{filename}"
                     )
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
                     file.save(file_path)
             
             try:
@@ -4995,12 +5794,12 @@ def student_submit_assignment(course_id, assignment_id):
                         UPDATE assignment_submissions 
                         SET submission_text = ?, 
                             file_path = ?, 
-                            submitted_at = ?,
+                            submitted_at = CURRENT_TIMESTAMP,
                             grade = NULL,
                             ai_feedback = NULL,
                             instructor_feedback = NULL
                         WHERE id = ?
-                    ''', (submission_text, file_path, datetime.now(), existing_submission['id']))
+                    ''', (submission_text, file_path, existing_submission['id']))
                     flash('Assignment resubmitted successfully!', 'success')
                 else:
                     # Create new submission
@@ -5329,7 +6128,7 @@ def student_create_topic(course_id, forum_id):
 def instructor_screenshot(filename):
     """Serve instructor screenshot files (admin only)"""
     screenshots_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'instructor_screenshots')
-    return send_from_directory(screenshots_dir, filename)
+    return send_upload(screenshots_dir, filename)
 
 @app.route('/student/courses/<int:course_id>/resource/<int:resource_id>')
 @login_required
@@ -5367,7 +6166,7 @@ def student_download_resource(course_id, resource_id):
         
         # Serve the file securely
         try:
-            return send_from_directory(
+            return send_upload(
                 os.path.dirname(resource['file_path']),
                 os.path.basename(resource['file_path']),
                 as_attachment=False
@@ -5645,11 +6444,13 @@ def student_browse_courses():
         available_courses = conn.execute('''
             SELECT c.*, u.full_name as instructor_name,
                    COUNT(e.id) as enrollment_count
-            FROM courses c
+            FROM v_active_courses c
             JOIN users u ON c.instructor_id = u.id
             LEFT JOIN enrollments e ON c.id = e.course_id AND e.status = 'approved'
-            LEFT JOIN enrollments student_e ON c.id = student_e.course_id AND student_e.student_id = ?
-            WHERE c.is_active = 1 AND student_e.id IS NULL
+            WHERE NOT EXISTS (
+                  SELECT 1 FROM enrollments student_e
+                  WHERE student_e.course_id = c.id AND student_e.student_id = ?
+              )
             GROUP BY c.id
             ORDER BY c.created_at DESC
         ''', (current_user.id,)).fetchall()
@@ -5692,9 +6493,9 @@ def student_enroll():
         # Find the course
         course = conn.execute('''
             SELECT c.*, u.full_name as instructor_name
-            FROM courses c
+            FROM v_active_courses c
             JOIN users u ON c.instructor_id = u.id
-            WHERE c.course_code = ? AND c.is_active = 1
+            WHERE c.course_code = ?
         ''', (course_code,)).fetchone()
         
         if not course:
@@ -5703,7 +6504,7 @@ def student_enroll():
             return redirect(url_for('student_browse_courses'))
         
         # Check if enrollment key is correct
-        if not course['enrollment_key_hash'] or not check_password_hash(course['enrollment_key_hash'], enrollment_key):
+        if not course['enrollment_key_hash'] or not verify_enrollment_key(enrollment_key, course['enrollment_key_hash']):
             flash('Invalid enrollment key. Please check with your instructor.', 'error')
             conn.close()
             return redirect(url_for('student_browse_courses'))
@@ -5748,6 +6549,7 @@ def student_enroll():
                   course['id']))
             
             conn.commit()
+            invalidate_instructor_dashboard(course['instructor_id'])
             conn.close()
             
             flash(f'Enrollment request submitted for "{course["title"]}"! Your instructor ({course["instructor_name"]}) will review and approve your request.', 'success')
@@ -5817,10 +6619,7 @@ def course_discussion_forum(course_id):
             return redirect(url_for('dashboard'))
         
         # Check access
-        access = conn.execute('''
-            SELECT 1 FROM enrollments 
-            WHERE student_id = ? AND course_id = ? AND status = 'approved'
-        ''', (current_user.id, course_id)).fetchone()
+        access = conn.execute(APPROVED_ENROLLMENT_SQL, (current_user.id, course_id)).fetchone()
         
         is_instructor = (current_user.id == course['instructor_id'])
         
@@ -5944,6 +6743,7 @@ def api_generate_mcq_options():
         return jsonify({'error': 'Question text is required'}), 400
     
     try:
+        import gemini_ai
         options = gemini_ai.generate_mcq_options(question_text, context)
         
         if options:
@@ -6128,10 +6928,7 @@ def get_course_messages(course_id):
             conn = get_db_connection()
             
             # Verify access
-            access = conn.execute('''
-                SELECT 1 FROM enrollments 
-                WHERE student_id = ? AND course_id = ? AND status = 'approved'
-            ''', (current_user.id, course_id)).fetchone()
+            access = conn.execute(APPROVED_ENROLLMENT_SQL, (current_user.id, course_id)).fetchone()
             
             is_instructor = conn.execute('''
                 SELECT 1 FROM courses WHERE id = ? AND instructor_id = ?
@@ -6153,7 +6950,7 @@ def get_course_messages(course_id):
         
         return jsonify({
             'success': True,
-            'messages': [dict(m) for m in messages] if messages else []
+            'messages': messages
         })
     except Exception as e:
         print(f"Error fetching course messages: {e}")
@@ -6413,7 +7210,7 @@ def upload_chat_file():
         })
         
     except Exception as e:
-        logging.error(f"File upload error: {e}")
+        logging.error("File upload error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/download-chat-file/<filename>')
@@ -6423,7 +7220,7 @@ def download_chat_file(filename):
     try:
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'chat_files', filename)
         if os.path.exists(filepath):
-            return send_from_directory(os.path.dirname(filepath), filename, as_attachment=True)
+            return send_upload(os.path.dirname(filepath), filename, as_attachment=True)
         return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -6432,7 +7229,7 @@ def download_chat_file(filename):
 @login_required
 def serve_chat_file(filename):
     """Serve uploaded chat files"""
-    return send_from_directory(os.path.join(app.config['UPLOAD_FOLDER'], 'chat_files'), filename)
+    return send_upload(os.path.join(app.config['UPLOAD_FOLDER'], 'chat_files'), filename)
 
 # MESSAGING HUB ROUTE
 @app.route('/forum')
@@ -6533,7 +7330,7 @@ def get_direct_messages(user_id):
             conn.commit()
             conn.close()
         
-        return jsonify({'messages': [dict(m) for m in messages]})
+        return jsonify({'messages': messages})
     except Exception as e:
         print(f"Error loading direct messages: {e}")
         return jsonify({'messages': [], 'error': str(e)}), 200
@@ -6640,7 +7437,7 @@ def get_contacts():
                 ORDER BY u.full_name''', (current_user.id,)).fetchall()
             conn.close()
         
-        return jsonify({'contacts': [dict(c) for c in contacts]})
+        return jsonify({'contacts': contacts})
     except Exception as e:
         return jsonify({'contacts': [], 'error': str(e)}), 200
 
@@ -6693,7 +7490,7 @@ def edit_chat_message(message_id):
         
         return jsonify({'success': True, 'message': message})
     except Exception as e:
-        logging.error(f"Error editing message: {e}")
+        logging.error("Error editing message: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/chat-messages/<int:message_id>', methods=['DELETE'])
@@ -6716,7 +7513,7 @@ def delete_chat_message(message_id):
         
         return jsonify({'success': True})
     except Exception as e:
-        logging.error(f"Error deleting message: {e}")
+        logging.error("Error deleting message: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @socketio.on('user_typing')
@@ -6817,6 +7614,7 @@ def generate_ai_notes(course_id):
         if not topic:
             return jsonify({'success': False, 'error': 'Topic is required'}), 400
         
+        import gemini_ai
         result = gemini_ai.generate_ai_notes(topic, current_user.full_name, additional_context)
         
         if result.get('success'):
@@ -6833,7 +7631,7 @@ def generate_ai_notes(course_id):
             return jsonify({'success': False, 'error': result.get('error', 'Failed to generate notes')}), 500
     
     except Exception as e:
-        logging.error(f"Error generating AI notes: {e}")
+        logging.error("Error generating AI notes: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -6858,7 +7656,7 @@ def edit_ai_notes(course_id, note_id):
         return jsonify({'success': True})
     
     except Exception as e:
-        logging.error(f"Error editing AI notes: {e}")
+        logging.error("Error editing AI notes: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -6880,7 +7678,6 @@ def create_notes_pdf(course_id, note_id):
             return jsonify({'success': False, 'error': 'Note not found'}), 404
         
         notes_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'ai_notes')
-        os.makedirs(notes_dir, exist_ok=True)
         
         filename = f'notes_{note_id}_{int(datetime.now().timestamp())}.pdf'
         pdf_path = os.path.join(notes_dir, filename)
@@ -6901,7 +7698,7 @@ def create_notes_pdf(course_id, note_id):
             return jsonify({'success': False, 'error': 'Failed to create PDF'}), 500
     
     except Exception as e:
-        logging.error(f"Error creating PDF: {e}")
+        logging.error("Error creating PDF: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -6929,11 +7726,14 @@ def send_notes_to_students(course_id, note_id):
             students = conn.execute('''SELECT student_id FROM enrollments WHERE course_id = ? 
                 AND status = 'approved' ''', (course_id,)).fetchall()
             
-            for student in students:
-                conn.execute('''INSERT INTO notifications (user_id, title, message, type, related_id)
-                    VALUES (?, ?, ?, ?, ?)''',
-                    (student['student_id'], 'New AI Notes Available', 
-                    f'New AI notes available for {note["topic"]}', 'ai_notes', note_id))
+            send_notifications_bulk(
+                [student['student_id'] for student in students],
+                'New AI Notes Available',
+                f'New AI notes available for {note["topic"]}',
+                'ai_notes',
+                note_id,
+                conn=conn
+            )
             
             conn.commit()
             conn.close()
@@ -6941,7 +7741,7 @@ def send_notes_to_students(course_id, note_id):
         return jsonify({'success': True})
     
     except Exception as e:
-        logging.error(f"Error sending notes: {e}")
+        logging.error("Error sending notes: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -6966,7 +7766,7 @@ def delete_ai_notes(course_id, note_id):
                     try:
                         os.remove(pdf_file)
                     except Exception as e:
-                        logging.warning(f"Could not delete PDF file: {e}")
+                        logging.warning("Could not delete PDF file: %s", e)
             
             conn.execute('DELETE FROM ai_notes WHERE id = ?', (note_id,))
             conn.commit()
@@ -6975,7 +7775,7 @@ def delete_ai_notes(course_id, note_id):
         return jsonify({'success': True})
     
     except Exception as e:
-        logging.error(f"Error deleting AI notes: {e}")
+        logging.error("Error deleting AI notes: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -7001,6 +7801,7 @@ def student_create_notes(course_id):
         if not topic:
             return jsonify({'success': False, 'error': 'Topic is required'}), 400
         
+        import gemini_ai
         result = gemini_ai.generate_ai_notes(topic, '', additional_context)
         
         if result.get('success'):
@@ -7015,7 +7816,6 @@ def student_create_notes(course_id):
                 conn.close()
             
             notes_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'ai_notes')
-            os.makedirs(notes_dir, exist_ok=True)
             
             filename = f'notes_{note_id}_{int(datetime.now().timestamp())}.pdf'
             pdf_path = os.path.join(notes_dir, filename)
@@ -7038,20 +7838,23 @@ def student_create_notes(course_id):
             return jsonify({'success': False, 'error': result.get('error', 'Failed to generate notes')}), 500
     
     except Exception as e:
-        logging.error(f"Error creating student notes: {e}")
+        logging.error("Error creating student notes: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/uploads/<path:filename>')
 def serve_upload(filename):
     """Serve uploaded files"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_upload(app.config['UPLOAD_FOLDER'], filename)
 
 
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
     # Initialize database before starting Flask
     db_ready = init_db()
     if not db_ready:
         print("⚠️  Database initialization incomplete, but continuing with Flask startup...")
     
+    warm_db_pool()
+    start_background_tasks()
     socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False, log_output=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
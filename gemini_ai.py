@@ -5,12 +5,17 @@
 # - Sometimes the google genai SDK has occasional type errors. You might need to run to validate, at time.  
 # The SDK was recently renamed from google-generativeai to google-genai. This file reflects the new name and the new APIs.
 
+import hashlib
 import json
 import logging
 import os
+import threading
+import time
 from google import genai
 from google.genai import types
 
+from utils import ai_cache
+
 # This API key is from Gemini Developer API Key, not vertex AI API Key
 # Lazy client initialization to avoid crashing imports when env var is missing
 _client = None
@@ -26,6 +31,73 @@ def _get_client():
 
     return _client
 
+# Explicit context caching for per-video prompts. The video information block is sent
+# first so the transcript and notes requests for the same video share it as a prefix;
+# once it is large enough to be cached, Gemini keeps it server-side and later calls
+# only send the task instructions. Gemini refuses caches below a minimum token count,
+# so smaller blocks (most videos) are sent inline as before.
+GEMINI_CACHE_MIN_TOKENS = 2048
+GEMINI_CACHE_TTL = int(os.environ.get("GEMINI_CACHE_TTL", 600))
+_video_caches = {}  # sha256(model + video information) -> (cache name, expires at)
+_video_caches_lock = threading.Lock()
+
+def _video_context_cache(model, video_context):
+    """Return the name of a cached-content entry for video_context, or None if it is too small to cache"""
+    # Rough local estimate (~4 characters per token) so small blocks cost no extra round trip
+    if len(video_context) // 4 < GEMINI_CACHE_MIN_TOKENS:
+        return None
+    
+    # The key covers every field in the block, so editing a video naturally misses the old entry
+    key = hashlib.sha256(f"{model}\n{video_context}".encode()).hexdigest()
+    now = time.monotonic()
+    with _video_caches_lock:
+        entry = _video_caches.get(key)
+    if entry and entry[1] > now:
+        return entry[0]
+    
+    try:
+        cache = _get_client().caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=[video_context],
+                ttl=f"{GEMINI_CACHE_TTL}s"
+            )
+        )
+    except Exception as e:
+        logging.warning(f"Could not create Gemini context cache: {e}")
+        return None
+    
+    with _video_caches_lock:
+        # Expire locally a little early so we never reference a cache Gemini has dropped
+        _video_caches[key] = (cache.name, now + GEMINI_CACHE_TTL - 30)
+    return cache.name
+
+def _video_context(video_title, video_description="", video_duration="", video_url=""):
+    """The video information block shared by the transcript and notes prompts"""
+    lines = ["VIDEO INFORMATION:", f"- Title: {video_title}"]
+    if video_description:
+        lines.append(f"- Description: {video_description}")
+    if video_duration:
+        lines.append(f"- Duration: {video_duration}")
+    if video_url:
+        lines.append(f"- URL: {video_url}")
+    return "\n".join(lines) + "\n"
+
+def _generate_with_video_context(model, video_context, task_prompt):
+    """generate_content with the video information block served from the context cache when possible"""
+    client = _get_client()
+    cache_name = _video_context_cache(model, video_context)
+    if cache_name:
+        return client.models.generate_content(
+            model=model,
+            contents=task_prompt,
+            config=types.GenerateContentConfig(cached_content=cache_name)
+        )
+    return client.models.generate_content(
+        model=model,
+        contents=video_context + task_prompt
+    )
+
 
 def grade_assignment(assignment_text, rubric="", max_points=100):
     """Grade an assignment using Gemini AI with detailed feedback"""
@@ -282,18 +354,11 @@ def generate_video_notes(video_title, video_description="", video_duration="", v
         str: Comprehensive, accurately formatted study notes for the video
     """
     try:
-        duration_text = f"Video Duration: {video_duration}" if video_duration else ""
-        description_text = f"Video Description: {video_description}" if video_description else ""
+        video_context = _video_context(video_title, video_description, video_duration, video_url)
         
         prompt = f"""
         You are a world-class educational content specialist and pedagogical expert. Your task is to create exceptionally high-quality, 
-        well-structured study notes that are accurate, comprehensive, and easy to understand.
-        
-        VIDEO INFORMATION:
-        - Title: {video_title}
-        {f"- Description: {description_text}" if description_text else ""}
-        {f"- Duration: {duration_text}" if duration_text else ""}
-        {f"- URL: {video_url}" if video_url else ""}
+        well-structured study notes for the video described above that are accurate, comprehensive, and easy to understand.
         
         CREATE COMPREHENSIVE STUDY NOTES WITH THE FOLLOWING STRUCTURE:
         
@@ -381,14 +446,17 @@ def generate_video_notes(video_title, video_description="", video_duration="", v
         ✓ Include citations or references where appropriate
         """
         
-        client = _get_client()
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=prompt
-        )
+        # Same video information and prompt means the same notes; reuse them from disk
+        cache_key = ai_cache.make_key("video_notes", "gemini-2.5-pro", video_context, prompt)
+        cached = ai_cache.get(cache_key)
+        if cached:
+            return cached
+        
+        response = _generate_with_video_context("gemini-2.5-pro", video_context, prompt)
         
         if response.text and len(response.text) > 100:
             logging.info(f"Successfully generated comprehensive notes for video: {video_title[:50]}... ({len(response.text)} characters)")
+            ai_cache.set(cache_key, response.text)
             return response.text
         else:
             logging.warning("AI response too short or empty for notes generation")
@@ -414,20 +482,13 @@ def generate_video_transcript(video_title, video_description="", video_duration=
         str: A comprehensive transcript/notes for the video
     """
     try:
-        duration_text = f"Video Duration: {video_duration}" if video_duration else ""
-        description_text = f"\nVideo Description:\n{video_description}" if video_description else ""
-        
         # If video URL is provided, use Gemini's video understanding
         if video_url and ('youtube.com' in video_url or 'youtu.be' in video_url):
+            video_context = _video_context(video_title, video_description, video_duration, video_url)
             prompt = f"""
-            You are an expert educational content creator. Analyze this YouTube educational video and generate a comprehensive, 
+            You are an expert educational content creator. Analyze the YouTube educational video above and generate a comprehensive, 
             detailed transcript and lecture notes.
             
-            Video Title: {video_title}
-            {description_text}
-            {duration_text}
-            Video URL: {video_url}
-            
             Please watch/analyze the video and create a detailed educational transcript that includes:
             
             1. INTRODUCTION
@@ -458,13 +519,10 @@ def generate_video_transcript(video_title, video_description="", video_duration=
             """
         else:
             # Fallback to title and description if no valid YouTube URL
+            video_context = _video_context(video_title, video_description, video_duration)
             prompt = f"""
             You are an expert educational content creator. Generate a comprehensive, detailed transcript and lecture notes 
-            for an educational video based on the following information:
-            
-            Video Title: {video_title}
-            {description_text}
-            {duration_text}
+            for an educational video based on the information above.
             
             Please create a detailed educational transcript that includes:
             
@@ -491,14 +549,16 @@ def generate_video_transcript(video_title, video_description="", video_duration=
             The transcript should be 800-1500 words to provide substantial educational value.
             """
         
-        client = _get_client()
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=prompt
-        )
+        cache_key = ai_cache.make_key("video_transcript", "gemini-2.5-pro", video_context, prompt)
+        cached = ai_cache.get(cache_key)
+        if cached:
+            return cached
+        
+        response = _generate_with_video_context("gemini-2.5-pro", video_context, prompt)
         
         if response.text:
             logging.info(f"Successfully generated transcript for video: {video_title[:50]}...")
+            ai_cache.set(cache_key, response.text)
             return response.text
         else:
             logging.warning("No AI response received for transcript generation")
@@ -582,6 +642,11 @@ def generate_student_notes(topic, course_title="", course_code=""):
         - Make it suitable for printing and long-term studying
         """
         
+        cache_key = ai_cache.make_key("student_notes", "gemini-2.5-pro", prompt)
+        cached = ai_cache.get(cache_key)
+        if cached:
+            return cached
+        
         client = _get_client()
         response = client.models.generate_content(
             model="gemini-2.5-pro",
@@ -590,6 +655,7 @@ def generate_student_notes(topic, course_title="", course_code=""):
         
         if response.text:
             logging.info(f"Successfully generated student notes from input")
+            ai_cache.set(cache_key, response.text)
             return response.text
         else:
             logging.warning("No AI response for student notes generation")
@@ -763,19 +829,17 @@ def generate_ai_notes(topic, teacher_name="", additional_context=""):
             'error': str(e)
         }
 
-def answer_student_question(question):
+def analyze_visual_need(question):
     """
-    Answer student questions instantly using Gemini AI with visual generation capability.
+    Decide whether a visual would help explain a student question.
     
     Args:
         question (str): The student's question
     
     Returns:
-        dict: Contains 'answer' text and optional 'needs_visual' flag with 'visual_prompt'
+        tuple: (needs_visual, visual_prompt); visual_prompt is None when no visual is needed
     """
-    try:
-        # First, determine if this question would benefit from a visual
-        analysis_prompt = f"""Analyze this student question and determine if a visual diagram, chart, or illustration would significantly help explain the concept:
+    analysis_prompt = f"""Analyze this student question and determine if a visual diagram, chart, or illustration would significantly help explain the concept:
 
 QUESTION: {question}
 
@@ -785,30 +849,27 @@ Respond with JSON:
     "visual_type": "diagram/chart/illustration/none",
     "visual_description": "Brief description of what visual to create (if needed)"
 }}"""
-        
-        client = _get_client()
-        analysis_response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=analysis_prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+    
+    client = _get_client()
+    analysis_response = client.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=analysis_prompt,
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json"
         )
-        
-        needs_visual = False
-        visual_prompt = None
-        
-        if analysis_response and analysis_response.text:
-            try:
-                analysis = json.loads(analysis_response.text)
-                needs_visual = analysis.get('needs_visual', False)
-                if needs_visual:
-                    visual_prompt = f"Educational {analysis.get('visual_type', 'diagram')} showing {analysis.get('visual_description', question)}, clean design, clear labels, professional style"
-            except:
-                pass
-        
-        # Now generate the text answer
-        prompt = f"""You are an expert AI Study Assistant helping students with their academic questions.
+    )
+    
+    if analysis_response and analysis_response.text:
+        try:
+            analysis = json.loads(analysis_response.text)
+            if analysis.get('needs_visual', False):
+                return True, f"Educational {analysis.get('visual_type', 'diagram')} showing {analysis.get('visual_description', question)}, clean design, clear labels, professional style"
+        except:
+            pass
+    return False, None
+
+def _student_answer_prompt(question, needs_visual=False):
+    return f"""You are an expert AI Study Assistant helping students with their academic questions.
 A student has asked you the following question:
 
 QUESTION: {question}
@@ -824,10 +885,27 @@ Please provide a clear, comprehensive, and educational answer that:
 Keep your answer concise but thorough (200-400 words).
 
 ANSWER:"""
+
+def answer_student_question(question):
+    """
+    Answer student questions instantly using Gemini AI with visual generation capability.
+    
+    Args:
+        question (str): The student's question
+    
+    Returns:
+        dict: Contains 'answer' text, 'needs_visual' flag and 'visual_prompt',
+              or None if no answer could be generated
+    """
+    try:
+        # First, determine if this question would benefit from a visual
+        needs_visual, visual_prompt = analyze_visual_need(question)
         
+        # Now generate the text answer
+        client = _get_client()
         response = client.models.generate_content(
             model="gemini-2.5-flash",
-            contents=prompt
+            contents=_student_answer_prompt(question, needs_visual)
         )
         
         if response and response.text:
@@ -839,14 +917,54 @@ ANSWER:"""
             }
         else:
             logging.warning("No AI response for student question")
-            return {
-                'answer': "I'm having trouble generating an answer right now. Please try again in a moment.",
-                'needs_visual': False
-            }
+            return None
             
     except Exception as e:
         logging.error(f"Error answering student question: {e}")
-        return {
-            'answer': "I encountered an error while processing your question. Please try again.",
-            'needs_visual': False
-        }
\ No newline at end of file
+        return None
+
+def stream_student_answer(question):
+    """
+    Stream the answer to a student question as Gemini generates it.
+    The visual analysis is left to the caller (see analyze_visual_need) so it can run
+    alongside the stream instead of delaying the first words of the answer.
+    
+    Args:
+        question (str): The student's question
+    
+    Yields:
+        str: Successive pieces of the answer text
+    """
+    client = _get_client()
+    for chunk in client.models.generate_content_stream(
+        model="gemini-2.5-flash",
+        contents=_student_answer_prompt(question)
+    ):
+        if chunk.text:
+            yield chunk.text
+
+def generate_visual(visual_prompt):
+    """
+    Generate an educational illustration with Imagen.
+    
+    Args:
+        visual_prompt (str): Description of the visual to create
+    
+    Returns:
+        bytes: PNG image data, or None if no image was generated
+    """
+    client = _get_client()
+    image_response = client.models.generate_images(
+        model='imagen-3.0-generate-001',
+        prompt=visual_prompt,
+        config=types.GenerateImagesConfig(
+            number_of_images=1,
+            aspect_ratio='1:1',
+            safety_filter_level='block_some',
+            person_generation='allow_adult'
+        )
+    )
+    
+    if image_response and image_response.generated_images:
+        return image_response.generated_images[0].image.image_bytes
+    return None
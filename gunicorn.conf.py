@@ -0,0 +1,37 @@
+# Gunicorn configuration for LearnNest
+# Run with: gunicorn -c gunicorn.conf.py app:app
+import os
+import multiprocessing
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Flask-SocketIO needs a cooperative worker so one process can hold many
+# websocket / long-polling connections at once
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'eventlet')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Socket.IO clients must stick to the worker that owns their session, so more
+# than one worker requires a sticky load balancer in front of gunicorn.
+# Set WEB_CONCURRENCY=auto to size the pool to 2 * cores + 1.
+_concurrency = os.environ.get('WEB_CONCURRENCY', '1')
+workers = multiprocessing.cpu_count() * 2 + 1 if _concurrency == 'auto' else int(_concurrency)
+
+# Each worker imports the app itself, after eventlet/gevent has patched the
+# stdlib; preloading in the master would create locks and sockets unpatched
+preload_app = False
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+accesslog = '-'
+errorlog = '-'
+
+# Make the app pick the matching Socket.IO async mode when it is imported
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', worker_class if worker_class in ('eventlet', 'gevent') else 'threading')
+
+
+def post_worker_init(worker):
+    """Initialize the database before the worker accepts requests (init_db is idempotent)"""
+    from app import init_db, warm_db_pool, start_background_tasks
+    if not init_db():
+        worker.log.warning("Database initialization incomplete, worker will start anyway")
+    warm_db_pool()
+    start_background_tasks()
@@ -1,3 +1,3 @@
 #!/bin/bash
 cd /home/runner/weather-app-abdulwaheed
-python3 app.py
+exec gunicorn -c gunicorn.conf.py app:app
@@ -0,0 +1,140 @@
+"""
+Content-addressed disk cache for generated AI content
+Identical Gemini requests (same video, same topic, same question) are answered from
+disk instead of calling the API again; entries are shared by every worker process
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib json module
+    orjson = None
+
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    def _dumps(value):
+        return json.dumps(value).encode('utf-8')
+    _loads = json.loads
+
+_cache_dir = None
+_max_bytes = 200 * 1024 * 1024
+_writes_since_evict = 0
+_lock = threading.Lock()
+# Shard directories known to exist, so set() skips the mkdir after the first write
+_shard_dirs = set()
+
+# Walk the cache directory for eviction only every this many writes
+EVICT_EVERY = 64
+
+
+def configure(cache_dir, max_bytes=None):
+    """Point the cache at a directory; until this is called get() misses and set() does nothing"""
+    global _cache_dir, _max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+    _cache_dir = cache_dir
+    with _lock:
+        _shard_dirs.clear()
+    if max_bytes:
+        _max_bytes = max_bytes
+
+
+def make_key(*parts):
+    """Hash the inputs that determine a result into a cache key"""
+    return hashlib.blake2b('|'.join(str(p) for p in parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _path(key):
+    return os.path.join(_cache_dir, key[:2], key + '.json')
+
+
+def get(key):
+    """Return the cached value for key, or None on a miss"""
+    if _cache_dir is None:
+        return None
+    path = _path(key)
+    try:
+        with open(path, 'rb') as f:
+            value = _loads(f.read())
+    except (OSError, ValueError):
+        return None
+    # Bump the mtime so eviction drops the least recently used entries first
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+
+def set(key, value):
+    """Store a JSON-serializable value under key"""
+    global _writes_since_evict
+    if _cache_dir is None:
+        return
+    path = _path(key)
+    shard_dir = os.path.dirname(path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if shard_dir not in _shard_dirs:
+            os.makedirs(shard_dir, exist_ok=True)
+            with _lock:
+                _shard_dirs.add(shard_dir)
+        with open(tmp_path, 'wb') as f:
+            f.write(_dumps(value))
+        # Readers in other workers only ever see a complete file
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logging.warning("Could not write AI cache entry %s: %s", key, e)
+        # The directory may have been removed under us; recreate it next time
+        _shard_dirs.discard(shard_dir)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+
+    with _lock:
+        _writes_since_evict += 1
+        run_evict = _writes_since_evict >= EVICT_EVERY
+        if run_evict:
+            _writes_since_evict = 0
+    if run_evict:
+        evict()
+
+
+def evict():
+    """Delete least recently used entries until the cache is back under 90% of its size cap"""
+    if _cache_dir is None:
+        return
+    entries = []
+    total = 0
+    for shard in os.scandir(_cache_dir):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+    if total <= _max_bytes:
+        return
+
+    target = _max_bytes * 0.9
+    entries.sort()
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
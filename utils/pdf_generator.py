@@ -15,6 +15,20 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from datetime import datetime
 import os
+import threading
+
+# Output directories already created by this process; makedirs is skipped for them
+_ensured_dirs = set()
+_ensured_dirs_lock = threading.Lock()
+
+
+def ensure_dir(path):
+    """Create a directory (and parents) once per process"""
+    if path in _ensured_dirs:
+        return
+    os.makedirs(path, exist_ok=True)
+    with _ensured_dirs_lock:
+        _ensured_dirs.add(path)
 
 # Register Unicode fonts for multi-language support
 try:
@@ -183,7 +197,7 @@ def generate_transcript_pdf(transcript_text, video_title, course_name, student_n
     """
     try:
         # Ensure directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        ensure_dir(os.path.dirname(output_path))
         
         # Create the PDF document with custom canvas and enhanced margins
         doc = SimpleDocTemplate(
@@ -443,7 +457,7 @@ def generate_notes_pdf(notes_content, topic, teacher_name, output_path, add_wate
     """
     try:
         # Ensure directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        ensure_dir(os.path.dirname(output_path))
         
         # Create the PDF document with custom canvas
         doc = SimpleDocTemplate(